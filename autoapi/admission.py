@@ -0,0 +1,148 @@
+"""
+Oliver 2024
+
+admission control of the thread engine, accepted connections wait in a
+bounded queue for one of a fixed number of handler threads, when the queue
+is full a connection is answered with a 503 right away instead of adding
+a thread, so an overloaded server sheds load rather than thrashing
+"""
+
+import queue
+import socket
+import threading
+import time
+import traceback
+from typing import Callable, Dict
+
+from . import util
+
+DEFAULT_THREADS = 64
+DEFAULT_QUEUE_SIZE = 128
+# seconds a rejected client is told to wait before it retries
+RETRY_AFTER = 1
+REJECTION = util.create_http_response(headers={"Connection": "close", "Retry-After": str(RETRY_AFTER)}, code=503)
+
+
+def reject(client: socket.socket) -> None:
+    """
+    answers a connection with a 503 without blocking and closes it,
+    what the client already sent is read first, closing with unread
+    data would reset the connection before the client read the 503
+    :param client: client socket
+    :return: None
+    """
+    client.setblocking(False)
+    try:
+        client.send(REJECTION)
+        client.shutdown(socket.SHUT_WR)
+        client.recv(util.MAX_HEADER_SIZE)
+    except OSError:
+        pass
+    finally:
+        client.close()
+
+
+class HandlerPool:
+    def __init__(self,
+                 handle: Callable[[socket.socket, tuple, float], None],
+                 threads: int = DEFAULT_THREADS,
+                 queue_size: int = DEFAULT_QUEUE_SIZE,
+                 name: str = "autoapi-handler"):
+        """
+        fixed number of threads handling the connections of a bounded queue
+        :param handle: handler called with the client socket, its address and the seconds it waited in the queue
+        :param threads: number of handler threads
+        :param queue_size: number of accepted connections that can wait for a thread
+        :param name: name of the handler threads
+        """
+        if threads < 1 or queue_size < 1:
+            raise ValueError("threads and queue_size must be at least 1")
+        self._handle = handle
+        self.threads = threads
+        self.queue_size = queue_size
+        self._queue = queue.Queue(maxsize=queue_size)
+        # only the accepting thread counts these
+        self.accepted = 0
+        self.rejected = 0
+        self._busy = 0
+        self._lock = threading.Lock()
+        # daemons, so an interrupted server does not wait for its connections to exit
+        self._threads = [threading.Thread(target=self._run, name=name, daemon=True) for _ in range(threads)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, client: socket.socket, addr: tuple) -> bool:
+        """
+        queues a connection for the next free thread
+        :param client: client socket
+        :param addr: client address
+        :return: whether it was queued, False when the queue is full
+        """
+        try:
+            self._queue.put_nowait((client, addr, time.perf_counter()))
+        except queue.Full:
+            self.rejected += 1
+            return False
+        self.accepted += 1
+        return True
+
+    def waiting(self) -> int:
+        """
+        :return: number of connections waiting for a thread
+        """
+        return self._queue.qsize()
+
+    def saturated(self) -> bool:
+        """
+        :return: whether every thread is busy while connections wait for one
+        """
+        return self._busy >= self.threads and not self._queue.empty()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            client, addr, queued = item
+            with self._lock:
+                self._busy += 1
+            try:
+                self._handle(client, addr, time.perf_counter() - queued)
+            except Exception:
+                traceback.print_exc()  # the thread keeps serving
+            finally:
+                with self._lock:
+                    self._busy -= 1
+
+    def stats(self) -> Dict[str, int]:
+        """
+        :return: number of threads and busy threads, queue size and depth,
+        and connections accepted and rejected
+        """
+        return {
+            "threads": self.threads,
+            "busy": self._busy,
+            "queue_size": self.queue_size,
+            "waiting": self.waiting(),
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+        }
+
+    def close(self, wait: bool = True) -> None:
+        """
+        serves the queued connections to the end and stops the threads
+        :param wait: flag of whether to wait for them, else the threads
+        that are busy or find the queue full end with the process
+        :return: None
+        """
+        for _ in self._threads:
+            if wait:
+                self._queue.put(None)
+                continue
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break
+        if wait:
+            for thread in self._threads:
+                thread.join()
@@ -0,0 +1,225 @@
+"""
+Oliver 2024
+
+asyncio server engine, multiplexes every client connection
+on one event loop and hands the database work for each
+request to a bounded thread pool
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Iterator
+
+from . import util
+
+
+async def iter_body(reader: asyncio.StreamReader, size: int, timeout: float) -> AsyncIterator[bytes]:
+    """
+    reads the next size bytes of a connection piece by piece
+    :param reader: stream reader of the client connection
+    :param size: number of bytes
+    :param timeout: seconds to wait for each piece
+    :return: async generator of the pieces
+    """
+    while size:
+        chunk = await asyncio.wait_for(reader.read(min(size, util.MAX_HEADER_SIZE)), timeout)
+        if not chunk:
+            raise ConnectionError("connection closed mid body")
+        size -= len(chunk)
+        yield chunk
+
+
+async def iter_chunked(reader: asyncio.StreamReader, timeout: float) -> AsyncIterator[bytes]:
+    """
+    reads a Transfer-Encoding: chunked body piece by piece
+    :param reader: stream reader of the client connection
+    :param timeout: seconds to wait for each read
+    :return: async generator of the pieces without the chunk framing
+    """
+    try:
+        while size := util.parse_chunk_size(await asyncio.wait_for(reader.readuntil(b"\r\n"), timeout)):
+            async for chunk in iter_body(reader, size, timeout):
+                yield chunk
+            if await asyncio.wait_for(reader.readexactly(2), timeout) != b"\r\n":
+                raise util.HTTPError(400)
+        while await asyncio.wait_for(reader.readuntil(b"\r\n"), timeout) != b"\r\n":
+            pass  # trailer fields
+    except asyncio.IncompleteReadError:
+        raise ConnectionError("connection closed mid body") from None
+    except asyncio.LimitOverrunError:
+        raise util.HTTPError(400) from None
+
+
+def blocking_iter(chunks: AsyncIterator[bytes], loop: asyncio.AbstractEventLoop) -> Iterator[bytes]:
+    """
+    iterates an async generator from a thread other than the event loop's,
+    so handlers running on the executor can read a streamed body
+    :param chunks: async generator driven on the event loop
+    :param loop: running event loop of the connection
+    :return: generator of the same pieces
+    """
+    while True:
+        try:
+            yield asyncio.run_coroutine_threadsafe(anext(chunks), loop).result()
+        except StopAsyncIteration:
+            return
+
+
+async def read_request(reader: asyncio.StreamReader, app) -> util.Request | None:
+    """
+    reads the next request (head and body) of a connection,
+    waiting at most keep_alive_timeout for each read,
+    bodies the app streams are left as a BodyStream read by the handler
+    :param reader: stream reader of the client connection
+    :param app: App instance with the connection limits
+    :return: Request or None if the connection closed between requests
+    """
+    timeout = app.keep_alive_timeout
+    try:
+        head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout)
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise ConnectionError("connection closed mid request") from None
+        return None
+    except asyncio.LimitOverrunError:
+        raise util.HTTPError(400) from None
+    request = util.parse_request(head)
+    if request is None:
+        raise util.HTTPError(400)
+    if app.streams_body(request):
+        length = util.body_length(request, None)
+        chunks = iter_chunked(reader, timeout) if length == util.CHUNKED else iter_body(reader, length, timeout)
+        request.body = util.BodyStream(blocking_iter(chunks, asyncio.get_running_loop()))
+        return request
+    length = util.body_length(request, app.max_body_size)
+    if length == util.CHUNKED:
+        body = bytearray()
+        async for chunk in iter_chunked(reader, timeout):
+            if len(body) + len(chunk) > app.max_body_size:
+                raise util.HTTPError(413)
+            body += chunk
+        request.body = body
+    elif length:
+        try:
+            request.body = await asyncio.wait_for(reader.readexactly(length), timeout)
+        except asyncio.IncompleteReadError:
+            raise ConnectionError("connection closed mid body") from None
+    return request
+
+
+async def send_stream(executor: ThreadPoolExecutor, writer: asyncio.StreamWriter, response):
+    """
+    writes a streamed response, producing each chunk on the
+    executor since producing it reads from the database
+    :param executor: executor that runs the (blocking) sqlite work
+    :param writer: stream writer of the client connection
+    :param response: generator of bytes
+    :return: tuple of the number of bytes sent and the seconds spent sending them
+    """
+    loop = asyncio.get_running_loop()
+    sent, sending = 0, 0.0
+    try:
+        while True:
+            chunk = await loop.run_in_executor(executor, next, response, None)
+            if chunk is None:
+                return sent, sending
+            start = time.perf_counter()
+            writer.write(chunk)
+            await writer.drain()
+            sent, sending = sent + len(chunk), sending + time.perf_counter() - start
+    finally:
+        await loop.run_in_executor(executor, response.close)
+
+
+async def handle(app, executor: ThreadPoolExecutor, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """
+    handler for a single client connection on the event loop,
+    serves (pipelined) requests in order until the connection closes
+    or idles past the app's keep alive timeout
+    :param app: App instance to route requests with
+    :param executor: executor that runs the (blocking) sqlite work
+    :param reader: stream reader of the client connection
+    :param writer: stream writer of the client connection
+    :return: None
+    """
+    loop = asyncio.get_running_loop()
+    served = 0
+    app.metrics.connection(opened=True)
+    try:
+        while True:
+            try:
+                request = await read_request(reader, app)
+            except util.HTTPError as e:
+                writer.write(util.create_http_response(headers={"Connection": "close"}, code=e.code))
+                await writer.drain()
+                return
+            if request is None:
+                return
+            served += 1
+            keep_alive = util.wants_keep_alive(request) and served < app.max_requests and not app.draining
+            response = await loop.run_in_executor(executor, app.respond, request, keep_alive)
+            if isinstance(request.body, util.BodyStream):
+                if not await loop.run_in_executor(executor, request.body.drain):
+                    keep_alive = False
+            if isinstance(response, bytes):
+                start = time.perf_counter()
+                writer.write(response)
+                await writer.drain()
+                sent, sending = len(response), time.perf_counter() - start
+            else:
+                sent, sending = await send_stream(executor, writer, response)
+            if request.timing is not None:
+                app.metrics.finish(request.timing, sent, sending)
+            if not keep_alive:
+                return
+    except (ConnectionError, asyncio.TimeoutError):
+        pass
+    finally:
+        app.metrics.connection(opened=False)
+        writer.close()
+
+
+async def handle_socket(app, executor: ThreadPoolExecutor, sock) -> None:
+    """
+    handler for a connection accepted outside of an asyncio server
+    :param app: App instance to route requests with
+    :param executor: executor that runs the (blocking) sqlite work
+    :param sock: accepted client socket
+    :return: None
+    """
+    reader, writer = await asyncio.open_connection(sock=sock, limit=util.MAX_HEADER_SIZE)
+    await handle(app, executor, reader, writer)
+
+
+async def serve(app, host: str, port: int, max_workers: int | None = None, backlog: int | None = None):
+    """
+    starts the server and serves forever
+    :param app: App instance to route requests with
+    :param host: host for server
+    :param port: port to run server on
+    :param max_workers: number of threads for database work
+    :param backlog: (optional) listen backlog, asyncio's default (100) if None
+    :return: None
+    """
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="autoapi") as executor:
+        server = await asyncio.start_server(
+            lambda r, w: handle(app, executor, r, w), host, port, limit=util.MAX_HEADER_SIZE,
+            backlog=100 if backlog is None else backlog
+        )
+        print(f"🚀 server listening on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def run(app, host: str, port: int, max_workers: int | None = None, backlog: int | None = None):
+    """
+    blocking entry point for the asyncio engine
+    :param app: App instance to route requests with
+    :param host: host for server
+    :param port: port to run server on
+    :param max_workers: number of threads for database work
+    :param backlog: (optional) listen backlog
+    :return: None
+    """
+    asyncio.run(serve(app, host, port, max_workers=max_workers, backlog=backlog))
@@ -0,0 +1,214 @@
+"""
+Oliver 2024
+
+in-process cache of encoded GET responses, invalidated
+per table by the write handlers, and the table versions
+shared by the worker processes
+"""
+
+import mmap
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, Iterator, Set, Tuple
+
+from . import util
+
+# number of version counters the tables are hashed into
+BUCKETS = 4096
+_COUNTER = struct.Struct("q")
+
+
+class TableVersions:
+    def __init__(self, slots: int = 1):
+        """
+        version counter per table, bumped after every write to the table,
+        a response computed at one version is stale once the version moved,
+        the counters are in shared memory so the worker processes forked
+        after it see each other's writes and agree on the versions: every
+        process bumps the counters of its own slot and a version is the sum
+        over the slots, tables are hashed into BUCKETS counters (a collision
+        only costs an extra invalidation)
+        :param slots: number of processes that bump the versions
+        """
+        self.slots = slots
+        # slot of this process, set by a worker after it was forked
+        self.slot = 0
+        self._counters = struct.Struct(f"{slots}q")
+        # counters of all tables (bump_all), of every table bucket and of the bumps of each slot
+        self._shared = mmap.mmap(-1, self._counters.size * (BUCKETS + 2))
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def bucket(table: str) -> int:
+        """
+        :param table: name of table
+        :return: index of its counters
+        """
+        return 1 + zlib.crc32(table.encode()) % BUCKETS
+
+    def _sum(self, bucket: int) -> int:
+        return sum(self._counters.unpack_from(self._shared, bucket * self._counters.size))
+
+    def get(self, table: str) -> int:
+        """
+        :param table: name of table
+        :return: current version of the table
+        """
+        return self._sum(0) + self._sum(self.bucket(table))
+
+    def _bump(self, bucket: int) -> None:
+        offset = bucket * self._counters.size + self.slot * _COUNTER.size
+        _COUNTER.pack_into(self._shared, offset, _COUNTER.unpack_from(self._shared, offset)[0] + 1)
+
+    def bump(self, tables: Iterable[str]) -> None:
+        """
+        marks tables as changed
+        :param tables: names of the changed tables
+        :return: None
+        """
+        with self._lock:
+            for bucket in {self.bucket(table) for table in tables}:
+                self._bump(bucket)
+            self._bump(BUCKETS + 1)
+
+    def bumped_by_others(self) -> int:
+        """
+        :return: number of bump calls of the other slots (processes)
+        """
+        counts = self._counters.unpack_from(self._shared, (BUCKETS + 1) * self._counters.size)
+        return sum(counts) - counts[self.slot]
+
+    def bump_all(self) -> None:
+        """ marks every table as changed (e.g. after an external write) """
+        with self._lock:
+            self._bump(0)
+
+
+class ResponseCache:
+    def __init__(self, versions: TableVersions, max_bytes: int = 64 * 1024 * 1024, max_entry_bytes: int | None = None):
+        """
+        LRU cache of complete encoded responses bounded by their total size
+        :param versions: table versions the cached responses are checked against
+        :param max_bytes: maximum total size of the cached responses
+        :param max_entry_bytes: responses larger than this are not cached (default: max_bytes / 16)
+        """
+        self.versions = versions
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_bytes // 16 if max_entry_bytes is None else max_entry_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> (table, version, response)
+        self._entries: OrderedDict[Hashable, Tuple[str, int, bytes]] = OrderedDict()
+        self._tables: Dict[str, Set[Hashable]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, version: int) -> bytes | None:
+        """
+        :param key: cache key
+        :param version: current version of the table, a response read at
+        another one is stale (e.g. another worker process wrote the table)
+        :return: cached response or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] != version:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key: Hashable, table: str, version: int, response: bytes) -> None:
+        """
+        caches a response unless the table changed since it was read
+        :param key: cache key
+        :param table: table the response was read from
+        :param version: version of the table before the response was read
+        :param response: encoded response
+        :return: None
+        """
+        if len(response) > self.max_entry_bytes:
+            return
+        with self._lock:
+            if self.versions.get(table) != version:
+                return
+            self._remove(key)
+            self._entries[key] = (table, version, response)
+            self._tables.setdefault(table, set()).add(key)
+            self.size += len(response)
+            while self.size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def capture(self, key: Hashable, table: str, version: int, response: Iterator[bytes]) -> Iterator[bytes]:
+        """
+        passes a streamed response through and caches it once
+        it was sent completely, if it is small enough
+        :param key: cache key
+        :param table: table the response was read from
+        :param version: version of the table before the response was read
+        :param response: iterator of response pieces
+        :return: iterator of the same pieces
+        """
+        def pieces():
+            parts, size = [], 0
+            for chunk in response:
+                if parts is not None:
+                    size += len(chunk)
+                    if size > self.max_entry_bytes:
+                        parts = None
+                    else:
+                        parts.append(chunk)
+                yield chunk
+            if parts is not None:
+                self.put(key, table, version, b''.join(parts))
+
+        return util.ClosingIterator(pieces(), getattr(response, "close", lambda: None))
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        table, _, response = entry
+        self.size -= len(response)
+        self._tables[table].discard(key)
+
+    def invalidate(self, tables: Iterable[str]) -> None:
+        """
+        drops every cached response read from the given tables
+        :param tables: names of changed tables
+        :return: None
+        """
+        with self._lock:
+            for table in tables:
+                for key in self._tables.pop(table, ()):
+                    _, _, response = self._entries.pop(key)
+                    self.size -= len(response)
+
+    def clear(self) -> None:
+        """ drops every cached response """
+        with self._lock:
+            self._entries.clear()
+            self._tables.clear()
+            self.size = 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        :return: dictionary of hit, miss and eviction counters and the cache size
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.size,
+            }
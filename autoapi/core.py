@@ -2,46 +2,261 @@
 Oliver Aug 2024
 """
 
+import csv
 import functools
+import io
 import json
 import os.path
-import re
+import select
 import socket
+import sys
+import tempfile
 import threading
+import time
+from contextlib import ExitStack
+from typing import Any, Callable, Dict, List, Set, Tuple, Iterator
+from urllib.parse import parse_qsl, urlencode
 
-from . import util
-from .sqrl import SQL
+from . import admission, aio, metrics, prefork, query, serialize, util
+from .cache import ResponseCache, TableVersions
+from .reader import SocketReader
+from .router import Router, SINGLE, ALL, split_path
+from .sqrl import SQL, BatchWriter, ConnectionPool, IndexAdvisor, PoolTimeout, QueryProfiler
+from .sqrl.catalog import Catalog
+from .sqrl.core import IN_MEMORY
+from .sqrl.utils import iter_json_records, quote_identifier
 
 GET = "GET"
 POST = "POST"
 DELETE = "DELETE"
 PUT = "PUT"
-SINGLE = 0
-ALL = 1
+THREAD = "thread"
+ASYNC = "async"
+STREAM_BATCH_SIZE = 500
+DEFAULT_PAGE_SIZE = 100
+# pages are read into memory, larger requests get a 400 (whole tables are streamed instead)
+MAX_PAGE_SIZE = 1000
+PAGINATION_PARAMS = {"limit", "offset", "after"}
+JSON = "application/json"
+NDJSON = "application/x-ndjson"
+CSV = "text/csv"
+# representations of a whole table besides JSON, by path suffix
+SUFFIXES = {".csv": CSV, ".ndjson": NDJSON}
+# paths of the metrics and the query profile endpoints, never cached
+METRICS = "_metrics"
+PROFILE = "_profile"
+ADMIN = {(METRICS,), (PROFILE,)}
+CONNECTION_THREAD = "autoapi-connection"
+# bytes of a bulk insert body kept in memory while it is received, the rest goes to a temporary file
+SPOOL_SIZE = 4 * 1024 * 1024
+SPOOL_CHUNK_SIZE = 64 * 1024
+# seconds an idle persistent connection waits before it checks whether other
+# connections wait for its handler thread, it then gives the thread up
+IDLE_POLL = 0.05
 HOMEPAGE = os.path.join(os.path.dirname(__file__), "index.html")
 
 
 class App:
-    def __init__(self, database: str, echo: bool = False):
+    def __init__(self, database: str, echo: bool = False, keep_alive_timeout: float = 5.0, max_requests: int = 100,
+                 max_body_size: int = 16 * 1024 * 1024, max_bulk_body_size: int = 1024 * 1024 * 1024,
+                 readers: int = 4, pool_timeout: float | None = 5.0,
+                 write_batch_window: float | None = None, write_batch_size: int = 100,
+                 cache_bytes: int | None = None, external_check_interval: float | None = None,
+                 bulk_batch_size: int = 1000,
+                 advise_indexes: bool = False, auto_index: bool = False, optimize_interval: float | None = None,
+                 profile: str | None = None, schema_check_interval: float | None = 1.0,
+                 collect_metrics: bool = False, profile_queries: bool = False,
+                 slow_query_threshold: float = 0.1, query_sample_rate: float = 0.01):
         """
 
         :param database: sqlite database file
         :param echo: flag of whether to echo commands on the command line
+        :param keep_alive_timeout: seconds an idle persistent connection is kept open
+        :param max_requests: maximum number of requests served on one connection
+        :param max_body_size: largest request body accepted, larger ones get a 413
+        :param max_bulk_body_size: largest body of a bulk insert (POST of a JSON array or NDJSON), larger ones get a 413
+        :param readers: number of read only database connections
+        :param pool_timeout: seconds a request waits for a free database connection before a 503
+        :param write_batch_window: if set, writes are grouped into one transaction per
+        this many seconds (or write_batch_size writes) by a single writer thread
+        :param write_batch_size: maximum number of writes per grouped transaction
+        :param cache_bytes: if set, GET responses are cached up to this many bytes
+        and invalidated per table by the write handlers
+        :param external_check_interval: if set, seconds between checks of PRAGMA data_version
+        that drop the cache when another connection or process wrote to the database
+        :param bulk_batch_size: rows per executemany of a bulk insert (POST of a JSON array or NDJSON)
+        :param advise_indexes: if set, the columns list requests filter and sort by are recorded
+        and the frequent queries that scan their table get an index suggestion (see app.advisor)
+        :param auto_index: if set, the suggested indexes are also created (implies advise_indexes)
+        :param optimize_interval: if set, seconds between refreshes of the query planner statistics
+        :param profile: (optional) performance profile of every database connection,
+        "read-heavy", "write-heavy", "bulk-load" or "read-only" (see sqrl.core.PROFILES),
+        with "read-only" POST, PUT and DELETE requests to tables are answered with a 405
+        :param schema_check_interval: if set, seconds between checks of PRAGMA schema_version
+        that rebuild the routes when tables were created, altered or dropped
+        :param collect_metrics: flag of whether request metrics are recorded for GET /_metrics
+        (app.metrics.enabled, or PUT /_metrics {"enabled": false}, toggles it at runtime)
+        :param profile_queries: flag of whether a sample of the statements is profiled for GET /_profile
+        (PUT /_profile {"enabled": false} toggles it at runtime)
+        :param slow_query_threshold: seconds above which a statement is logged as slow while profiling
+        :param query_sample_rate: fraction of the statements aggregated while profiling
         """
-        self.db = SQL(database, echo=echo, check_same_thread=False)
-        self.tables = self.db.get_table_names()
-        self.patterns = []
+        self.keep_alive_timeout = keep_alive_timeout
+        self.max_requests = max_requests
+        self.max_body_size = max_body_size
+        self.max_bulk_body_size = max_bulk_body_size
+        self.bulk_batch_size = bulk_batch_size
+        self.database = database
+        self.pool_settings = {"readers": readers, "timeout": pool_timeout, "echo": echo, "profile": profile}
+        self.write_batch_window = write_batch_window
+        self.write_batch_size = write_batch_size
+        self.auto_index = auto_index
+        self.optimize_interval = optimize_interval
+        self.advise_indexes = advise_indexes or auto_index
+        self.cache_bytes = cache_bytes
+        self.external_check_interval = external_check_interval
+        self.schema_check_interval = schema_check_interval
+        # immutable readers do not see writes, so the tables are not writable through the api
+        self.read_only = profile == "read-only"
+        self._schema_lock = threading.Lock()
+        # set while a worker process stops, its connections are no longer kept alive
+        self.draining = False
+        # handler threads of the thread engine, set by serve
+        self.handlers: admission.HandlerPool | None = None
+        self.metrics = metrics.Metrics(enabled=collect_metrics)
+        self.profiler = QueryProfiler(threshold=slow_query_threshold, sample_rate=query_sample_rate)
+        self.profiling = profile_queries
+        # versions start at 0 with every App, the seed keeps their tags apart, the worker
+        # processes share both (see prefork.Supervisor), so their tags are the same
+        self.versions = TableVersions()
+        self.etag_seed = os.urandom(4).hex()
+        self.open()
+        self.load_schema(self.db.catalog())
+        self._schema_checked = time.monotonic()
+
+    def open(self) -> None:
+        """
+        opens the state that cannot be shared with another process: the database
+        connections, the background threads and the response cache,
+        called once by __init__ and again by every worker process after it was forked
+        :return: None
+        """
+        self.pool = ConnectionPool(self.database, **self.pool_settings)
+        self.db = self.pool.writer_connection
+        self.metrics.attach(self.pool.connections())
+        self.set_profiling(self.profiling)
+        self.batch_writer = None
+        if self.write_batch_window is not None:
+            self.batch_writer = BatchWriter(self.pool, window=self.write_batch_window, max_batch=self.write_batch_size)
+        self.advisor = None
+        if self.advise_indexes or self.optimize_interval is not None:
+            self.advisor = IndexAdvisor(self.pool, create=self.auto_index, optimize_interval=self.optimize_interval)
+        self.cache = ResponseCache(self.versions, max_bytes=self.cache_bytes) if self.cache_bytes else None
+        # PRAGMA data_version is read on a connection of its own so that checking it never waits for the writer,
+        # it changes with every commit of another connection, the api's writer included (an in memory
+        # database has no other connections)
+        self.watcher = None
+        if self.database != IN_MEMORY:
+            self.watcher = SQL(self.database, read_only=True, check_same_thread=False)
+        self._watch_lock = threading.Lock()
+        self._data_version = self.watcher.fetch("PRAGMA data_version;", one=True) if self.watcher else None
+        self._writer_data_version = self.db.fetch("PRAGMA data_version;", one=True)
+        self._bumped_by_others = self.versions.bumped_by_others()
+        self._data_version_checked = time.monotonic()
+
+    def close(self) -> None:
+        """
+        stops the background threads (committing the queued writes)
+        and closes the database connections, see open
+        :return: None
+        """
+        if self.advisor is not None:
+            self.advisor.close()
+        if self.batch_writer is not None:
+            self.batch_writer.close()
+        self.profiler.detach(self.pool.connections())
+        self.metrics.detach(self.pool.connections())
+        if self.watcher is not None:
+            self.watcher.con.close()
+        self.pool.close()
+
+    def load_schema(self, catalog: Catalog) -> None:
+        """
+        sets the tables, primary keys, columns, dependents and routes
+        of a schema, all of them are built before any is replaced so a
+        request never sees half of a schema, tables without a primary
+        key cannot be served and are skipped with a warning
+        :param catalog: schema of the database
+        :return: None
+        """
+        names = [t for t in catalog.tables if not t.startswith("sqlite_")]
+        tables = []
+        for t in names:
+            if not catalog.primary_keys.get(t):
+                print(f"table {t} has no primary key, it is not served", file=sys.stderr)
+                continue
+            tables.append(t)
+        primary_keys = {t: catalog.primary_keys[t][0] for t in tables}
+        columns = {t: catalog.columns[t] for t in tables}
+        # writes cascade through the tables that are not served as well
+        dependents = self.find_dependents(catalog, names)
+        router = self.build_routes(tables)
+        self.catalog, self.tables, self.primary_keys, self.columns, self.dependents, self.router = (
+            catalog, tables, primary_keys, columns, dependents, router
+        )
+
+    def check_schema(self) -> None:
+        """
+        compares PRAGMA schema_version with the loaded schema at most once
+        per interval and reloads it (and drops the cache) when it changed
+        :return: None
+        """
+        if self.schema_check_interval is None:
+            return
+        now = time.monotonic()
+        if now - self._schema_checked < self.schema_check_interval:
+            return
+        if not self._schema_lock.acquire(blocking=False):
+            return  # another thread is checking
         try:
-            self.tables.remove('sqlite_sequence')
-            self.tables.remove('sqlite_stat1')
-            self.tables.remove('sqlite_master')
-        except ValueError:
-            pass
-        self.primary_keys = {t: self.get_primary_key_column(t) for t in self.tables}
-        for t in self.tables:
-            all_path = rf"\b({re.escape(t)})\b(?!\w+)"
-            single_path = rf"{re.escape(t)}/(\w+)"
-            self.patterns.extend([(single_path, SINGLE), (all_path, ALL)])
+            self._schema_checked = now
+            try:
+                with self.pool.reader() as db:
+                    catalog = db.catalog()
+            except PoolTimeout:
+                return
+            if catalog.version == self.catalog.version:
+                return
+            self.load_schema(catalog)
+            self.versions.bump_all()
+            if self.cache is not None:
+                self.cache.clear()
+        finally:
+            self._schema_lock.release()
+
+    def build_routes(self, tables: List[str]) -> Router:
+        """
+        creates the router with a handler bound to every table and method,
+        with the read-only profile the tables only get GET handlers (writes
+        are answered with a 405), its readers would never see the writes
+        :param tables: names of the tables served
+        :return: Router
+        """
+        router = Router()
+        for t in tables:
+            router.add(t, ALL, GET, functools.partial(self.handle_read_all, t))
+            router.add(t, SINGLE, GET, functools.partial(self.handle_read_one, t))
+            if self.read_only:
+                continue
+            router.add(t, ALL, POST, functools.partial(self.handle_create, t))
+            router.add(t, SINGLE, PUT, functools.partial(self.handle_update, t))
+            router.add(t, SINGLE, DELETE, functools.partial(self.handle_delete, t))
+        router.add(METRICS, ALL, GET, self.handle_metrics)
+        router.add(METRICS, ALL, PUT, self.handle_metrics_toggle)
+        router.add(PROFILE, ALL, GET, self.handle_profile)
+        router.add(PROFILE, ALL, PUT, self.handle_profile_settings)
+        router.add(PROFILE, ALL, DELETE, self.handle_profile_reset)
+        return router
 
     def read_all(self, table_name):
         """
@@ -49,7 +264,142 @@ class App:
         :param table_name: name of table in database
         :return: json stringified result
         """
-        return json.dumps(self.db.select(table_name, return_as_dict=True))
+        with self.pool.reader() as db:
+            return json.dumps(db.select(table_name, return_as_dict=True))
+
+    def stream_all(self, table_name: str, encode: Callable[..., Iterator[bytes]] | None = None,
+                   spec: query.ListQuery | None = None) -> Iterator[bytes]:
+        """
+        reads all items from a given table in batches from the
+        cursor, encoding one batch at a time so memory stays bounded
+        by the batch size rather than the table size
+        :param table_name: name of table in database
+        :param encode: (optional) encoder of the column names and row batches
+        (default: encode_batches, a json array)
+        :param spec: (optional) fields, filters and sort order of the rows
+        :return: iterator of pieces of the encoded table, holding a read
+        connection until it is exhausted or closed
+        """
+        if encode is None:
+            encode = self.encode_batches
+        if spec is None:
+            spec = query.ListQuery()
+        with ExitStack() as stack:
+            db = stack.enter_context(self.pool.reader())
+            stmt = db.build_select(table_name, columns=spec.fields, where=spec.where, order_by=spec.order_by)
+            self.record_query(table_name, spec, stmt, spec.params)
+            result = db.stream(stmt, *spec.params, size=STREAM_BATCH_SIZE)
+            if result is None:
+                raise RuntimeError("could not read table {}".format(table_name))
+            return util.ClosingIterator(encode(*result), stack.pop_all().close)
+
+    @staticmethod
+    def encode_batches(columns: List[str], batches: Iterator[List[Tuple]]) -> Iterator[bytes]:
+        """
+        encodes batches of rows into the pieces of a json array of objects
+        :param columns: column names
+        :param batches: generator of row tuple batches
+        :return: generator of pieces of the json array
+        """
+        encoder = serialize.encoder_for(tuple(columns))
+        separator = b'['
+        for rows in batches:
+            yield separator + encoder.objects(rows)
+            separator = b', '
+        yield b']' if separator == b', ' else b'[]'
+
+    @staticmethod
+    def encode_csv(columns: List[str], batches: Iterator[List[Tuple]]) -> Iterator[bytes]:
+        """
+        encodes batches of rows into the pieces of a csv file with a header line
+        :param columns: column names
+        :param batches: generator of row tuple batches
+        :return: generator of pieces of the csv file
+        """
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for rows in batches:
+            writer.writerows(rows)
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():  # header of an empty table
+            yield buffer.getvalue().encode("utf-8")
+
+    @staticmethod
+    def encode_ndjson(columns: List[str], batches: Iterator[List[Tuple]]) -> Iterator[bytes]:
+        """
+        encodes batches of rows into the pieces of newline delimited json
+        :param columns: column names
+        :param batches: generator of row tuple batches
+        :return: generator of pieces, one json object per line
+        """
+        encoder = serialize.encoder_for(tuple(columns))
+        for rows in batches:
+            yield encoder.lines(rows)
+
+    def read_page(self, table_name: str, limit: int, offset: int = 0, after: str | None = None,
+                  spec: query.ListQuery | None = None,
+                  encode: Callable[..., Iterator[bytes]] | None = None) -> Tuple[bytes, str | None]:
+        """
+        reads one page of a table ordered by its primary key,
+        either by offset or by keyset (rows after a given primary key value),
+        keyset pages are found through the primary key index so deep pages
+        cost the same as the first one
+        :param table_name: name of table in database
+        :param limit: page size
+        :param offset: number of rows to skip (offset pagination)
+        :param after: primary key value the page starts after (keyset pagination)
+        :param spec: (optional) fields, filters and sort order of the rows, pages
+        are sorted by the primary key after the requested order
+        :param encode: (optional) encoder of the column names and row batches
+        (default: a json array)
+        :return: tuple of the encoded page and the query string
+        of the next page (None if this is the last page)
+        """
+        pk = self.primary_keys[table_name]
+        if spec is None:
+            spec = query.ListQuery()
+        fields = spec.fields
+        if after is not None and fields and quote_identifier(pk) not in fields:
+            fields = fields + [quote_identifier(pk)]  # the next page starts after it
+        where = query.and_where(spec.where, None if after is None else f"{quote_identifier(pk)} > ?")
+        # one extra row tells whether there is a next page
+        params = spec.params + ([] if after is None else [after]) + [limit + 1, offset]
+        with self.pool.reader() as db:
+            stmt = db.build_select(
+                table_name, columns=fields, where=where, order_by=spec.order_by + [(quote_identifier(pk), True)], paged=True
+            )
+            self.record_query(table_name, spec, stmt, params)
+            result = db.stream(stmt, *params, size=limit + 1)
+            if result is None:
+                raise RuntimeError("could not read table {}".format(table_name))
+            columns, batches = result
+            rows = next(batches, [])
+            batches.close()
+        page = rows[:limit]
+        next_page = None
+        if len(rows) > limit:
+            if after is None:
+                next_page = urlencode({"limit": limit, "offset": offset + limit})
+            else:
+                next_page = urlencode({"limit": limit, "after": page[-1][columns.index(pk)]})
+        if encode is not None:
+            return b''.join(encode(columns, iter((page,)))), next_page
+        return serialize.encoder_for(tuple(columns)).array(page), next_page
+
+    def record_query(self, table_name: str, spec: query.ListQuery, statement: str, params: List) -> None:
+        """
+        records the filtered and sorted columns of a list query for the index advisor
+        :param table_name: name of the queried table
+        :param spec: compiled list query
+        :param statement: sql statement it compiled to
+        :param params: parameter values of the statement
+        :return: None
+        """
+        if self.advise_indexes:
+            self.advisor.record(table_name, spec.filtered, spec.sorted, statement, params)
 
     def get_primary_key_column(self, table_name: str) -> str:
         """
@@ -58,126 +408,711 @@ class App:
         :param table_name: name of table in database
         :return: name of primary key column
         """
-        result = self.db.fetch(f"PRAGMA table_info({table_name})")
-        primary_key_columns = [col[1] for col in result if col[5] == 1]
+        primary_key_columns = self.catalog.primary_keys.get(table_name, [])
         if len(primary_key_columns) < 1:
             raise RuntimeError
         return primary_key_columns[0]
 
-    def read_one(self, table_name, pk):
+    def read_one(self, table_name: str, pk: str) -> bytes:
         """
         reads a single items from a table in the database
         based on a given value assumed to be search with
-        the main primary key
+        the main primary key, the value is bound as a parameter
+        so every lookup of a table reuses one prepared statement
         :param table_name: name of the table in the database
         :param pk: value to search for the item by
-        :return: json stringified result
+        :return: json encoded row (null if there is none)
         """
-        col = self.primary_keys[table_name]
+        col = quote_identifier(self.primary_keys[table_name])
 
-        return json.dumps(
-            self.db.select(table_name, limit=1, return_as_dict=True, where="{} = {}".format(col, pk))
-        )
+        with self.pool.reader() as db:
+            result = db.stream(db.build_select(table_name, where=f"{col} = ?"), pk, size=1)
+            if result is None:
+                raise RuntimeError("could not read table {}".format(table_name))
+            columns, batches = result
+            rows = next(batches, [])
+            batches.close()
+        return serialize.encoder_for(tuple(columns)).object(rows[0]) if rows else b'null'
+
+    def write(self, table: str, statement: str, params: List) -> bool:
+        """
+        runs a write statement in its own transaction on the writer
+        connection, or hands it to the batch writer when write batching is on
+        :param table: table written to
+        :param statement: sql statement
+        :param params: parameter values
+        :return: boolean whether execution was successful
+        """
+        if self.batch_writer is not None:
+            success = self.batch_writer.execute(statement, *params)
+        else:
+            with self.pool.writer() as db:
+                success = db.execute(statement, *params, as_transaction=True)
+        if success:
+            self.changed(table)
+        return success
+
+    def changed(self, table: str) -> None:
+        """
+        marks a table, and the tables a write to it can
+        cascade to, as changed and drops their cached responses
+        :param table: name of table written to
+        :return: None
+        """
+        tables = self.dependents.get(table, (table,))
+        self.versions.bump(tables)
+        if self.cache is not None:
+            self.cache.invalidate(tables)
+
+    @staticmethod
+    def find_dependents(catalog: Catalog, tables: List[str]) -> Dict[str, Set[str]]:
+        """
+        finds for every table the tables a write to it can change:
+        itself, tables referencing it by (cascading) foreign keys
+        and, if it has triggers, every table
+        :param catalog: schema of the database
+        :param tables: names of the tables in the database
+        :return: dictionary of table name and set of table names
+        """
+        referencing = {t: set() for t in tables}
+        for t in tables:
+            for parent in catalog.references.get(t, ()):
+                referencing.setdefault(parent, set()).add(t)
+        triggered = catalog.triggers
+        dependents = {}
+        for t in tables:
+            if t in triggered:
+                dependents[t] = set(tables)
+                continue
+            found, todo = {t}, [t]
+            while todo:
+                for child in referencing.get(todo.pop(), ()):
+                    if child not in found:
+                        found.add(child)
+                        todo.append(child)
+            dependents[t] = found
+        return dependents
+
+    def etag(self, table: str, version: int, media_type: str = JSON) -> str:
+        """
+        entity tag of the responses read from a table at a version,
+        it changes with every write to the table (and after external
+        writes when external_check_interval is set)
+        :param table: name of table
+        :param version: version of the table
+        :param media_type: representation of the response, each has its own tag
+        :return: quoted entity tag
+        """
+        if media_type == JSON:
+            return f'"{table}-{version}-{self.etag_seed}"'
+        return f'"{table}-{version}-{self.etag_seed}-{media_type.rpartition("/")[2]}"'
+
+    def negotiate(self, request: util.Request) -> Tuple[str, str]:
+        """
+        picks the representation of a GET response, by a .csv or .ndjson
+        suffix of a /<table> path, else by the Accept header
+        :param request: parsed request
+        :return: tuple of the path without the suffix and the media type
+        """
+        base, dot, suffix = request.path.rstrip('/').rpartition('.')
+        media_type = SUFFIXES.get(dot + suffix)
+        if media_type is not None and len(split_path(base)) == 1:
+            return base, media_type
+        return request.path, util.preferred_type(request.headers.get("Accept"), [JSON, CSV, NDJSON])
 
-    def handle(self, client: socket.socket, addr: tuple):
+    def check_external_writes(self) -> None:
         """
-        handler for client connections to server
+        drops the whole cache when another connection (e.g. another process)
+        committed, at most once per interval, PRAGMA data_version of the watcher
+        connection shows that something committed without waiting for the writer,
+        then the writer's, which the api's own writes do not change, tells whether
+        it was another connection (if the writer is busy it is taken to be), the
+        other worker processes bump the versions of the tables they write, so a
+        commit is only taken to be external if none of them wrote since the last
+        check (an external commit at the same time as theirs is missed)
+        :return: None
+        """
+        if self.external_check_interval is None or self.watcher is None:
+            return
+        now = time.monotonic()
+        if now - self._data_version_checked < self.external_check_interval:
+            return
+        if not self._watch_lock.acquire(blocking=False):
+            return  # another thread is checking
+        try:
+            self._data_version_checked = now
+            data_version = self.watcher.fetch("PRAGMA data_version;", one=True)
+            if data_version == self._data_version:
+                return
+            self._data_version = data_version
+            try:
+                with self.pool.writer(wait=False) as db:
+                    writer_data_version = db.fetch("PRAGMA data_version;", one=True)
+            except PoolTimeout:
+                writer_data_version = None
+            if writer_data_version is not None and writer_data_version == self._writer_data_version:
+                return  # only the api's own writes
+            if writer_data_version is not None:
+                self._writer_data_version = writer_data_version
+            bumped_by_others = self.versions.bumped_by_others()
+            if bumped_by_others != self._bumped_by_others:
+                self._bumped_by_others = bumped_by_others
+                return  # the other workers bumped the tables they wrote
+        finally:
+            self._watch_lock.release()
+        self.versions.bump_all()
+        if self.cache is not None:
+            self.cache.clear()
+
+    def handle_read_all(self, table: str, request: util.Request,
+                        media_type: str = JSON) -> Tuple[int, str | bytes | Iterator[bytes], Dict[str, str]]:
+        """
+        GET /<table>, GET /<table>?limit=&offset= and GET /<table>?limit=&after=,
+        optionally with ?fields=, ?sort= and column filters (see query), as JSON,
+        csv or NDJSON (GET /<table>.csv or Accept: text/csv and the like)
+        """
+        params = util.parse_query(request.query)
+        try:
+            spec = query.parse(request.query, self.columns[table])
+        except query.QueryError as e:
+            return 400, json.dumps({"error": str(e)}), {"Content-Type": JSON}
+        encode, content_type = {
+            CSV: (self.encode_csv, "text/csv; charset=utf-8"),
+            NDJSON: (self.encode_ndjson, NDJSON),
+        }.get(media_type, (None, JSON))
+        if not PAGINATION_PARAMS.intersection(params):
+            return 200, self.stream_all(table, encode, spec), {"Content-Type": content_type}
+        try:
+            limit = int(params.get("limit", DEFAULT_PAGE_SIZE))
+            offset = int(params.get("offset", 0))
+        except ValueError:
+            return 400, '', {}
+        if not 1 <= limit <= MAX_PAGE_SIZE or offset < 0 or ("after" in params and ("offset" in params or spec.order_by)):
+            return 400, '', {}
+        content, next_page = self.read_page(table, limit, offset=offset, after=params.get("after"), spec=spec,
+                                            encode=encode)
+        headers = {"Content-Type": content_type}
+        if next_page:
+            kept = urlencode([(k, v) for k, v in parse_qsl(request.query, keep_blank_values=True)
+                              if k not in PAGINATION_PARAMS])
+            headers["Link"] = f'<{request.path}?{kept + "&" if kept else ""}{next_page}>; rel="next"'
+        return 200, content, headers
+
+    def bulk_insert(self, table: str, body: util.BodyStream) -> Tuple[int, str, Dict[str, str]]:
+        """
+        inserts the records of a JSON array or NDJSON body in batches of
+        bulk_batch_size rows within a single transaction, the body is received
+        (spooled to a temporary file past SPOOL_SIZE) before the writer is taken,
+        so a slow client never holds up the other writes
+        :param table: name of table
+        :param body: request body
+        :return: response tuple with a JSON report of the rows inserted per batch
+        """
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as spool:
+            for chunk in body:
+                if spool.tell() + len(chunk) > self.max_bulk_body_size:
+                    body.failed = True  # the rest is not read, the connection is closed
+                    raise util.HTTPError(413)
+                spool.write(chunk)
+            spool.seek(0)
+            chunks = iter(lambda: spool.read(SPOOL_CHUNK_SIZE), b'')
+            records = self.checked_records(table, iter_json_records(chunks, max_record_size=self.max_body_size))
+            try:
+                with self.pool.writer() as db:
+                    report = db.insert_many(table, records, batch_size=self.bulk_batch_size)
+            except ValueError as e:
+                return 400, json.dumps({"inserted": 0, "error": str(e)}), {"Content-Type": JSON}
+        inserted = sum(batch["inserted"] for batch in report)
+        if inserted:
+            self.changed(table)
+        if all(batch["error"] is None for batch in report):
+            code = 201
+        else:
+            code = 200 if inserted else 400
+        return code, json.dumps({"inserted": inserted, "batches": report}), {"Content-Type": JSON}
+
+    def check_record(self, table: str, record: Any) -> None:
+        """
+        raises a ValueError unless a record from a request is an object of column names of the table
+        :param table: name of table
+        :param record: parsed JSON value
+        :return: None
+        """
+        if not isinstance(record, dict):
+            raise ValueError("records must be objects of column names and values")
+        unknown = [key for key in record if key not in self.columns[table]]
+        if unknown:
+            raise ValueError("unknown columns: {}".format(", ".join(unknown)))
+
+    def parse_record(self, table: str, body: bytes | None) -> Dict[str, Any]:
+        """
+        :param table: name of table
+        :param body: request body, one JSON object
+        :return: the object, ValueError if it is malformed or not a record of the table
+        """
+        record = json.loads(body or b'')
+        self.check_record(table, record)
+        return record
+
+    def checked_records(self, table: str, records: Iterator) -> Iterator:
+        """
+        :param table: name of table
+        :param records: records of a bulk insert
+        :return: the same records, raising ValueError at the first that is not a record of the table
+        """
+        for record in records:
+            self.check_record(table, record)
+            yield record
+
+    def streams_body(self, request: util.Request) -> bool:
+        """
+        :param request: parsed request head
+        :return: whether the body of the request is read while its
+        handler runs instead of up front (POST /<table>, which may be a bulk insert)
+        """
+        return request.method == POST and len(split_path(request.path)) == 1
+
+    def handle_create(self, table: str, request: util.Request) -> Tuple[int, str, Dict[str, str]]:
+        """ POST /<table>, one JSON object, or a JSON array or NDJSON stream of them """
+        content_type = util.media_type(request.headers.get('Content-Type'))
+        if content_type not in (JSON, NDJSON):
+            return 400, '', {}
+        body = request.body
+        if not isinstance(body, util.BodyStream):
+            body = util.BodyStream(iter((body,)))
+        if content_type == NDJSON or body.peek() == b'[':
+            return self.bulk_insert(table, body)
+        try:
+            data = self.parse_record(table, body.read(self.max_body_size))
+        except ValueError as e:
+            return 400, json.dumps({"error": str(e)}), {"Content-Type": JSON}
+        success = self.write(table, *self.db.build_insert(table, data=data))
+        return 201 if success else 500, '', {}
+
+    def handle_read_one(self, table: str, request: util.Request, pk: str) -> Tuple[int, bytes, Dict[str, str]]:
+        """ GET /<table>/<pk> """
+        return 200, self.read_one(table, pk), {"Content-Type": "application/json"}
+
+    def handle_update(self, table: str, request: util.Request, pk: str) -> Tuple[int, str, Dict[str, str]]:
+        """ PUT /<table>/<pk> """
+        if util.media_type(request.headers.get('Content-Type')) != JSON:
+            return 400, '', {}
+        try:
+            data = self.parse_record(table, request.body)
+        except ValueError as e:
+            return 400, json.dumps({"error": str(e)}), {"Content-Type": JSON}
+        pk_column = quote_identifier(self.primary_keys[table])
+        success = self.write(table, *self.db.build_update(table, data=data, where=f"{pk_column} = ?", params=[pk]))
+        return 204 if success else 500, '', {}
+
+    def handle_delete(self, table: str, request: util.Request, pk: str) -> Tuple[int, str, Dict[str, str]]:
+        """ DELETE /<table>/<pk> """
+        pk_column = self.primary_keys[table]
+        success = self.write(table, f"DELETE FROM {table} WHERE {quote_identifier(pk_column)} = ?;", [pk])
+        return 200 if success else 500, '', {}
+
+    def handle_metrics(self, request: util.Request) -> Tuple[int, str, Dict[str, str]]:
+        """ GET /_metrics """
+        return 200, self.metrics.render(self.metrics_gauges()), {"Content-Type": metrics.CONTENT_TYPE}
+
+    def handle_metrics_toggle(self, request: util.Request) -> Tuple[int, str, Dict[str, str]]:
+        """ PUT /_metrics with {"enabled": true|false} """
+        try:
+            enabled = json.loads(request.body)["enabled"]
+        except (ValueError, TypeError, KeyError):
+            return 400, '', {}
+        if not isinstance(enabled, bool):
+            return 400, '', {}
+        self.metrics.enabled = enabled
+        return 200, json.dumps({"enabled": enabled}), {"Content-Type": JSON}
+
+    def set_profiling(self, enabled: bool) -> None:
+        """
+        attaches the query profiler to every database connection or detaches it
+        :param enabled: flag of whether statements are profiled
+        :return: None
+        """
+        if enabled:
+            self.profiler.attach(self.pool.connections())
+        else:
+            self.profiler.detach(self.pool.connections())
+        self.profiling = enabled
+
+    def handle_profile(self, request: util.Request) -> Tuple[int, str, Dict[str, str]]:
+        """ GET /_profile, per statement stats, slow statements with their plans and index suggestions """
+        limit = util.parse_query(request.query).get("limit", "50")
+        if not limit.isdigit():
+            return 400, '', {}
+        with self.pool.reader() as db:
+            report = self.profiler.report(db, int(limit))
+        report["enabled"] = self.profiling
+        report["index_suggestions"] = self.advisor.suggestions() if self.advisor is not None else []
+        return 200, json.dumps(report), {"Content-Type": JSON}
+
+    def handle_profile_settings(self, request: util.Request) -> Tuple[int, str, Dict[str, str]]:
+        """ PUT /_profile with any of {"enabled": bool, "threshold": seconds, "sample_rate": 0 to 1} """
+        try:
+            settings = json.loads(request.body)
+        except ValueError:
+            return 400, '', {}
+        if not isinstance(settings, dict) or not settings or set(settings) - {"enabled", "threshold", "sample_rate"}:
+            return 400, '', {}
+        enabled = settings.get("enabled", self.profiling)
+        threshold = settings.get("threshold", self.profiler.threshold)
+        sample_rate = settings.get("sample_rate", self.profiler.sample_rate)
+        if (not isinstance(enabled, bool) or isinstance(threshold, bool) or isinstance(sample_rate, bool)
+                or not isinstance(threshold, (int, float)) or not isinstance(sample_rate, (int, float))
+                or threshold < 0 or not 0 <= sample_rate <= 1):
+            return 400, '', {}
+        self.profiler.threshold = threshold
+        self.profiler.sample_rate = sample_rate
+        self.set_profiling(enabled)
+        body = {"enabled": enabled, "threshold": threshold, "sample_rate": sample_rate}
+        return 200, json.dumps(body), {"Content-Type": JSON}
+
+    def handle_profile_reset(self, request: util.Request) -> Tuple[int, str, Dict[str, str]]:
+        """ DELETE /_profile, drops the recorded stats """
+        self.profiler.reset()
+        return 204, '', {}
+
+    def metrics_gauges(self) -> Dict[Tuple[str, metrics.Labels], float]:
+        """
+        :return: handler thread, connection pool and response cache statistics as metric values
+        """
+        gauges = {("autoapi_metrics_enabled", ()): int(self.metrics.enabled)}
+        if self.handlers is not None:
+            stats = self.handlers.stats()
+            gauges[("autoapi_handler_threads", ())] = stats["threads"]
+            gauges[("autoapi_handler_threads_busy", ())] = stats["busy"]
+            gauges[("autoapi_queue_size", ())] = stats["queue_size"]
+            gauges[("autoapi_queue_depth", ())] = stats["waiting"]
+            gauges[("autoapi_connections_accepted_total", ())] = stats["accepted"]
+            gauges[("autoapi_connections_rejected_total", ())] = stats["rejected"]
+        names = {
+            "size": "autoapi_pool_connections",
+            "in_use": "autoapi_pool_in_use",
+            "checkouts": "autoapi_pool_checkouts_total",
+            "waits": "autoapi_pool_waits_total",
+            "timeouts": "autoapi_pool_timeouts_total",
+            "wait_seconds": "autoapi_pool_wait_seconds_total",
+            "utilization": "autoapi_pool_utilization",
+        }
+        for kind, usage in self.pool.stats().items():
+            for stat, name in names.items():
+                gauges[(name, (("kind", kind),))] = usage[stat]
+        if self.cache is not None:
+            stats = self.cache.stats()
+            for stat in ("hits", "misses", "evictions"):
+                gauges[(f"autoapi_cache_{stat}_total", ())] = stats[stat]
+            gauges[("autoapi_cache_entries", ())] = stats["entries"]
+            gauges[("autoapi_cache_bytes", ())] = stats["bytes"]
+        return gauges
+
+    @staticmethod
+    def served_early(request: util.Request, code: int) -> None:
+        """
+        records the status of a request answered without running
+        its handler (a 304 or a cached response) in its metrics
+        :param request: parsed request
+        :param code: status code of the response
+        :return: None
+        """
+        if request.timing is not None:
+            request.timing.status = code
+            request.timing.parse = time.perf_counter() - request.received
+
+    def respond(self, request: util.Request, keep_alive: bool = False) -> bytes | Iterator[bytes]:
+        """
+        routes a request to its handler,
+        independent of how the request was received,
+        GET responses are served from and stored in the response cache if enabled
+        :param request: parsed request (with its body)
+        :param keep_alive: whether the connection stays open after this response
+        :return: HTTP response in bytes, or a generator of bytes
+        to send in order for streamed (chunked) responses
+        """
+        self.check_schema()
+        timing = request.timing = self.metrics.start(request)
+        if timing is None:
+            return self.route(request, keep_alive)
+        # statements run on this thread count to the request
+        self.metrics.activate(timing)
+        try:
+            response = self.route(request, keep_alive)
+        finally:
+            self.metrics.activate(None)
+        if isinstance(response, bytes):
+            return response
+        return util.ClosingIterator(self.metrics.bind(timing, response), response.close)
+
+    def route(self, request: util.Request, keep_alive: bool = False) -> bytes | Iterator[bytes]:
+        """
+        routes a request to its handler, see respond
+        :param request: parsed request (with its body)
+        :param keep_alive: whether the connection stays open after this response
+        :return: HTTP response in bytes, or a generator of bytes
+        """
+        path, media_type = (request.path, JSON) if request.method != GET else self.negotiate(request)
+        code, handler, args = self.router.resolve(request.method, path)
+        segments = split_path(path)
+        if request.timing is not None:
+            request.timing.route = metrics.route_label(segments, code)
+
+        if handler is None or request.method != GET or segments in ADMIN:
+            return self.dispatch(request, code, handler, args, keep_alive)[1]
+
+        self.check_external_writes()
+        table = segments[0]
+        if args:
+            media_type = JSON  # single rows are JSON only
+        elif media_type != JSON:
+            handler = functools.partial(self.handle_read_all, table, media_type=media_type)
+        version = self.versions.get(table)
+        etag = self.etag(table, version, media_type)
+        if util.etag_matches(request.headers.get("If-None-Match"), etag):
+            self.served_early(request, 304)
+            return util.create_http_response(
+                headers={"ETag": etag, "Vary": "Accept", "Connection": "keep-alive" if keep_alive else "close"},
+                code=304
+            )
+        if self.cache is None:
+            return self.dispatch(request, code, handler, args, keep_alive, etag=etag)[1]
+
+        key = (request.path, request.query, request.version, keep_alive, media_type)
+        response = self.cache.get(key, version)
+        if response is not None:
+            self.served_early(request, 200)
+            return response
+        code, response = self.dispatch(request, code, handler, args, keep_alive, etag=etag)
+        if code != 200:
+            return response
+        if isinstance(response, bytes):
+            self.cache.put(key, table, version, response)
+            return response
+        return self.cache.capture(key, table, version, response)
+
+    def dispatch(self, request: util.Request, code: int, handler, args: Tuple[str, ...],
+                 keep_alive: bool, etag: str | None = None) -> Tuple[int, bytes | Iterator[bytes]]:
+        """
+        runs the handler a request was routed to and encodes its response
+        :param request: parsed request
+        :param code: status code of routing the request
+        :param handler: handler the request was routed to (None if not routed)
+        :param args: path arguments for the handler
+        :param keep_alive: whether the connection stays open after this response
+        :param etag: (optional) ETag header for a successful response
+        :return: tuple of status code and response
+        """
+        timing = request.timing
+        if timing is not None:
+            timing.parse = time.perf_counter() - timing.received
+        if handler is not None:
+            try:
+                code, content, headers = handler(request, *args)
+            except PoolTimeout:
+                code, content, headers = 503, '', {}
+            except util.HTTPError as e:
+                code, content, headers = e.code, '', {}
+                if isinstance(request.body, util.BodyStream) and request.body.failed:
+                    keep_alive = False  # the rest of the body is not read
+        elif code == 404:
+            content, headers = util.read_as_text(HOMEPAGE), {}
+        else:
+            content, headers = '', {}
+
+        if timing is not None:
+            timing.status = code
+        if etag is not None and code == 200:
+            headers["ETag"] = etag
+            headers["Vary"] = "Accept"
+        headers["Connection"] = "keep-alive" if keep_alive else "close"
+        if isinstance(content, (str, bytes)):
+            return code, util.create_http_response(content=content, headers=headers, code=code)
+        if request.version == "HTTP/1.0":  # no chunked encoding before HTTP/1.1
+            return code, util.create_http_response(content=b''.join(content), headers=headers, code=code)
+        return code, util.create_chunked_response(content, headers=headers, code=code)
+
+    def handle(self, client: socket.socket, addr: tuple, waited: float = 0.0):
+        """
+        handler for client connections to server,
+        serves requests on the connection in order until the client
+        closes it, asks to close it, or it idles past the keep alive timeout,
+        while every handler thread is busy and other connections wait it is not kept
+        alive and an idle one is closed (see wait_for_request)
         :param client: client socket
         :param addr: client addr
+        :param waited: seconds the connection waited for a handler thread
         :return: None
         """
+        if self.metrics.enabled:
+            self.metrics.observe("autoapi_queue_wait_seconds", (), waited)
         with client:
-            request = client.recv(1024)
-            if not request:
-                return
-            lines = request.split(b'\n')
-            request_line = lines[0].strip().decode()
-            headers = util.process_headers(lines[1:])
-            status = ''
-            # serve custom generated homepage
-            if request_line == "GET / HTTP/1.1":
-                status = "HTTP/1.1 200 OK"
-
-            method = request_line.split(" /", maxsplit=1)[0]
-
-            matched = False
-            for pattern, ptype in self.patterns:
-                result = re.search(pattern, request_line)
-                if result is None:
-                    continue
-                matched = True
-                if ptype == SINGLE:
-                    table = re.search(r"(\w+)/\d+", request_line).group(1)
-                    pk = re.search(r"\w+/(\w+)", request_line).group(1)
-                    pk_column = self.primary_keys[table]
-                    if method == GET:  # read item
-                        content = self.read_one(table, pk)
-                        response = util.create_http_response(
-                            content=content,
-                            headers={"Content-Type": "application/json"},
-                            code=200
-                        )
-                    elif method == PUT:  # modify item
-                        if headers.get('Content-Type') != "application/json":
-                            response = util.create_http_response(code=400)
-                        else:
-                            content = util.extract_json(request)
-                            success = self.db.update(table, data=content, where=f"{pk_column} = {pk}")
-                            status = 204 if success else 500
-                            response = util.create_http_response(code=status)
-                    elif method == DELETE:  # delete item
-                        success = self.db.execute(f"DELETE FROM {table} WHERE {pk_column} = ?;", pk,
-                                                  as_transaction=True)
-                        status = 200 if success else 500
-                        response = util.create_http_response(code=status)
+            client.settimeout(self.keep_alive_timeout)
+            reader = SocketReader(client)
+            idle = select.poll()
+            idle.register(client, select.POLLIN)
+            served = 0
+            self.metrics.connection(opened=True)
+            try:
+                while True:
+                    if not self.wait_for_request(reader, idle):
+                        return
+                    try:
+                        request = reader.read_request(self.max_body_size, stream=self.streams_body)
+                    except util.HTTPError as e:
+                        client.sendall(util.create_http_response(headers={"Connection": "close"}, code=e.code))
+                        # drain what the client is still sending, closing with unread
+                        # data would reset the connection before it read the error
+                        client.shutdown(socket.SHUT_WR)
+                        client.settimeout(1.0)
+                        deadline = time.monotonic() + 1.0
+                        while client.recv(util.MAX_HEADER_SIZE) and time.monotonic() < deadline:
+                            pass
+                        return
+                    if request is None:
+                        return
+                    served += 1
+                    keep_alive = util.wants_keep_alive(request) and served < self.max_requests and not self.draining
+                    if keep_alive and self.handlers is not None and self.handlers.saturated():
+                        keep_alive = False
+                    response = self.respond(request, keep_alive=keep_alive)
+                    if isinstance(request.body, util.BodyStream) and not request.body.drain():
+                        keep_alive = False
+                    start = time.perf_counter()
+                    if isinstance(response, bytes):
+                        client.sendall(response)
+                        sent, sending = len(response), time.perf_counter() - start
                     else:
-                        response = util.create_http_response(code=405)
-                else:
-                    table = result.group(0)
-                    if method == GET:  # return all
-                        content = self.read_all(table_name=table)
-                        response = util.create_http_response(
-                            content=content,
-                            headers={"Content-Type": "application/json"},
-                            code=200
-                        )
-                    elif method == POST:  # create new record
-                        if headers.get('Content-Type') != "application/json":
-                            response = util.create_http_response(code=400)
-                        else:
-                            content = util.extract_json(request)
-                            success = self.db.insert(table, data=content)
-                            status = 201 if success else 500
-                            response = util.create_http_response(code=status)
-                    else:
-                        response = util.create_http_response(code=405)
-
-                client.sendall(response)
-                break
+                        sent, sending = 0, 0.0
+                        try:
+                            for chunk in response:
+                                start = time.perf_counter()
+                                client.sendall(chunk)
+                                sent, sending = sent + len(chunk), sending + time.perf_counter() - start
+                        finally:
+                            response.close()
+                    if request.timing is not None:
+                        self.metrics.finish(request.timing, sent, sending)
+                    if not keep_alive:
+                        return
+            except (socket.timeout, ConnectionError):
+                return
+            finally:
+                self.metrics.connection(opened=False)
 
-            if not matched:
-                response = util.create_http_response(
-                    util.read_as_text(HOMEPAGE),
-                    code=404
-                )
-                client.sendall(response)
+    def wait_for_request(self, reader: SocketReader, idle: select.poll) -> bool:
+        """
+        waits up to the keep alive timeout for the next request of a connection,
+        while connections wait for a handler thread an idle one gives its thread up
+        within IDLE_POLL seconds instead of holding it until the timeout
+        :param reader: reader of the connection
+        :param idle: poll object the connection's socket is registered with
+        :return: whether there is something to read (False if it idled out)
+        """
+        if self.handlers is None or reader.pending():
+            return True  # the socket timeout bounds the wait
+        deadline = time.monotonic() + self.keep_alive_timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            if idle.poll(min(remaining, IDLE_POLL) * 1000):
+                return True
+            if self.handlers.saturated():
+                return False
 
-    def run(self, host: str = "localhost", port: int = 5000):
+    def run(self, host: str = "localhost", port: int = 5000, engine: str = THREAD, max_workers: int | None = None,
+            workers: int = 1, queue_size: int = admission.DEFAULT_QUEUE_SIZE, backlog: int | None = None):
         """
         server initializer and loop
         :param host: host for server (0.0.0.0 for IP addr)
         :param port: port to run server on
+        :param engine: "thread" to handle connections on a fixed pool of threads
+        or "async" to multiplex connections on a single event loop
+        :param max_workers: number of threads handling connections (thread engine,
+        default admission.DEFAULT_THREADS) or running database work (async engine,
+        default: ThreadPoolExecutor default)
+        :param workers: number of processes, more than one forks worker processes
+        sharing the port with SO_REUSEPORT under a supervisor (see prefork),
+        SIGHUP restarts them gracefully, SIGTERM stops them
+        :param queue_size: (thread engine only) number of accepted connections that can wait
+        for a handler thread, connections beyond it are answered with a 503
+        :param backlog: (optional) listen backlog, connections the kernel queues before they are accepted
         :return: None
         """
         if host == '0.0.0.0':
             host = socket.gethostbyname(socket.gethostname())
+        if engine not in (THREAD, ASYNC):
+            raise ValueError("unknown engine: {}".format(engine))
+        if workers > 1:
+            prefork.Supervisor(self, host, port, engine, workers, max_workers=max_workers,
+                               queue_size=queue_size, backlog=backlog).run()
+            return
+        if engine == ASYNC:
+            aio.run(self, host, port, max_workers=max_workers, backlog=backlog)
+            return
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
             server.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             server.bind((host, port))
-            server.listen()
+            server.listen(*(() if backlog is None else (backlog,)))
             print(f"🚀 server listening on http://{host}:{port}")
-            while 1:
+            self.serve(server, max_workers=max_workers, queue_size=queue_size)
+
+    def serve(self, server: socket.socket, stopping: threading.Event | None = None,
+              beat: Callable[[], None] | None = None, max_workers: int | None = None,
+              queue_size: int = admission.DEFAULT_QUEUE_SIZE) -> None:
+        """
+        accepts connections on a listening socket and queues them for a fixed
+        pool of handler threads, a connection that finds the queue full gets a 503
+        :param server: listening socket
+        :param stopping: (optional) event that stops accepting once set, the open
+        and queued connections are then served to the end before returning
+        :param beat: (optional) called on every turn of the accept loop, at least
+        every prefork.HEARTBEAT seconds, as a heartbeat for a supervisor
+        :param max_workers: number of handler threads (default admission.DEFAULT_THREADS)
+        :param queue_size: number of accepted connections that can wait for a handler thread
+        :return: None
+        """
+        self.handlers = admission.HandlerPool(
+            self.handle, threads=max_workers or admission.DEFAULT_THREADS, queue_size=queue_size,
+            name=CONNECTION_THREAD
+        )
+        if stopping is not None or beat is not None:
+            server.settimeout(prefork.HEARTBEAT)
+        try:
+            while stopping is None or not stopping.is_set():
+                if beat is not None:
+                    beat()
+                try:
+                    sock, addr = server.accept()
+                except socket.timeout:
+                    continue
+                self.admit(sock, addr)
+        except BaseException:
+            # e.g. KeyboardInterrupt, the open connections are not waited for
+            self.draining = True
+            server.close()
+            self.handlers.close(wait=False)
+            raise
+        self.draining = True
+        # closing a listening socket resets the connections still in its accept queue
+        server.setblocking(False)
+        while True:
+            try:
                 sock, addr = server.accept()
-                # self.handle(sock, addr)
-                thread = threading.Thread(target=self.handle, args=(sock, addr))
-                thread.start()
+            except (BlockingIOError, socket.timeout):
+                break
+            sock.setblocking(True)
+            self.admit(sock, addr)
+        server.close()
+        self.handlers.close()
+
+    def admit(self, client: socket.socket, addr: tuple) -> None:
+        """
+        queues an accepted connection for a handler thread or rejects it with a 503
+        :param client: client socket
+        :param addr: client addr
+        :return: None
+        """
+        if not self.handlers.submit(client, addr):
+            admission.reject(client)
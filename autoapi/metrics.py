@@ -0,0 +1,328 @@
+"""
+Oliver 2024
+
+request metrics in the Prometheus text format, every thread records
+into its own shard without taking a lock and the shards are summed
+when the metrics are scraped, so recording costs a few dictionary updates
+"""
+
+import bisect
+import threading
+import time
+import weakref
+from typing import Any, Dict, Hashable, Iterator, List, Sequence, Tuple
+
+# upper bounds of the latency histogram buckets in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# parse: reading the request and routing it, sql: running statements, send: writing
+# the response to the socket, serialize: the rest (handler work and encoding)
+PHASES = ("parse", "sql", "serialize", "send")
+CONTENT_TYPE = "text/plain; version=0.0.4"
+DESCRIPTIONS = {
+    "autoapi_requests_total": "requests served by route, method and status",
+    "autoapi_response_bytes_total": "bytes sent by route",
+    "autoapi_request_duration_seconds": "time from reading a request to sending its last byte",
+    "autoapi_request_phase_seconds": "time spent per phase of a request",
+    "autoapi_connections_in_flight": "open client connections",
+    "autoapi_queue_wait_seconds": "time an accepted connection waited for a handler thread",
+    "autoapi_queue_depth": "accepted connections waiting for a handler thread",
+    "autoapi_connections_rejected_total": "connections answered with a 503 because the queue was full",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# the requests of one route, method and status are recorded into one flat list: the number of
+# requests, the bytes sent, then per series (total duration and every phase) a count per bucket
+# (the last one is +Inf) followed by the sum, so recording a request is one lookup and a few additions
+REQUEST = "autoapi_request"
+SERIES = ("duration",) + PHASES
+_SPAN = len(BUCKETS) + 2
+_OFFSETS = tuple(2 + i * _SPAN for i in range(len(SERIES)))
+
+
+class RequestTiming:
+    __slots__ = ("received", "method", "route", "status", "parse", "sql")
+
+    def __init__(self, received: float, method: str):
+        """
+        phases of one request, filled in while it is handled
+        :param received: perf_counter time the request was read
+        :param method: HTTP method
+        """
+        self.received = received
+        self.method = method
+        self.route = "none"
+        self.status = 0
+        self.parse = 0.0
+        self.sql = 0.0
+
+
+def route_label(segments: Tuple[str, ...], code: int) -> str:
+    """
+    :param segments: segments of the routed path
+    :param code: status code of routing it
+    :return: route template of the path (e.g. /tracks/{pk}), none if it was not found
+    """
+    if code == 404 or not segments:
+        return "none"
+    return "/{}".format(segments[0]) if len(segments) == 1 else "/{}/{{pk}}".format(segments[0])
+
+
+def _expand_requests(values: Dict[Hashable, Any]) -> None:
+    """ replaces the request records of collected values with the metrics they hold """
+    for key in [k for k in values if k[0] == REQUEST]:
+        record = values.pop(key)
+        route, method, status = key[1]
+        requests = ("autoapi_requests_total", (("route", route), ("method", method), ("status", status)))
+        values[requests] = record[0]
+        _add(values, ("autoapi_response_bytes_total", (("route", route),)), record[1])
+        for series, offset in zip(SERIES, _OFFSETS):
+            histogram = record[offset:offset + _SPAN]
+            if series == "duration":
+                _add(values, ("autoapi_request_duration_seconds", (("route", route),)), histogram)
+            else:
+                _add(values, ("autoapi_request_phase_seconds", (("route", route), ("phase", series))), histogram)
+
+
+def _add(into: Dict[Hashable, Any], key: Hashable, value: Any) -> None:
+    current = into.get(key)
+    if current is None:
+        into[key] = list(value) if isinstance(value, list) else value
+    elif isinstance(value, list):
+        into[key] = [a + b for a, b in zip(current, value)]
+    else:
+        into[key] = current + value
+
+
+def _merge(into: Dict[Hashable, Any], shard: Dict[Hashable, Any]) -> None:
+    for key, value in list(shard.items()):
+        _add(into, key, value)
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+class Metrics:
+    def __init__(self, enabled: bool = True):
+        """
+        counters and latency histograms of the requests an app serves
+        :param enabled: flag of whether requests are recorded, can be flipped at runtime
+        """
+        self._enabled = enabled
+        # connections whose statements are timed while enabled
+        self._connections = []
+        self._local = threading.local()
+        # shards of live threads, and the merged shards of threads that ended
+        self._shards: List[Tuple[weakref.ref, Dict[Hashable, Any]]] = []
+        self._retired: Dict[Hashable, Any] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """ whether requests are recorded """
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, enabled: bool) -> None:
+        self._enabled = enabled
+        for db in self._connections:
+            if enabled and self.sql_observer not in db.observers:
+                db.observers.append(self.sql_observer)
+            elif not enabled and self.sql_observer in db.observers:
+                db.observers.remove(self.sql_observer)
+
+    def attach(self, connections) -> None:
+        """
+        times the statements of SQL connections while enabled
+        (while disabled they run without any observer)
+        :param connections: SQL connections
+        :return: None
+        """
+        self._connections.extend(connections)
+        self.enabled = self._enabled
+
+    def detach(self, connections) -> None:
+        """
+        stops timing the statements of SQL connections (e.g. before they are closed)
+        :param connections: SQL connections
+        :return: None
+        """
+        for db in connections:
+            if self.sql_observer in db.observers:
+                db.observers.remove(self.sql_observer)
+            if db in self._connections:
+                self._connections.remove(db)
+
+    def _shard(self) -> Dict[Hashable, Any]:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((weakref.ref(threading.current_thread()), shard))
+            return shard
+
+    def count(self, name: str, labels: Labels = (), amount: float = 1) -> None:
+        """
+        adds to a counter
+        :param name: metric name
+        :param labels: label name and value pairs
+        :param amount: amount to add
+        :return: None
+        """
+        shard = self._shard()
+        key = (name, labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def observe(self, name: str, labels: Labels, seconds: float) -> None:
+        """
+        records a duration in a histogram
+        :param name: metric name
+        :param labels: label name and value pairs
+        :param seconds: observed duration
+        :return: None
+        """
+        shard = self._shard()
+        key = (name, labels)
+        histogram = shard.get(key)
+        if histogram is None:
+            histogram = shard[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+        histogram[bisect.bisect_left(BUCKETS, seconds)] += 1
+        histogram[-1] += seconds
+
+    def start(self, request) -> RequestTiming | None:
+        """
+        :param request: parsed request
+        :return: timing of the request, None while the metrics are disabled
+        """
+        if not self.enabled:
+            return None
+        return RequestTiming(request.received, request.method)
+
+    def activate(self, timing: RequestTiming | None) -> None:
+        """
+        sets the request the statements run on this thread are counted to
+        :param timing: timing of the request (None to stop counting)
+        :return: None
+        """
+        self._local.current = timing
+
+    def sql_observer(self, statement: str, params: Sequence[Any] | None, seconds: float, rows: int) -> None:
+        """ SQL observer adding the time of a statement to the request active on the thread """
+        timing = getattr(self._local, "current", None)
+        if timing is not None:
+            timing.sql += seconds
+
+    def bind(self, timing: RequestTiming, chunks: Iterator[bytes]) -> Iterator[bytes]:
+        """
+        activates a request while each piece of its streamed
+        response is produced, on whichever thread produces it
+        :param timing: timing of the request
+        :param chunks: iterator of the response pieces
+        :return: iterator of the same pieces
+        """
+        local = self._local
+        while True:
+            local.current = timing
+            try:
+                chunk = next(chunks, None)
+            finally:
+                local.current = None
+            if chunk is None:
+                return
+            yield chunk
+
+    def finish(self, timing: RequestTiming, sent: int, send_seconds: float) -> None:
+        """
+        records a request once its response was sent
+        :param timing: timing of the request
+        :param sent: number of bytes sent
+        :param send_seconds: time spent writing to the socket
+        :return: None
+        """
+        total = time.perf_counter() - timing.received
+        serialize = max(0.0, total - timing.parse - timing.sql - send_seconds)
+        shard = self._shard()
+        key = (REQUEST, (timing.route, timing.method, str(timing.status)))
+        record = shard.get(key)
+        if record is None:
+            record = shard[key] = [0] * (2 + len(SERIES) * _SPAN)
+        record[0] += 1
+        record[1] += sent
+        for offset, seconds in zip(_OFFSETS, (total, timing.parse, timing.sql, serialize, send_seconds)):
+            record[offset + bisect.bisect_left(BUCKETS, seconds)] += 1
+            record[offset + _SPAN - 1] += seconds
+
+    def connection(self, opened: bool) -> None:
+        """
+        counts a client connection being opened or closed
+        :param opened: True when opened, False when closed
+        :return: None
+        """
+        self.count("autoapi_connections_opened_total" if opened else "autoapi_connections_closed_total")
+
+    def collect(self) -> Dict[Hashable, Any]:
+        """
+        :return: the shards of every thread summed, keyed by metric name and labels
+        """
+        with self._lock:
+            live = []
+            for ref, shard in self._shards:
+                thread = ref()
+                if thread is None or not thread.is_alive():
+                    _merge(self._retired, shard)
+                else:
+                    live.append((ref, shard))
+            self._shards = live
+            merged: Dict[Hashable, Any] = {}
+            _merge(merged, self._retired)
+        for _, shard in live:
+            _merge(merged, shard)
+        return merged
+
+    def render(self, gauges: Dict[Tuple[str, Labels], float] | None = None) -> str:
+        """
+        formats the metrics in the Prometheus text exposition format
+        :param gauges: (optional) extra values by name and labels, names
+        ending in _total are typed as counters, the others as gauges
+        :return: text of the metrics
+        """
+        values = self.collect()
+        _expand_requests(values)
+        opened = values.pop(("autoapi_connections_opened_total", ()), 0)
+        closed = values.pop(("autoapi_connections_closed_total", ()), 0)
+        values[("autoapi_connections_in_flight", ())] = opened - closed
+        values.update(gauges or {})
+        families: Dict[str, List[Tuple[Labels, Any]]] = {}
+        for (name, labels), value in values.items():
+            families.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name in sorted(families):
+            samples = sorted(families[name], key=lambda s: s[0])
+            if isinstance(samples[0][1], list):
+                kind = "histogram"
+            else:
+                kind = "counter" if name.endswith("_total") else "gauge"
+            if name in DESCRIPTIONS:
+                lines.append(f"# HELP {name} {DESCRIPTIONS[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                if kind != "histogram":
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), value[:-1]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value[-1])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
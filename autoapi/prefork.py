@@ -0,0 +1,302 @@
+"""
+Oliver 2024
+
+pre-fork server, a supervisor process forks worker processes that each
+bind the same port with SO_REUSEPORT (the kernel spreads the connections
+over them) and open their own database connections, so request parsing and
+encoding run on as many cores as there are workers, SQLite in WAL mode lets
+the readers of every worker run next to the one writer at a time
+
+the supervisor restarts workers that exit or stop beating, replaces them
+one by one on SIGHUP (graceful restart) and stops them on SIGTERM or SIGINT,
+a worker that is stopped closes its socket, serves its open connections to
+the end (without keeping them alive) and exits
+"""
+
+import asyncio
+import mmap
+import os
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+from . import admission, aio, util
+from .cache import TableVersions
+
+# seconds between the heartbeats of a worker's accept loop
+HEARTBEAT = 1.0
+_SLOT = struct.Struct("d")
+
+
+def listen(host: str, port: int, backlog: int | None = None) -> socket.socket:
+    """
+    :param host: host to bind
+    :param port: port to bind, shared with the other workers
+    :param backlog: (optional) listen backlog, the system default if None
+    :return: listening socket with SO_REUSEPORT set
+    """
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    server.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    server.bind((host, port))
+    server.listen(*(() if backlog is None else (backlog,)))
+    return server
+
+
+async def serve_async(app, server: socket.socket, max_workers: int | None, beat: Callable[[], None]) -> None:
+    """
+    asyncio engine of a worker, serves until SIGTERM and beats while its loop is responsive
+    :param app: App instance to route requests with
+    :param server: listening socket
+    :param max_workers: number of threads for database work
+    :param beat: records a heartbeat
+    :return: None
+    """
+    loop = asyncio.get_running_loop()
+    stopping = asyncio.Event()
+    loop.add_signal_handler(signal.SIGTERM, stopping.set)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="autoapi") as executor:
+        listener = await asyncio.start_server(
+            lambda r, w: aio.handle(app, executor, r, w), sock=server, limit=util.MAX_HEADER_SIZE
+        )
+        while not stopping.is_set():
+            beat()
+            try:
+                await asyncio.wait_for(stopping.wait(), HEARTBEAT)
+            except asyncio.TimeoutError:
+                pass
+        app.draining = True
+        # the server stops accepting and sets up the connections it accepted (a closed server
+        # drops them), then the listening socket is closed, which resets the connections still
+        # in its accept queue, so they are accepted first, nothing is awaited until it is closed
+        loop.remove_reader(server.fileno())
+        await asyncio.sleep(0)
+        accepted = []
+        while True:
+            try:
+                accepted.append(server.accept()[0])
+            except (BlockingIOError, socket.timeout):
+                break
+        listener.close()
+        drained = [loop.create_task(aio.handle_socket(app, executor, sock)) for sock in accepted]
+        # the loop may still be setting up connections it accepted, their tasks start later
+        while connections := asyncio.all_tasks() - {asyncio.current_task()} | set(drained):
+            await asyncio.wait(connections)
+            drained = []
+
+
+def work(app, host: str, port: int, engine: str, max_workers: int | None, queue_size: int,
+         backlog: int | None, beat: Callable[[], None]) -> None:
+    """
+    body of a worker process, returns once it was stopped and served its connections
+    :param app: App instance (without open connections)
+    :param host: host to bind
+    :param port: port to bind
+    :param engine: "thread" or "async"
+    :param max_workers: number of handler threads (thread engine) or threads for database work (async engine)
+    :param queue_size: (thread engine only) number of accepted connections that can wait for a handler thread
+    :param backlog: (optional) listen backlog
+    :param beat: records a heartbeat
+    :return: None
+    """
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the supervisor stops the workers
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    app.open()
+    try:
+        with listen(host, port, backlog) as server:
+            if engine == "async":
+                asyncio.run(serve_async(app, server, max_workers, beat))
+            else:
+                stopping = threading.Event()
+                signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+                app.serve(server, stopping=stopping, beat=beat, max_workers=max_workers, queue_size=queue_size)
+    finally:
+        app.close()
+
+
+class Supervisor:
+    def __init__(self, app, host: str, port: int, engine: str, workers: int, max_workers: int | None = None,
+                 queue_size: int = admission.DEFAULT_QUEUE_SIZE, backlog: int | None = None, graceful_timeout: float = 30.0, health_timeout: float = 10.0):
+        """
+        forks and supervises the worker processes of an app
+        :param app: App instance, its connections are closed before forking
+        :param host: host to bind
+        :param port: port to bind
+        :param engine: "thread" or "async"
+        :param workers: number of worker processes
+        :param max_workers: number of handler threads (thread engine) or threads for database work (async engine)
+        of every worker
+        :param queue_size: (thread engine only) number of accepted connections that can wait for a handler thread
+        :param backlog: (optional) listen backlog of every worker
+        :param graceful_timeout: seconds a stopped worker gets to finish its connections before it is killed
+        :param health_timeout: seconds without a heartbeat (or to start) before a worker is killed and replaced
+        """
+        if not hasattr(socket, "SO_REUSEPORT"):
+            raise RuntimeError("workers need SO_REUSEPORT, which this platform does not have")
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.app = app
+        self.host = host
+        self.port = port
+        self.engine = engine
+        self.workers = workers
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self.backlog = backlog
+        self.graceful_timeout = graceful_timeout
+        self.health_timeout = health_timeout
+        # one heartbeat slot per worker in shared memory, twice as many for the replacements of a restart
+        self._heartbeats = mmap.mmap(-1, _SLOT.size * workers * 2)
+        self._free = list(range(workers * 2))
+        # the workers bump the table versions in their slot, so they see each other's writes
+        app.versions = TableVersions(slots=workers * 2)
+        # pid -> slot and start time of the serving workers, pid -> kill deadline of the stopping ones
+        self._serving: Dict[int, tuple] = {}
+        self._stopping: Dict[int, float] = {}
+        self._restart = False
+        self._stop = False
+
+    def _beat(self, slot: int) -> Callable[[], None]:
+        heartbeats, offset = self._heartbeats, slot * _SLOT.size
+        return lambda: _SLOT.pack_into(heartbeats, offset, time.monotonic())
+
+    def _last_beat(self, slot: int) -> float:
+        return _SLOT.unpack_from(self._heartbeats, slot * _SLOT.size)[0]
+
+    def spawn(self) -> int:
+        """
+        forks a worker
+        :return: its pid
+        """
+        slot = self._free.pop()
+        _SLOT.pack_into(self._heartbeats, slot * _SLOT.size, 0.0)
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            self.app.versions.slot = slot
+            try:
+                work(self.app, self.host, self.port, self.engine, self.max_workers, self.queue_size, self.backlog,
+                     self._beat(slot))
+            except BaseException as e:
+                print(f"worker {os.getpid()} failed: {e!r}", file=sys.stderr)
+                code = 1
+            finally:
+                sys.stdout.flush()
+                os._exit(code)
+        self._serving[pid] = (slot, time.monotonic())
+        return pid
+
+    def stop_worker(self, pid: int) -> None:
+        """
+        asks a worker to stop (SIGTERM), it is killed if it did not exit within the graceful timeout
+        :param pid: pid of the worker
+        :return: None
+        """
+        slot, _ = self._serving.pop(pid)
+        self._free.append(slot)
+        self._stopping[pid] = time.monotonic() + self.graceful_timeout
+        self._signal(pid, signal.SIGTERM)
+
+    @staticmethod
+    def _signal(pid: int, signum: int) -> None:
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def ready(self, pid: int) -> bool:
+        """
+        :param pid: pid of a serving worker
+        :return: whether it is listening and beating
+        """
+        slot, _ = self._serving[pid]
+        beat = self._last_beat(slot)
+        return beat > 0 and time.monotonic() - beat < self.health_timeout
+
+    def reap(self) -> None:
+        """ collects the workers that exited, the serving ones are replaced """
+        while self._serving or self._stopping:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if self._stopping.pop(pid, None) is not None:
+                continue
+            if pid in self._serving:
+                slot, started = self._serving.pop(pid)
+                self._free.append(slot)
+                print(f"worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, restarting",
+                      file=sys.stderr)
+                if time.monotonic() - started < HEARTBEAT:
+                    time.sleep(HEARTBEAT)  # do not fork in a tight loop if workers fail on start
+                if not self._stop:
+                    self.spawn()
+
+    def check_health(self) -> None:
+        """ kills the serving workers that stopped beating (or never started), reap replaces them """
+        now = time.monotonic()
+        for pid, (slot, started) in list(self._serving.items()):
+            beat = self._last_beat(slot) or started
+            if now - beat > self.health_timeout:
+                print(f"worker {pid} missed its heartbeat for {now - beat:.1f}s, killing it", file=sys.stderr)
+                self._signal(pid, signal.SIGKILL)
+        for pid, deadline in self._stopping.items():
+            if now > deadline:
+                self._signal(pid, signal.SIGKILL)
+
+    def restart(self) -> None:
+        """
+        graceful restart, replaces the workers one at a time, each
+        old one is stopped once its replacement is ready
+        :return: None
+        """
+        for pid in list(self._serving):
+            replacement = self.spawn()
+            deadline = time.monotonic() + self.health_timeout
+            while time.monotonic() < deadline and replacement in self._serving and not self.ready(replacement):
+                time.sleep(0.05)
+                self.reap()
+            if replacement in self._serving and not self.ready(replacement):
+                print(f"worker {replacement} did not start, keeping worker {pid}", file=sys.stderr)
+                self.stop_worker(replacement)
+            elif pid in self._serving:
+                self.stop_worker(pid)
+
+    def run(self) -> None:
+        """
+        forks the workers and supervises them until SIGTERM or SIGINT
+        :return: None
+        """
+        self.app.close()  # sqlite connections must not be used across a fork
+        handlers = {signum: signal.getsignal(signum) for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP)}
+        signal.signal(signal.SIGTERM, lambda signum, frame: setattr(self, "_stop", True))
+        signal.signal(signal.SIGINT, lambda signum, frame: setattr(self, "_stop", True))
+        signal.signal(signal.SIGHUP, lambda signum, frame: setattr(self, "_restart", True))
+        try:
+            for _ in range(self.workers):
+                self.spawn()
+            print(f"🚀 server listening on http://{self.host}:{self.port} with {self.workers} workers")
+            while not self._stop:
+                if self._restart:
+                    self._restart = False
+                    self.restart()
+                time.sleep(0.1)
+                self.reap()
+                self.check_health()
+        finally:
+            for pid in list(self._serving):
+                self.stop_worker(pid)
+            while self._stopping:
+                time.sleep(0.05)
+                self.reap()
+                self.check_health()
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
@@ -0,0 +1,128 @@
+"""
+Oliver 2024
+
+filtering, projection and sorting of list requests, e.g.
+GET /tracks?fields=TrackId,Name&GenreId=eq:1&Milliseconds=gt:300000&sort=-Milliseconds
+compiled into a parameterized where clause over columns validated
+against the schema, so no request value ever becomes sql text
+"""
+
+from typing import List, Tuple
+from urllib.parse import parse_qsl
+
+from .sqrl.utils import quote_identifier
+
+# query parameters that are not column filters
+RESERVED = {"fields", "sort", "limit", "offset", "after"}
+# operator prefix of a filter value -> sql comparison
+OPERATORS = {
+    "eq": "=",
+    "ne": "!=",
+    "lt": "<",
+    "le": "<=",
+    "gt": ">",
+    "ge": ">=",
+    "like": "LIKE",
+}
+MAX_IN_VALUES = 500
+
+
+class QueryError(ValueError):
+    """ a list query that does not fit the table """
+
+
+class ListQuery:
+    def __init__(self,
+                 fields: List[str] | None = None,
+                 where: str | None = None,
+                 params: List[str] | None = None,
+                 order_by: List[Tuple[str, bool]] | None = None):
+        """
+        a compiled list query
+        :param fields: quoted columns to select (None for all)
+        :param where: where clause with ? placeholders (None for all rows)
+        :param params: values bound to the placeholders in order
+        :param order_by: list of quoted column and ascending flag pairs
+        """
+        self.fields = fields
+        self.where = where
+        self.params = params or []
+        self.order_by = order_by or []
+        # unquoted names of the filtered and sorted columns
+        self.filtered: List[str] = []
+        self.sorted: List[str] = []
+
+
+def compile_filter(column: str, value: str) -> Tuple[str, List[str]]:
+    """
+    compiles one filter parameter, a value without a known
+    operator prefix is compared for equality as a whole
+    :param column: validated column name
+    :param value: filter value, e.g. gt:10, in:1,2,3, null:true or Rock
+    :return: tuple of sql condition and its parameters
+    """
+    op, sep, operand = value.partition(':')
+    if not sep:
+        op, operand = "eq", value
+    if op in OPERATORS:
+        return "{} {} ?".format(quote_identifier(column), OPERATORS[op]), [operand]
+    if op == "in":
+        values = operand.split(',')
+        if len(values) > MAX_IN_VALUES:
+            raise QueryError("at most {} values for in:".format(MAX_IN_VALUES))
+        return "{} IN ({})".format(quote_identifier(column), ", ".join("?" * len(values))), values
+    if op == "null":
+        if operand not in ("true", "false"):
+            raise QueryError("null: takes true or false")
+        return "{} IS {}NULL".format(quote_identifier(column), "" if operand == "true" else "NOT "), []
+    return "{} = ?".format(quote_identifier(column)), [value]
+
+
+def parse(query: str, columns: List[str]) -> ListQuery:
+    """
+    parses the fields, sort and filter parameters of a list request,
+    filters on the same or different columns are combined with AND
+    :param query: raw query string (without the ?)
+    :param columns: columns of the table
+    :return: ListQuery
+    """
+    known = set(columns)
+    conditions, params = [], []
+    compiled = ListQuery()
+    for key, value in parse_qsl(query, keep_blank_values=True):
+        if key == "fields":
+            fields = [f for f in value.split(',') if f]
+            unknown = [f for f in fields if f not in known]
+            if unknown or not fields:
+                raise QueryError("unknown fields: {}".format(", ".join(unknown) or "(none)"))
+            compiled.fields = [quote_identifier(f) for f in dict.fromkeys(fields)]
+        elif key == "sort":
+            # a + decodes to a space in query strings
+            for name in (s.strip() for s in value.split(',') if s.strip()):
+                column = name.lstrip('+-')
+                if column not in known:
+                    raise QueryError("unknown sort column: {}".format(column))
+                compiled.order_by.append((quote_identifier(column), not name.startswith('-')))
+                compiled.sorted.append(column)
+        elif key in RESERVED:
+            continue
+        elif key in known:
+            condition, values = compile_filter(key, value)
+            conditions.append(condition)
+            params.extend(values)
+            compiled.filtered.append(key)
+        else:
+            raise QueryError("unknown column: {}".format(key))
+    if conditions:
+        compiled.where = " AND ".join(conditions)
+        compiled.params = params
+    return compiled
+
+
+def and_where(*conditions: str | None) -> str | None:
+    """
+    :param conditions: where conditions (None is skipped)
+    :return: the conditions joined with AND, None if there are none
+    """
+    conditions = [f"({c})" for c in conditions if c]
+    return " AND ".join(conditions) or None
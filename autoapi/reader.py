@@ -0,0 +1,180 @@
+"""
+Oliver 2024
+
+request reader for blocking sockets, reads headers into one
+preallocated buffer reused for every request on the connection
+and bodies straight from the socket into their own bytearray
+"""
+
+import socket
+from typing import Callable, Iterator
+
+from . import util
+
+
+class SocketReader:
+    def __init__(self, sock: socket.socket, buffer_size: int = util.MAX_HEADER_SIZE):
+        """
+        :param sock: connected client socket
+        :param buffer_size: size of the header buffer, also the largest head accepted
+        """
+        self.sock = sock
+        self.buffer = bytearray(buffer_size)
+        # bytes received but not consumed yet are buffer[start:end]
+        self.start = 0
+        self.end = 0
+
+    def pending(self) -> int:
+        """
+        :return: number of bytes received but not consumed yet (e.g. a pipelined request)
+        """
+        return self.end - self.start
+
+    def _fill(self) -> bool:
+        """
+        receives more bytes into the free end of the buffer,
+        moving the unconsumed bytes to the front first if needed
+        :return: False if the peer closed the connection
+        """
+        if self.start == self.end:
+            self.start = self.end = 0
+        elif self.end == len(self.buffer):
+            if self.start == 0:
+                raise util.HTTPError(400)  # head does not fit the buffer
+            pending = self.end - self.start
+            self.buffer[:pending] = self.buffer[self.start:self.end]
+            self.start, self.end = 0, pending
+        with memoryview(self.buffer) as view:
+            received = self.sock.recv_into(view[self.end:])
+        self.end += received
+        return received > 0
+
+    def read_until(self, delimiter: bytes) -> bytes | None:
+        """
+        reads up to and including a delimiter
+        :param delimiter: e.g. CRLF CRLF for the end of the headers
+        :return: bytes read, None if the connection closed before the delimiter
+        """
+        while True:
+            found = self.buffer.find(delimiter, self.start, self.end)
+            if found >= 0:
+                found += len(delimiter)
+                data = bytes(self.buffer[self.start:found])
+                self.start = found
+                return data
+            if not self._fill():
+                return None
+
+    def read_into(self, view: memoryview) -> None:
+        """
+        fills a buffer with the next bytes of the connection, the part
+        that is not buffered yet is received into it without a copy
+        :param view: writable memoryview to fill completely
+        :return: None
+        """
+        buffered = min(len(view), self.end - self.start)
+        view[:buffered] = self.buffer[self.start:self.start + buffered]
+        self.start += buffered
+        filled = buffered
+        while filled < len(view):
+            received = self.sock.recv_into(view[filled:])
+            if not received:
+                raise ConnectionError("connection closed mid body")
+            filled += received
+
+    def read_exactly(self, size: int) -> bytearray:
+        """
+        :param size: number of bytes
+        :return: the next size bytes of the connection
+        """
+        data = bytearray(size)
+        with memoryview(data) as view:
+            self.read_into(view)
+        return data
+
+    def iter_body(self, size: int) -> Iterator[bytes]:
+        """
+        reads the next size bytes of the connection piece by piece
+        through the header buffer, so a body of any size needs no more memory
+        :param size: number of bytes
+        :return: generator of the pieces
+        """
+        while size:
+            if self.start == self.end and not self._fill():
+                raise ConnectionError("connection closed mid body")
+            take = min(size, self.end - self.start)
+            yield bytes(self.buffer[self.start:self.start + take])
+            self.start += take
+            size -= take
+
+    def iter_chunked(self) -> Iterator[bytes]:
+        """
+        reads a Transfer-Encoding: chunked body piece by piece
+        :return: generator of the pieces without the chunk framing
+        """
+        while True:
+            line = self.read_until(b"\r\n")
+            if line is None:
+                raise ConnectionError("connection closed mid body")
+            size = util.parse_chunk_size(line)
+            if size == 0:
+                break
+            yield from self.iter_body(size)
+            if self.read_exactly(2) != b"\r\n":
+                raise util.HTTPError(400)
+        while (line := self.read_until(b"\r\n")) not in (None, b"\r\n"):
+            pass
+
+    def read_chunked(self, max_body_size: int) -> bytearray:
+        """
+        reads a Transfer-Encoding: chunked body
+        :param max_body_size: largest body accepted
+        :return: the body without its chunk framing
+        """
+        body = bytearray()
+        while True:
+            line = self.read_until(b"\r\n")
+            if line is None:
+                raise ConnectionError("connection closed mid body")
+            size = util.parse_chunk_size(line)
+            if size == 0:
+                break
+            if len(body) + size > max_body_size:
+                raise util.HTTPError(413)
+            offset = len(body)
+            body.extend(bytes(size))
+            with memoryview(body) as view:
+                self.read_into(view[offset:])
+            if self.read_exactly(2) != b"\r\n":
+                raise util.HTTPError(400)
+        # skip trailer fields up to the final empty line
+        while (line := self.read_until(b"\r\n")) not in (None, b"\r\n"):
+            pass
+        return body
+
+    def read_request(self, max_body_size: int,
+                     stream: Callable[[util.Request], bool] | None = None) -> util.Request | None:
+        """
+        reads the next request (head and body) of the connection
+        :param max_body_size: largest body accepted
+        :param stream: (optional) predicate of whether the body of a request is not
+        read up front but left as a BodyStream the handler reads from the connection,
+        which must be drained before the next request is read
+        :return: Request or None if the connection closed between requests
+        """
+        head = self.read_until(b"\r\n\r\n")
+        if head is None:
+            return None
+        request = util.parse_request(head)
+        if request is None:
+            raise util.HTTPError(400)
+        if stream is not None and stream(request):
+            length = util.body_length(request, None)
+            request.body = util.BodyStream(self.iter_chunked() if length == util.CHUNKED else self.iter_body(length))
+            return request
+        length = util.body_length(request, max_body_size)
+        if length == util.CHUNKED:
+            request.body = self.read_chunked(max_body_size)
+        elif length:
+            request.body = self.read_exactly(length)
+        return request
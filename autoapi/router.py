@@ -0,0 +1,63 @@
+"""
+Oliver 2024
+
+dictionary based request router, a request path is split
+once and dispatched with a single lookup on the table name
+no matter how many tables the database has
+"""
+
+from typing import Callable, Dict, Iterator, Tuple
+
+SINGLE = 0
+ALL = 1
+
+Handler = Callable[..., Tuple[int, str | bytes | Iterator[bytes], Dict[str, str]]]
+
+
+def split_path(path: str) -> Tuple[str, ...]:
+    """
+    splits a request path into its segments, ignoring
+    leading and trailing slashes
+    :param path: request path (e.g. /artists/1)
+    :return: tuple of path segments (e.g. ('artists', '1'))
+    """
+    path = path.strip('/')
+    return tuple(path.split('/')) if path else ()
+
+
+class Router:
+    def __init__(self):
+        # table name -> route kind (SINGLE/ALL) -> method -> handler
+        self.routes: Dict[str, Dict[int, Dict[str, Handler]]] = {}
+
+    def add(self, table: str, kind: int, method: str, handler: Handler) -> None:
+        """
+        registers a handler for a method on the /<table> (ALL)
+        or /<table>/<pk> (SINGLE) route of a table
+        :param table: name of table
+        :param kind: SINGLE or ALL
+        :param method: HTTP method
+        :param handler: callable receiving the request (and pk for SINGLE routes)
+        :return: None
+        """
+        self.routes.setdefault(table, {SINGLE: {}, ALL: {}})[kind][method] = handler
+
+    def resolve(self, method: str, path: str) -> Tuple[int, Handler | None, Tuple[str, ...]]:
+        """
+        finds the handler for a request
+        :param method: HTTP method
+        :param path: request path without query string
+        :return: tuple of status code (200 if found, else 404 or 405),
+        the handler (or None) and the positional path arguments for it
+        """
+        segments = split_path(path)
+        if not segments or len(segments) > 2:
+            return 404, None, ()
+        table = self.routes.get(segments[0])
+        if table is None:
+            return 404, None, ()
+        kind = ALL if len(segments) == 1 else SINGLE
+        handler = table[kind].get(method)
+        if handler is None:
+            return 405, None, ()
+        return 200, handler, segments[1:]
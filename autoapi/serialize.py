@@ -0,0 +1,113 @@
+"""
+Oliver 2024
+
+encoding of row tuples into json bytes, orjson is used when it is installed
+(it is given a dict per row) and the stdlib json module otherwise (set
+BACKEND = "json" to force it), which formats the values of a row into the
+column name prefixes of its query, built once and cached, without a dict,
+both write compact json in UTF-8 with NaN and infinities as null, only the
+notation of some floats differs (1e-05 against 0.00001, 1e+16 against 1e16)
+"""
+
+import functools
+import json
+from json.encoder import encode_basestring
+from typing import Any, Callable, Dict, Iterable, Tuple
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib encoder is used without it
+    orjson = None
+
+ORJSON = "orjson"
+STDLIB = "json"
+BACKEND = ORJSON if orjson is not None else STDLIB
+
+# json has no NaN or infinities, orjson writes them as null
+_SPECIAL_FLOATS = {"nan": "null", "inf": "null", "-inf": "null"}
+
+
+def _encode_float(value: float) -> str:
+    text = float.__repr__(value)
+    return _SPECIAL_FLOATS.get(text, text)
+
+
+# encoders of the types sqlite returns, in the output of orjson.dumps
+_VALUE_ENCODERS: Dict[type, Callable[[Any], str]] = {
+    int: int.__repr__,
+    float: _encode_float,
+    str: encode_basestring,
+    type(None): lambda value: "null",
+    bool: lambda value: "true" if value else "false",
+}
+
+
+class RowEncoder:
+    def __init__(self, columns: Tuple[str, ...], backend: str = BACKEND):
+        """
+        encodes rows of one query as json objects
+        :param columns: column names of the query
+        :param backend: "orjson" or "json" (stdlib)
+        """
+        if backend == ORJSON and orjson is None:
+            raise ValueError("orjson is not installed")
+        self.columns = columns
+        self.backend = backend
+        # {"col1":%s,"col2":%s}, the keys are encoded once per query
+        self.template = "{" + ",".join(encode_basestring(c).replace("%", "%%") + ":%s" for c in columns) + "}"
+
+    def _object(self, row: Tuple) -> str:
+        try:
+            return self.template % tuple([_VALUE_ENCODERS[type(v)](v) for v in row])
+        except KeyError:  # any other type (e.g. a blob) gets the stdlib's handling
+            return json.dumps(dict(zip(self.columns, row)), separators=(",", ":"), ensure_ascii=False)
+
+    def object(self, row: Tuple) -> bytes:
+        """
+        :param row: row tuple
+        :return: json object of the row
+        """
+        if self.backend == ORJSON:
+            return orjson.dumps(dict(zip(self.columns, row)))
+        return self._object(row).encode("utf-8")
+
+    def objects(self, rows: Iterable[Tuple]) -> bytes:
+        """
+        :param rows: row tuples
+        :return: comma separated json objects of the rows (an array without its brackets)
+        """
+        if self.backend == ORJSON:
+            return orjson.dumps([dict(zip(self.columns, row)) for row in rows])[1:-1]
+        return ",".join([self._object(row) for row in rows]).encode("utf-8")
+
+    def array(self, rows: Iterable[Tuple]) -> bytes:
+        """
+        :param rows: row tuples
+        :return: json array of objects of the rows
+        """
+        if self.backend == ORJSON:
+            return orjson.dumps([dict(zip(self.columns, row)) for row in rows])
+        return b"[" + self.objects(rows) + b"]"
+
+    def lines(self, rows: Iterable[Tuple]) -> bytes:
+        """
+        :param rows: row tuples
+        :return: newline delimited json objects of the rows
+        """
+        if self.backend == ORJSON:
+            return b"".join([orjson.dumps(dict(zip(self.columns, row))) + b"\n" for row in rows])
+        return "".join([self._object(row) + "\n" for row in rows]).encode("utf-8")
+
+
+@functools.lru_cache(maxsize=256)
+def _cached_encoder(columns: Tuple[str, ...], backend: str) -> RowEncoder:
+    return RowEncoder(columns, backend)
+
+
+def encoder_for(columns: Tuple[str, ...], backend: str | None = None) -> RowEncoder:
+    """
+    :param columns: column names of a query
+    :param backend: "orjson" or "json" (stdlib), default: the module's BACKEND
+    :return: the cached RowEncoder of the columns
+    """
+    return _cached_encoder(columns, backend or BACKEND)
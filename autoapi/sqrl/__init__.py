@@ -2,7 +2,11 @@
 Oliver 2024
 """
 
+from .advisor import IndexAdvisor
 from .core import SQL
+from .pool import ConnectionPool, PoolTimeout
+from .profiler import QueryProfiler
+from .writer import BatchWriter
 
-__all__ = ["SQL"]
+__all__ = ["SQL", "ConnectionPool", "PoolTimeout", "BatchWriter", "IndexAdvisor", "QueryProfiler"]
 __version__ = "1.0.0"
@@ -0,0 +1,145 @@
+"""
+Oliver 2024
+"""
+
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+from .pool import ConnectionPool, PoolTimeout
+from .utils import quote_identifier
+
+
+def needs_index(plan: List[str], table: str, filtered: bool = True) -> bool:
+    """
+    :param plan: detail lines of EXPLAIN QUERY PLAN
+    :param table: name of the queried table
+    :param filtered: whether the query has a where clause (a full scan is expected without one)
+    :return: whether the plan scans the whole table to filter it or sorts it in a temp b-tree
+    """
+    for detail in plan:
+        if filtered and detail.startswith(f"SCAN {table}") and "INDEX" not in detail:
+            return True
+        if "USE TEMP B-TREE FOR ORDER BY" in detail:
+            return True
+    return False
+
+
+class IndexAdvisor:
+    def __init__(self,
+                 pool: ConnectionPool,
+                 create: bool = False,
+                 min_uses: int = 10,
+                 interval: float = 10.0,
+                 optimize_interval: float | None = None):
+        """
+        records which columns the queries of each table filter and sort by,
+        and on a background thread explains the frequent ones (EXPLAIN QUERY PLAN)
+        and suggests an index for those that scan their table, creating it
+        if create is set, the thread also refreshes the planner statistics
+        (ANALYZE) every optimize_interval seconds
+        :param pool: connection pool to explain on (readers) and create indexes with (writer)
+        :param create: flag of whether to create the suggested indexes
+        :param min_uses: number of uses before the plan of a column combination is checked
+        :param interval: seconds between checks of the recorded queries
+        :param optimize_interval: (optional) seconds between statistics refreshes
+        """
+        self.pool = pool
+        self.create = create
+        self.min_uses = min_uses
+        self.interval = interval
+        self.optimize_interval = optimize_interval
+        # (table, columns) -> number of uses, and latest statement, parameters and filter flag
+        self._uses: Dict[Tuple[str, Tuple[str, ...]], int] = {}
+        self._pending: Dict[Tuple[str, Tuple[str, ...]], Tuple[str, List[Any], bool]] = {}
+        self._suggestions: Dict[Tuple[str, Tuple[str, ...]], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._last_optimize = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="autoapi-advisor", daemon=True)
+        self._thread.start()
+
+    def record(self, table: str, filtered: List[str], sorted: List[str], statement: str, params: List[Any]) -> None:
+        """
+        counts a query (cheap, called per request)
+        :param table: name of the queried table
+        :param filtered: columns the query filters by
+        :param sorted: columns the query sorts by
+        :param statement: sql statement of the query
+        :param params: its parameter values
+        :return: None
+        """
+        if not filtered and not sorted:
+            return
+        key = (table, tuple(dict.fromkeys(filtered + sorted)))
+        with self._lock:
+            self._uses[key] = self._uses.get(key, 0) + 1
+            if key not in self._suggestions:
+                self._pending[key] = (statement, list(params), bool(filtered))
+
+    def check(self) -> None:
+        """
+        explains the recorded queries used at least min_uses
+        times that were not checked yet
+        :return: None
+        """
+        with self._lock:
+            due = {k: v for k, v in self._pending.items() if self._uses[k] >= self.min_uses}
+            for key in due:
+                del self._pending[key]
+        for (table, columns), (statement, params, filtered) in due.items():
+            with self.pool.reader() as db:
+                plan = db.fetch("EXPLAIN QUERY PLAN " + statement, *params)
+            plan = [row[3] for row in plan or []]
+            suggestion = {
+                "table": table,
+                "columns": list(columns),
+                "plan": plan,
+                "index": None,
+                "created": False,
+            }
+            if needs_index(plan, table, filtered):
+                name = "idx_auto_{}_{}".format(table, "_".join(columns))
+                suggestion["index"] = "CREATE INDEX IF NOT EXISTS {} ON {} ({});".format(
+                    quote_identifier(name), quote_identifier(table), ", ".join(quote_identifier(c) for c in columns)
+                )
+                if self.create:
+                    with self.pool.writer() as db:
+                        suggestion["created"] = bool(db.execute(suggestion["index"]))
+            with self._lock:
+                self._suggestions[(table, columns)] = suggestion
+
+    def optimize(self) -> None:
+        """
+        refreshes the statistics the query planner chooses indexes by,
+        bounded per index by analysis_limit so it stays cheap on large tables
+        :return: None
+        """
+        with self.pool.writer() as db:
+            db.executescript("PRAGMA analysis_limit = 1000; ANALYZE; PRAGMA optimize;")
+        self._last_optimize = time.monotonic()
+
+    def suggestions(self) -> List[Dict[str, Any]]:
+        """
+        :return: the checked column combinations with their number of uses, query plan,
+        the index statement that would avoid their scan (None if the plan uses an index)
+        and whether it was created
+        """
+        with self._lock:
+            return [dict(s, uses=self._uses[key]) for key, s in self._suggestions.items()]
+
+    def _run(self) -> None:
+        wait = min(self.interval, self.optimize_interval or self.interval)
+        while not self._stop.wait(wait):
+            try:
+                self.check()
+                if self.optimize_interval is not None and \
+                        time.monotonic() - self._last_optimize >= self.optimize_interval:
+                    self.optimize()
+            except PoolTimeout:
+                continue  # busy, try again on the next round
+
+    def close(self) -> None:
+        """ stops the background thread """
+        self._stop.set()
+        self._thread.join()
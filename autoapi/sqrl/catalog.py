@@ -0,0 +1,83 @@
+"""
+Oliver 2024
+"""
+
+import sqlite3 as sqlite
+from typing import Dict, List, Set
+
+# every column of every table in one query, in table and column order
+COLUMNS_SQL = """
+SELECT m.name, p.name, p.pk
+FROM sqlite_master AS m JOIN pragma_table_info(m.name) AS p
+WHERE m.type = 'table'
+ORDER BY m.name, p.cid;
+"""
+FOREIGN_KEYS_SQL = """
+SELECT DISTINCT m.name, f."table"
+FROM sqlite_master AS m JOIN pragma_foreign_key_list(m.name) AS f
+WHERE m.type = 'table';
+"""
+TRIGGERS_SQL = "SELECT DISTINCT tbl_name FROM sqlite_master WHERE type = 'trigger';"
+
+
+class Catalog:
+    def __init__(self,
+                 version: int,
+                 columns: Dict[str, List[str]],
+                 primary_keys: Dict[str, List[str]],
+                 references: Dict[str, Set[str]],
+                 triggers: Set[str]):
+        """
+        snapshot of the schema of a database, never changed after
+        it was built, a schema change builds a new one instead
+        :param version: PRAGMA schema_version the snapshot was read at
+        :param columns: table name -> column names in order
+        :param primary_keys: table name -> primary key column names in key order
+        :param references: table name -> names of the tables its foreign keys reference
+        :param triggers: names of the tables with triggers
+        """
+        self.version = version
+        self.columns = columns
+        self.primary_keys = primary_keys
+        self.references = references
+        self.triggers = triggers
+
+    @property
+    def tables(self) -> List[str]:
+        """
+        :return: table names in order (including sqlite's internal tables)
+        """
+        return list(self.columns)
+
+
+def schema_version(con: sqlite.Connection) -> int:
+    """
+    :param con: database connection
+    :return: PRAGMA schema_version, which every schema change increments
+    """
+    return con.execute("PRAGMA schema_version;").fetchone()[0]
+
+
+def load_catalog(con: sqlite.Connection) -> Catalog:
+    """
+    reads the whole schema in three queries, retried if
+    the schema changed while it was being read
+    :param con: database connection
+    :return: Catalog
+    """
+    while True:
+        version = schema_version(con)
+        columns: Dict[str, List[str]] = {}
+        keys: Dict[str, List[tuple]] = {}
+        for table, column, pk in con.execute(COLUMNS_SQL):
+            columns.setdefault(table, []).append(column)
+            if pk:
+                keys.setdefault(table, []).append((pk, column))
+        references: Dict[str, Set[str]] = {}
+        for table, referenced in con.execute(FOREIGN_KEYS_SQL):
+            references.setdefault(table, set()).add(referenced)
+        triggers = {row[0] for row in con.execute(TRIGGERS_SQL)}
+        if schema_version(con) == version:
+            break
+    primary_keys = {t: [c for _, c in sorted(keys.get(t, []))] for t in columns}
+    return Catalog(version, columns, primary_keys, references, triggers)
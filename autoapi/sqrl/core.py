@@ -3,15 +3,114 @@ Oliver 2024
 """
 
 import csv as _csv
-import json
+import functools
+import itertools
 import os.path as _op
 import re
 import sqlite3 as sqlite
-from typing import Dict, List, Any, Tuple, Callable
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Any, Tuple, Callable, Iterable, Iterator, Sequence
+from urllib.parse import quote as _quote
 
 from . import utils
+from .catalog import Catalog, load_catalog, schema_version
+from .profiler import QueryProfiler
 
 IN_MEMORY = ":memory:"
+STATEMENT_CACHE_SIZE = 1024
+MIB = 1024 * 1024
+
+# named connection settings, every key but immutable is a pragma
+# (cache_size is in KiB when negative, busy_timeout in milliseconds)
+PROFILES: Dict[str, Dict[str, Any]] = {
+    # large page cache and memory map for lookups and scans
+    "read-heavy": {
+        "mmap_size": 256 * MIB,
+        "cache_size": -64 * 1024,
+        "temp_store": "memory",
+        "busy_timeout": 5000,
+        "wal_autocheckpoint": 1000,
+    },
+    # fewer, larger checkpoints and a longer wait for the write lock
+    "write-heavy": {
+        "mmap_size": 64 * MIB,
+        "cache_size": -32 * 1024,
+        "temp_store": "memory",
+        "synchronous": "normal",
+        "busy_timeout": 10000,
+        "wal_autocheckpoint": 4000,
+    },
+    # no fsync, a crash during the load can lose the rows loaded so far
+    "bulk-load": {
+        "cache_size": -256 * 1024,
+        "temp_store": "memory",
+        "synchronous": "off",
+        "busy_timeout": 30000,
+        "wal_autocheckpoint": 20000,
+    },
+    # read-heavy with immutable read only connections, which skip locking and change
+    # detection entirely, only for database files nothing (not even the api) writes to
+    "read-only": {
+        "mmap_size": 256 * MIB,
+        "cache_size": -64 * 1024,
+        "temp_store": "memory",
+        "immutable": True,
+    },
+}
+
+
+@functools.lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def _select_sql(table_name: str,
+                columns: Tuple[str, ...] | None,
+                distinct: bool,
+                where: str | None,
+                order_by: str | Tuple[Tuple[str, bool], ...] | None,
+                asc: bool,
+                group_by: str | None,
+                having: str | None,
+                paged: bool) -> str:
+    # format columns
+    if columns:
+        col_list = ",".join(columns)
+    else:
+        col_list = "*"
+
+    # build select statement
+    core = f"SELECT {'DISTINCT ' if distinct else ''}{col_list} FROM {table_name}"
+    where_chunk = '' if not where else f' WHERE {where}'
+    group_by_chunk = '' if not group_by else f' GROUP BY {group_by}'
+    having_chunk = '' if not having else f' HAVING {having}'
+    if isinstance(order_by, tuple):
+        order_by_chunk = '' if not order_by else " ORDER BY " + ", ".join(
+            f"{column} {'ASC' if ascending else 'DESC'}" for column, ascending in order_by
+        )
+    else:
+        order_by_chunk = '' if not order_by else f" ORDER BY {order_by} {'ASC' if asc else 'DESC'}"
+    # limit and offset are bound, every page of a query shares one statement
+    limit_offset_chunk = " LIMIT ? OFFSET ?;" if paged else ";"
+
+    return ''.join([core, where_chunk, group_by_chunk, having_chunk, order_by_chunk, limit_offset_chunk])
+
+
+@functools.lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def _insert_sql(table_name: str, columns: Tuple[str, ...], replace: bool, returning: str | None) -> str:
+    core = "INSERT INTO" if not replace else "INSERT OR REPLACE INTO"
+    col_list = ','.join(utils.quote_identifier(c) for c in columns)
+    val_list = ','.join(['?' for _ in columns])
+    return f"{core} {table_name} ({col_list}) VALUES ({val_list}){' RETURNING %s' % returning if returning else ''};"
+
+
+@functools.lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def _update_sql(table_name: str, columns: Tuple[str, ...], where: str, returning: str | None) -> str:
+    params = ', '.join([f"{utils.quote_identifier(c)} = ?" for c in columns])
+    return f"UPDATE {table_name} SET {params} WHERE {where}{' RETURNING %s' % returning if returning else ''};"
+
+
+@functools.lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def _delete_sql(table_name: str, where: str, returning: str | None) -> str:
+    return f"DELETE FROM {table_name} WHERE {where}{' RETURNING %s' % returning if returning else ''};"
 
 
 def echo_callback(stmt):
@@ -33,7 +132,9 @@ class SQL:
             check_same_thread: bool = True,
             cached_statements: int = 128,
             optimize: bool = True,
-            foreign_keys: bool = True
+            foreign_keys: bool = True,
+            read_only: bool = False,
+            profile: str | Dict[str, Any] | None = None
     ):
         """
         :param filename: path to database file
@@ -45,39 +146,100 @@ class SQL:
         :param cached_statements:he number of statements that sqlite3 should internally cache for this connection, to avoid parsing overhead. By default, 128 statements.
         :param optimize: set journal mode to write ahead log and other optimizations (on by default)
         :param foreign_keys: enables foreign key flag (on by default)
+        :param read_only: open the database file in read only mode (off by default)
+        :param profile: (optional) name of a performance profile in PROFILES ("read-heavy", "write-heavy",
+        "bulk-load" or "read-only") or a dictionary of pragma settings, applied after the optimizations
         """
+        if isinstance(profile, str):
+            if profile not in PROFILES:
+                raise ValueError("unknown profile {}, expected one of {}".format(profile, ", ".join(PROFILES)))
+            settings = PROFILES[profile]
+        else:
+            settings = profile or {}
         self.file: str = filename
+        self.read_only: bool = read_only and filename != IN_MEMORY
+        # callables receiving every statement run, its parameters, the seconds
+        # it took and the number of rows it returned or changed (-1 if it failed)
+        self.observers: List[Callable[[str, Sequence[Any] | None, float, int], None]] = []
+        self.profiler: QueryProfiler | None = None
+        immutable = self.read_only and settings.get("immutable", False)
         self.con: sqlite.Connection = sqlite.connect(
-            filename,
+            "file:{}?mode=ro{}".format(_quote(_op.abspath(filename)), "&immutable=1" if immutable else "")
+            if self.read_only else filename,
             timeout=timeout,
             detect_types=detect_types,
             isolation_level=isolation_level,
             check_same_thread=check_same_thread,
             cached_statements=cached_statements,
+            uri=self.read_only,
         )
         if echo:
             self.con.set_trace_callback(echo_callback)
         if foreign_keys:
             self.execute("pragma foreign_keys = on;")
-        if optimize and self.file != IN_MEMORY:
+        if optimize and self.file != IN_MEMORY and not self.read_only:
             # enabled write ahead log journal mode if not already enabled
             journal_mode = self.fetch("pragma journal_mode;", one=True)
             if journal_mode != 'wal':
                 self.executescript(
                     "pragma journal_mode = WAL; pragma synchronous = normal; pragma journal_size_limit = 6144000;"
                 )
+        if settings:
+            self.apply_profile(settings)
 
         self.schema: Dict[str, List[str]] = {}
+        self._catalog: Catalog | None = None
+
+    def apply_profile(self, settings: Dict[str, Any]) -> None:
+        """
+        sets the pragmas of a performance profile on this connection
+        (the immutable flag only applies when the connection is opened)
+        :param settings: dictionary of pragma names and values, e.g. PROFILES["read-heavy"]
+        :return: None
+        """
+        pragmas = {k: v for k, v in settings.items() if k != "immutable"}
+        invalid = [k for k, v in pragmas.items() if not re.fullmatch(r"[a-z_]+", k) or not re.fullmatch(r"-?\w+", str(v))]
+        if invalid:
+            raise ValueError("invalid pragma settings: {}".format(", ".join(invalid)))
+        self.executescript("".join(f"pragma {pragma} = {value};" for pragma, value in pragmas.items()))
+
+    def catalog(self) -> Catalog:
+        """
+        returns the schema of the database, read in one pass and
+        kept until PRAGMA schema_version shows that it changed
+        :return: Catalog
+        """
+        try:
+            if self._catalog is None or self._catalog.version != schema_version(self.con):
+                self._catalog = load_catalog(self.con)
+        except sqlite.Error:
+            if self._catalog is None:
+                return Catalog(-1, {}, {}, {}, set())
+        return self._catalog
+
+    def check_columns(self, table_name: str, columns: Iterable[str]) -> None:
+        """
+        raises a ValueError unless every column is a column of the table, so names
+        from outside never reach the statement text (or the statement caches),
+        the cached catalog is read again only when a name is missing from it
+        :param table_name: name of table in database
+        :param columns: column names
+        :return: None
+        """
+        catalog = self._catalog or self.catalog()
+        unknown = [c for c in columns if c not in catalog.columns.get(table_name, ())]
+        if unknown:
+            catalog = self.catalog()
+            unknown = [c for c in unknown if c not in catalog.columns.get(table_name, ())]
+        if unknown:
+            raise ValueError("unknown columns: {}".format(", ".join(unknown)))
 
     def get_table_names(self) -> List[str]:
         """
         returns a list of all table names in the database
         :return: list of strings of table names
         """
-        tables = self.fetch(
-            "SELECT name FROM sqlite_master WHERE type='table' ORDER BY name;"
-        )
-        return tables
+        return self.catalog().tables
 
     def get_column_names(self, table_name: str) -> List[str]:
         """
@@ -85,8 +247,7 @@ class SQL:
         :param table_name: name of table in database
         :return: list of strings
         """
-        columns = self.fetch("PRAGMA table_info({});".format(table_name))
-        return [col[1] for col in columns]
+        return list(self.catalog().columns.get(table_name, []))
 
     def build_schema(self) -> None:
         """
@@ -97,17 +258,35 @@ class SQL:
         :return: None
         """
         self.schema.clear()
+        self.schema.update({t: list(c) for t, c in self.catalog().columns.items()})
 
-        for table in self.get_table_names():
-            table_name = table
-            # get all of the current tables columns
-            self.schema[table_name] = self.get_column_names(table_name)
+    def build_select(self, table_name: str,
+                     columns: List[str] | None = None,
+                     distinct: bool = False,
+                     where: str | None = None,
+                     order_by: str | List[Tuple[str, bool]] | None = None,
+                     asc: bool = True,
+                     group_by: str | None = None,
+                     having: str | None = None,
+                     paged: bool = False) -> str:
+        """
+        builds the statement text of a select (memoized, the same
+        arguments give the same text, which sqlite3 prepares only once),
+        see select for the parameters
+        :param paged: ends the statement with LIMIT ? OFFSET ?, the limit
+        and offset are bound after the parameters of where and having
+        :return: sql statement
+        """
+        if isinstance(order_by, list):
+            order_by = tuple(order_by)
+        return _select_sql(table_name, tuple(columns) if columns else None, distinct, where,
+                           order_by, asc, group_by, having, paged)
 
     def select(self, table_name: str,
                columns: List[str] | None = None,
                distinct: bool = False,
                where: str | None = None,
-               order_by: str | None = None,
+               order_by: str | List[Tuple[str, bool]] | None = None,
                asc: bool = True,
                group_by: str | None = None,
                having: str | None = None,
@@ -115,6 +294,7 @@ class SQL:
                offset: int = 0,
                fetch: None | int = None,
                return_as_dict: bool = False,
+               params: Iterable[Any] = (),
                ) -> List[Dict[str, Any]] | Dict[str, Any] | List[Tuple[Any]] | List[sqlite.Row] | sqlite.Row | Tuple[
         Any]:
         """
@@ -125,8 +305,9 @@ class SQL:
         :param table_name: name of the table to select from
         :param columns: (optional) columns to return in selection, if None then all
         :param distinct: flag whether to select distinct columns
-        :param where: (optional) where conditional string statement
-        :param order_by: (optional) column name to order results by
+        :param where: (optional) where conditional string statement, with ? placeholders for params
+        :param order_by: (optional) column name to order results by,
+        or a list of column name and ascending flag pairs
         :param asc: flag of where to order in ascending or descending fashion (default: True)
         :param group_by: (optional) group by clause string
         :param having: (optional) having clause string
@@ -135,25 +316,12 @@ class SQL:
         :param fetch: number of items to fetch from return (default: None/all)
         :param row_factory: return a dict converitable rows or set to None to return tuples
         :param return_as_dict: returns already converted to dictionayr object
+        :param params: (optional) values bound to the placeholders of where (and having)
         :return: list of items from select
         """
-        # format columns
-        if columns:
-            col_list = ",".join(columns)
-        else:
-            col_list = "*"
+        stmt = self.build_select(table_name, columns, distinct, where, order_by, asc, group_by, having, paged=True)
 
-        # build select statement
-        core = f"SELECT {'DISTINCT ' if distinct else ''}{col_list} FROM {table_name}"
-        where_chunk = '' if not where else f' WHERE {where}'
-        group_by_chunk = '' if not group_by else f' GROUP BY {group_by}'
-        having_chunk = '' if not having else f' HAVING {having}'
-        order_by_chunk = '' if not order_by else f" ORDER BY {order_by} {'ASC' if asc else 'DESC'}"
-        limit_offset_chunk = f" LIMIT {limit} OFFSET {offset};"
-
-        stmt = ''.join([core, where_chunk, group_by_chunk, having_chunk, order_by_chunk, limit_offset_chunk])
-
-        result = self.fetch(stmt, one=limit == 1, return_as_dict=return_as_dict)
+        result = self.fetch(stmt, *params, limit, offset, one=limit == 1, return_as_dict=return_as_dict)
         return result
 
     def insert(self,
@@ -169,52 +337,77 @@ class SQL:
         :param returning: optional string input for a returning clause after insertion
         :return: boolean whether execution was successful
         """
-        columns, values = utils.process_dict(data)
-        core = "INSERT INTO" if not replace else "INSERT OR REPLACE INTO"
-        col_list = ','.join(columns)
-        val_list = ','.join(['?' for _ in values])
-        stmt = f"{core} {table_name} ({col_list}) VALUES ({val_list}){' RETURNING %s' % returning if returning else ''};"
+        stmt, values = self.build_insert(table_name, data, replace, returning)
         res = self.execute(stmt, *values, as_transaction=True, has_return=returning is not None)
         return res
 
+    def build_insert(self,
+                     table_name: str,
+                     data: Dict[str, Any],
+                     replace: bool = False,
+                     returning: str | None = None) -> Tuple[str, List[Any]]:
+        """
+        builds the statement text and parameters of an insert,
+        see insert for the parameters
+        :return: tuple of sql statement and parameter values
+        """
+        columns, values = utils.process_dict(data)
+        self.check_columns(table_name, columns)
+        return _insert_sql(table_name, tuple(columns), replace, returning), values
+
     def update(self,
                table_name: str,
                data: Dict[str, Any],
                where: str = "1 = 1",
-               returning: str | None = None) -> bool | List[Tuple[Any]]:
+               returning: str | None = None,
+               params: Iterable[Any] = ()) -> bool | List[Tuple[Any]]:
         """
         update data within a given table
         :param table_name: table name to update in
         :param data: dictionary of column names and new values
-        :param where: conditional clause for updating (default: 1 = 1 / update everything)
+        :param where: conditional clause for updating (default: 1 = 1 / update everything),
+        with ? placeholders for params
         :param returning: optional string input for a returning clause after update
+        :param params: (optional) values bound to the placeholders of where
         :return: boolean whether execution was successful
         """
-        columns, values = utils.process_dict(data)
-
-        params = ', '.join([f"{c} = ?" for c in columns])
-        stmt = f"UPDATE {table_name} SET {params} WHERE {where}{' RETURNING %s' % returning if returning else ''};"
-
+        stmt, values = self.build_update(table_name, data, where, returning, params)
         res = self.execute(stmt, *values, as_transaction=True, has_return=returning is not None)
         return res
 
+    def build_update(self,
+                     table_name: str,
+                     data: Dict[str, Any],
+                     where: str = "1 = 1",
+                     returning: str | None = None,
+                     params: Iterable[Any] = ()) -> Tuple[str, List[Any]]:
+        """
+        builds the statement text and parameters of an update,
+        see update for the parameters
+        :return: tuple of sql statement and parameter values (new values, then where params)
+        """
+        columns, values = utils.process_dict(data)
+        self.check_columns(table_name, columns)
+        return _update_sql(table_name, tuple(columns), where, returning), values + list(params)
+
     def delete(self,
                table_name: str,
                where: str,
                returning: str | None = None,
-               vacuum: bool = False) -> bool | List[Tuple[Any]]:
+               vacuum: bool = False,
+               params: Iterable[Any] = ()) -> bool | List[Tuple[Any]]:
         """
         delete from a table based on a given conditional
         :param table_name: name of table in database
-        :param where: conditional for which item to delete from table
+        :param where: conditional for which item to delete from table, with ? placeholders for params
         :param returning: optional string input for a returning clause after update
         :param vacuum: flag to specify whether to vacuum db after this delete operation
+        :param params: (optional) values bound to the placeholders of where
         :return: boolean of whether execution was successful
         """
+        stmt = _delete_sql(table_name, where, returning)
 
-        stmt = f"DELETE FROM {table_name} WHERE {where}{' RETURNING %s' % returning if returning else ''};"
-
-        success = self.execute(stmt, as_transaction=True, has_return=returning is not None)
+        success = self.execute(stmt, *params, as_transaction=True, has_return=returning is not None)
         if vacuum and success:
             self.vacuum()
         return success
@@ -225,7 +418,7 @@ class SQL:
         :param name: name of table
         :return: True if exists else False
         """
-        return name in self.get_table_names()
+        return name in self.catalog().columns
 
     def column_exists_in_table(self, table_name: str, column: str) -> bool:
         """
@@ -234,12 +427,10 @@ class SQL:
         :param column: column name
         :return: True if column is in table else False
         """
-        if len(self.schema) == 0:
-            self.build_schema()
-        table_cols = self.schema.get(table_name, None)
+        table_cols = self.catalog().columns.get(table_name, None)
         if table_cols is None:
             return False
-        column_found: bool = column in self.schema[table_name]
+        column_found: bool = column in table_cols
         return column_found
 
     def fetch_first_value(self, __sql: str, *__params) -> Any:
@@ -335,6 +526,8 @@ class SQL:
         return dict convertible Row objects
         :return: result of fetch
         """
+        start = time.perf_counter()
+        count = -1
         try:
             params = list(params)
             one = one or re.match(r"^.+ LIMIT 1($| |;|\D).*", sql, flags=re.IGNORECASE)
@@ -343,6 +536,7 @@ class SQL:
             rows = [
                 dict(row) if return_as_dict else row for row in self.con.execute(sql, params)
             ]
+            count = len(rows)
 
             if len(rows) == 0:
                 return None if one else []
@@ -359,6 +553,58 @@ class SQL:
 
         except sqlite.Error as e:
             return None
+        finally:
+            if self.observers:
+                self._observe(sql, params, time.perf_counter() - start, count)
+
+    def _observe(self, statement: str, params: Sequence[Any] | None, seconds: float, rows: int) -> None:
+        for observer in self.observers:
+            observer(statement, params, seconds, rows)
+
+    def stream(self, sql: str, *params, size: int = 500) -> Tuple[List[str], Iterator[List[Tuple]]] | None:
+        """
+        executes a query and lazily fetches its rows in batches
+        instead of loading the whole result into memory,
+        the cursor is closed once the batches are exhausted or closed,
+        observers see the statement once then, with the time of all batches
+        :param sql: sql statement to be executed
+        :param params: (optional) parameter values
+        :param size: number of rows per batch
+        :return: tuple of column names and a generator of row tuple batches,
+        None if the statement failed
+        """
+        cur = self.con.cursor()
+        cur.row_factory = None
+        params = list(params)
+        start = time.perf_counter()
+        try:
+            cur.execute(sql, params)
+        except sqlite.Error as e:
+            cur.close()
+            if self.observers:
+                self._observe(sql, params, time.perf_counter() - start, -1)
+            return None
+        elapsed = time.perf_counter() - start
+        columns = [d[0] for d in cur.description]
+
+        def batches():
+            nonlocal elapsed
+            count = 0
+            try:
+                while True:
+                    start = time.perf_counter()
+                    rows = cur.fetchmany(size)
+                    elapsed += time.perf_counter() - start
+                    if not rows:
+                        return
+                    count += len(rows)
+                    yield rows
+            finally:
+                cur.close()
+                if self.observers:
+                    self._observe(sql, params, elapsed, count)
+
+        return columns, batches()
 
     def execute(self,
                 statement: str,
@@ -376,16 +622,23 @@ class SQL:
         :return: boolean whether execution was successful
         """
         cur = self.con.cursor()
+        params = list(params)
+        start = time.perf_counter()
+        count = -1
         try:
             if as_transaction:
                 cur.execute("BEGIN TRANSACTION;")
-            cur.execute(statement, list(params))
+            cur.execute(statement, params)
             out = cur.fetchall() if has_return else True
+            count = len(out) if has_return else cur.rowcount
             self.con.commit()
             return out
         except sqlite.Error as e:
             self.con.rollback()
             return False
+        finally:
+            if self.observers:
+                self._observe(statement, params, time.perf_counter() - start, count)
 
     def executescript(self, __sql: str) -> bool:
         """
@@ -411,14 +664,89 @@ class SQL:
         :return: boolean whether execution was successful
         """
         cur = self.con.cursor()
+        start = time.perf_counter()
+        count = -1
         try:
             cur.executemany(__sql, __seq_of_params)
+            count = cur.rowcount
             self.con.commit()
         except sqlite.Error as e:
             self.con.rollback()
             return False
+        finally:
+            if self.observers:
+                self._observe(__sql, None, time.perf_counter() - start, count)
         return True
 
+    def insert_many(self,
+                    table_name: str,
+                    rows: Iterable[Dict[str, Any]],
+                    batch_size: int = 1000,
+                    replace: bool = False) -> List[Dict[str, Any]]:
+        """
+        inserts rows with executemany in batches of up to batch_size rows,
+        all in one transaction, every batch in its own savepoint so a failing
+        batch is rolled back without the others, rows are consumed lazily
+        so any iterable (e.g. a stream being parsed) keeps memory flat,
+        if iterating the rows raises, the whole transaction is rolled back
+        :param table_name: name of table in database
+        :param rows: dictionaries of column names and values
+        :param batch_size: maximum number of rows per executemany
+        :param replace: flag of whether make it an OR REPLACE statement
+        :return: list of per batch reports with the batch number, its number
+        of rows, the number inserted and the error (if any)
+        """
+        report = []
+        cur = self.con.cursor()
+        cur.execute("BEGIN TRANSACTION;")
+        try:
+            for number, (columns, batch) in enumerate(utils.batch_rows(rows, batch_size)):
+                stmt, _ = self.build_insert(table_name, dict.fromkeys(columns), replace)
+                cur.execute("SAVEPOINT batch;")
+                start = time.perf_counter()
+                try:
+                    cur.executemany(stmt, batch)
+                    report.append({"batch": number, "rows": len(batch), "inserted": len(batch), "error": None})
+                except sqlite.Error as e:
+                    cur.execute("ROLLBACK TO batch;")
+                    report.append({"batch": number, "rows": len(batch), "inserted": 0, "error": str(e)})
+                if self.observers:
+                    self._observe(stmt, batch[0], time.perf_counter() - start, report[-1]["inserted"])
+                cur.execute("RELEASE batch;")
+            self.con.commit()
+        except BaseException:
+            self.con.rollback()
+            raise
+        return report
+
+    def start_profiling(self, threshold: float = 0.1, sample_rate: float = 0.01, max_slow: int = 100) -> QueryProfiler:
+        """
+        starts a sampled profile of the statements of this connection
+        (fetch, stream, execute, executemany and insert_many)
+        :param threshold: seconds above which a statement is logged as slow
+        :param sample_rate: fraction of the statements aggregated (0 to 1)
+        :param max_slow: number of slow statements kept
+        :return: QueryProfiler
+        """
+        self.stop_profiling()
+        self.profiler = QueryProfiler(threshold, sample_rate, max_slow)
+        self.profiler.attach([self])
+        return self.profiler
+
+    def stop_profiling(self) -> None:
+        """ stops profiling, the last report stays available """
+        if self.profiler is not None:
+            self.profiler.detach([self])
+
+    def profiling_report(self, limit: int = 50) -> Dict[str, Any] | None:
+        """
+        :param limit: maximum number of statement templates
+        :return: report of the profiler (see QueryProfiler.report), None if never started
+        """
+        if self.profiler is None:
+            return None
+        return self.profiler.report(self, limit)
+
     def vacuum(self):
         """utility for vacuuming database"""
         self.execute("VACUUM;")
@@ -445,53 +773,81 @@ class SQL:
         dst.writelines(lines)
         dst.close()
 
-    def export_to_csv(self, delimeter: str = ',') -> None:
+    def export_to_csv(self, delimeter: str = ',', workers: int = 1) -> None:
         """
         exports every table in the database
         to seperate csvs
+        :param delimeter: csv file delimeter character
+        :param workers: number of tables exported in parallel, each on its own
+        read only connection (in memory databases are always exported one by one)
         :return: None
         """
-        for table in self.get_table_names():
-            self.export_table_to_csv(table_name=table, delimeter=delimeter)
+        tables = self.get_table_names()
+        if workers <= 1 or self.file == IN_MEMORY:
+            for table in tables:
+                self.export_table_to_csv(table_name=table, delimeter=delimeter)
+            return
+
+        def export(table):
+            with SQL(self.file, read_only=True, check_same_thread=False) as db:
+                db.export_table_to_csv(table_name=table, delimeter=delimeter)
 
-    def to_json(self, table_name: str, filename: str | None = None) -> bool:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for _ in executor.map(export, tables):
+                pass
+
+    def to_json(self, table_name: str, filename: str | None = None, size: int = 1000) -> bool:
         """
-        converts a table in the database to a JSON file
+        converts a table in the database to a JSON file,
+        written incrementally size rows at a time
         :param table_name: name of table
         :param filename: filename for output (if None then table_name.json)
+        :param size: number of rows fetched and encoded at a time
         :return: boolean whether export was successful
         """
         if not filename:
             filename = './{}.json'.format(table_name)
-        result = self.select(table_name, return_as_dict=True)
+        result = self.stream(self.build_select(table_name), size=size)
         if result is None:
             return False
+        columns, batches = result
         try:
-            with open(filename, 'w') as file:
-                json.dump(result, file)
+            with open(filename, 'w', encoding='UTF-8') as file:
+                separator = '['
+                for rows in batches:
+                    file.write(separator + utils.json_objects(columns, rows))
+                    separator = ', '
+                file.write(']' if separator == ', ' else '[]')
         except Exception as e:
             return False
+        finally:
+            batches.close()
         return True
 
-    def export_table_to_csv(self, table_name: str, delimeter: str = ',') -> None:
+    def export_table_to_csv(self, table_name: str, delimeter: str = ',', size: int = 1000) -> None:
         """
-        exports a table in the database to csv format
+        exports a table in the database to csv format,
+        written incrementally size rows at a time
         :param table_name: name of table
         :param delimeter: csv file delimeter character
+        :param size: number of rows fetched and written at a time
         :return: None
         """
         if not self.table_exists(table_name):
             return
-        outfile = f"./{self.__get_database_name()}-{table_name}.csv"
-        rows = [row for row in self.select(table_name, return_as_dict=True)]
-        if not len(rows):
+        result = self.stream(self.build_select(table_name), size=size)
+        if result is None:
             return
-        headers = list(rows[0].keys())  # extract column header line
-        csv_rows = [list(row.values()) for row in rows]
-        with open(outfile, 'w', newline='', encoding='UTF-8') as csv_file:
-            writer = _csv.writer(csv_file, delimiter=delimeter)
-            writer.writerow(headers)
-            writer.writerows(csv_rows)
+        headers, batches = result
+        outfile = f"./{self.__get_database_name()}-{table_name}.csv"
+        try:
+            with open(outfile, 'w', newline='', encoding='UTF-8') as csv_file:
+                writer = _csv.writer(csv_file, delimiter=delimeter)
+                writer.writerow(headers)
+                for rows in batches:
+                    writer.writerows(rows)
+        finally:
+            batches.close()
 
     def register_adapter(self, type: object, adapter: Callable):
         """
@@ -542,67 +898,204 @@ class SQL:
                 progress=None if quiet else progress_callback
             )
 
-    def create_table_from_csv(self, filename: str, name: str | None = None) -> bool:
+    @contextmanager
+    def import_pragmas(self, cache_size: int = -262144) -> Iterator[None]:
+        """
+        trades durability for speed for the duration of a bulk import: no fsync
+        (synchronous = off), a larger page cache and temporary storage in memory,
+        the previous settings are restored afterwards, a crash during
+        the import can lose (or without WAL corrupt) the database
+        :param cache_size: page cache size in pages, or in KiB if negative (default 256 MiB)
+        :return: None
+        """
+        saved = {pragma: self.fetch(f"pragma {pragma};", one=True) for pragma in ("synchronous", "cache_size", "temp_store")}
+        self.executescript(f"pragma synchronous = off; pragma cache_size = {int(cache_size)}; pragma temp_store = memory;")
+        try:
+            yield
+        finally:
+            self.executescript("".join(f"pragma {pragma} = {value};" for pragma, value in saved.items()))
+
+    def bulk_load(self,
+                  name: str,
+                  columns: List[str],
+                  types: List[str],
+                  rows: Iterable[Tuple[Any, ...] | List[Any]],
+                  batch_size: int = 10000,
+                  fast: bool = False,
+                  indexes: Iterable[str] = (),
+                  commit_every_batch: bool = False) -> Dict[str, Any] | None:
+        """
+        creates a table and fills it from an iterable of rows with executemany in
+        batches of batch_size rows, either all in one transaction or committing every
+        batch (which keeps the WAL small), the table is dropped again if a batch fails
+        :param name: name of the new table
+        :param columns: column names
+        :param types: sqlite types of the columns
+        :param rows: value tuples in column order, consumed lazily
+        :param batch_size: rows per executemany
+        :param fast: flag of whether to load with import_pragmas (no fsync, larger cache)
+        :param indexes: columns to index, the indexes are created after the rows are inserted
+        :param commit_every_batch: flag of whether to commit after every batch
+        :return: dictionary of the table name, rows loaded, seconds and
+        rows per second, None if the load failed (nothing is loaded then)
+        """
+        start = time.perf_counter()
+        indexes = [utils.safe_name(column) for column in indexes]
+        if not set(indexes).issubset(columns):
+            raise ValueError("cannot index unknown columns {}".format(set(indexes) - set(columns)))
+        create_stmt = "CREATE TABLE {} ({});".format(name, ','.join(f"{c} {t}" for c, t in zip(columns, types)))
+        insert_stmt = f"INSERT INTO {name} ({','.join(columns)}) VALUES ({','.join('?' * len(columns))});"
+
+        count = 0
+        # only a table this load created is dropped when it fails, never one that existed before
+        created = False
+        cur = self.con.cursor()
+        with self.import_pragmas() if fast else nullcontext():
+            try:
+                cur.execute("BEGIN TRANSACTION;")
+                cur.execute(create_stmt)
+                created = True
+                for batch in utils.chunked(rows, batch_size):
+                    cur.executemany(insert_stmt, batch)
+                    count += len(batch)
+                    if commit_every_batch:
+                        self.con.commit()
+                        cur.execute("BEGIN TRANSACTION;")
+                for column in indexes:
+                    cur.execute(f"CREATE INDEX idx_{name}_{column} ON {name} ({column});")
+                self.con.commit()
+            except (sqlite.Error, ValueError, _csv.Error):
+                self.discard_load(name, commit_every_batch and created)
+                return None
+            except BaseException:
+                # the transaction must not stay open, whatever stopped the load
+                self.discard_load(name, commit_every_batch and created)
+                raise
+        seconds = time.perf_counter() - start
+        return {"table": name, "rows": count, "seconds": seconds, "rows_per_second": count / seconds if seconds else 0.0}
+
+    def discard_load(self, name: str, committed: bool) -> None:
+        """
+        rolls back a failed bulk_load
+        :param name: name of the table being loaded
+        :param committed: flag of whether batches of a table the load created were committed, it is dropped then
+        :return: None
+        """
+        self.con.rollback()
+        if committed:
+            self.execute(f"DROP TABLE IF EXISTS {name};")
+
+    def import_csv(self,
+                   filename: str,
+                   name: str | None = None,
+                   delimiter: str = ',',
+                   batch_size: int = 10000,
+                   sample_size: int = 1000,
+                   fast: bool = False,
+                   indexes: Iterable[str] = ()) -> Dict[str, Any] | None:
         """
-        create a new table in the current database from a csv file and inserts all data
-        assumes that json file is an array of objects with the same keys
+        streams a csv file into a new table in one transaction (see bulk_load),
+        column types are inferred from the first sample_size rows and
+        empty values in numeric columns are stored as NULL
         :param filename: name of csv file
         :param name: optional name of table
-        :return: boolean of if creation was successful
+        :param delimiter: field delimiter
+        :param batch_size: rows per executemany
+        :param sample_size: number of rows the column types are inferred from
+        :param fast: flag of whether to import with import_pragmas (no fsync, larger cache)
+        :param indexes: columns to index, the indexes are created after the rows are inserted
+        :return: dictionary of the table name, rows imported, seconds and
+        rows per second, None if the import failed (nothing is imported then)
         """
+        start = time.perf_counter()
         if name is None:
             name = utils.extract_filename(filename).lower()
         name = utils.safe_name(name)
-        headers, rows = utils.read_csv(filename)
-        if len(rows) == 0:
-            return False
-        columns = []
-        for i, v in enumerate(rows[0]):
-            col = "{} {}".format(headers[i].replace(' ', '_'), utils.detect_type_csv(v))
-            columns.append(col)
-        create_stmt = f"CREATE TABLE {name} ({','.join(columns)});"
-        if not self.execute(create_stmt):
-            return False
-
-        insert_stmt = f"INSERT INTO {name} ({','.join(headers)}) VALUES ({','.join('?' * len(columns))});"
+        headers, source = utils.iter_csv(filename, delimiter=delimiter)
+        try:
+            sample = list(itertools.islice(source, sample_size))
+            if not headers or not sample:
+                return None
+            columns = [utils.safe_name(header) for header in headers]
+            types = utils.infer_csv_types(sample, len(columns))
+            numeric = [i for i, t in enumerate(types) if t != "text"]
+            rows = utils.null_blanks(itertools.chain(sample, source), numeric)
+            report = self.bulk_load(name, columns, types, rows, batch_size=batch_size, fast=fast, indexes=indexes)
+        except (ValueError, _csv.Error):  # malformed csv in the sample
+            return None
+        finally:
+            source.close()
+        if report is not None:
+            report["seconds"] = time.perf_counter() - start
+            report["rows_per_second"] = report["rows"] / report["seconds"]
+        return report
 
-        return self.executemany(insert_stmt, rows)
+    def create_table_from_csv(self, filename: str, name: str | None = None, **options) -> bool:
+        """
+        create a new table in the current database from a csv file and inserts all data,
+        see import_csv for the options and a report of the import
+        :param filename: name of csv file
+        :param name: optional name of table
+        :return: boolean of if creation was successful
+        """
+        return self.import_csv(filename, name, **options) is not None
 
-    def create_table_from_json(self, filename: str, name: str | None = None) -> bool:
+    def import_json(self,
+                    filename: str,
+                    name: str | None = None,
+                    batch_size: int = 10000,
+                    sample_size: int = 1000,
+                    fast: bool = False,
+                    indexes: Iterable[str] = ()) -> Dict[str, Any] | None:
         """
-        create a new table in the current database from a json file and inserts all data
-        assumes that json file is an array of objects with the same keys
+        streams a json file (an array of objects, NDJSON or a single object) into
+        a new table, parsed incrementally and committed every batch (see bulk_load),
+        the columns are the union of the keys of the first sample_size records,
+        keys that only appear later are dropped
         :param filename: name of json file
         :param name: optional name of table
-        :return: boolean of if creation was successful
+        :param batch_size: rows per executemany and transaction
+        :param sample_size: number of records the columns are inferred from
+        :param fast: flag of whether to import with import_pragmas (no fsync, larger cache)
+        :param indexes: columns to index, the indexes are created after the rows are inserted
+        :return: dictionary of the table name, rows imported, seconds and
+        rows per second, None if the import failed (nothing is imported then)
         """
+        start = time.perf_counter()
         if name is None:
             name = utils.extract_filename(filename).lower()
-        with open(filename, "r") as file:
-            data = json.load(file)
-            if len(data) == 0:
-                return
-            if not isinstance(data, list):
-                # TODO: implement handling for a single object?
-                return False
-
-            # assume all objects have the same key
-            item = data[0]
-            keys = item.keys()
-            cols = ",".join(
-                "{} {}".format(
-                    k, utils.detect_type_json(item[k])
-                )
-                for k in keys
-            )
-            statement = f"CREATE TABLE {name} ({cols});"  # don't check if exists for later handling
-            if not self.execute(statement):  # error in creation or table name exists
-                return False
-
-            success = True
-            for x in data:
-                success = success and self.insert(name, x)
-            return success
+        name = utils.safe_name(name)
+        records = utils.iter_json_file(filename)
+        try:
+            sample = list(itertools.islice(records, sample_size))
+            if not sample:
+                return None
+            keys, types = utils.infer_json_columns(sample)
+            columns = [utils.safe_name(key) for key in keys]
+            rows = utils.json_rows(itertools.chain(sample, records), keys)
+            report = self.bulk_load(name, columns, types, rows, batch_size=batch_size, fast=fast,
+                                    indexes=indexes, commit_every_batch=True)
+        except ValueError:  # malformed json in the sample
+            return None
+        finally:
+            records.close()
+        if report is not None:
+            report["seconds"] = time.perf_counter() - start
+            report["rows_per_second"] = report["rows"] / report["seconds"]
+        return report
+
+    def create_table_from_json(self, filename: str, name: str | None = None, **options) -> bool:
+        """
+        create a new table in the current database from a json file and inserts all data,
+        see import_json for the options and a report of the import
+        :param filename: name of json file
+        :param name: optional name of table
+        :return: boolean of if creation was successful
+        """
+        return self.import_json(filename, name, **options) is not None
+
+    def __enter__(self):
+        return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.con.close()
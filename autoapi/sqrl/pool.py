@@ -0,0 +1,164 @@
+"""
+Oliver 2024
+"""
+
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+from .core import SQL, IN_MEMORY
+
+
+class PoolTimeout(Exception):
+    """ raised when no connection became free within the pool timeout """
+
+
+class _Usage:
+    """ checkout counters for one kind of connection """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.in_use = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.busy_seconds = 0.0
+
+    def as_dict(self, elapsed: float) -> Dict[str, float]:
+        return {
+            "size": self.size,
+            "in_use": self.in_use,
+            "checkouts": self.checkouts,
+            "waits": self.waits,
+            "timeouts": self.timeouts,
+            "wait_seconds": self.wait_seconds,
+            "max_wait_seconds": self.max_wait_seconds,
+            "utilization": self.busy_seconds / (self.size * elapsed) if self.size and elapsed else 0.0,
+        }
+
+
+class ConnectionPool:
+    def __init__(self, filename: str = IN_MEMORY, readers: int = 4, timeout: float | None = 5.0, **kwargs):
+        """
+        pool of one writer connection and a number of read only
+        connections, in WAL journal mode the readers run concurrently
+        with each other and with the writer
+        :param filename: path to database file
+        :param readers: number of read only connections (an in memory database
+        cannot be shared between connections, so reads use the writer instead)
+        :param timeout: seconds to wait for a free connection before raising PoolTimeout (None waits forever)
+        :param kwargs: keyword arguments passed on to every SQL connection
+        """
+        kwargs["check_same_thread"] = False
+        self.file = filename
+        self.timeout = timeout
+        # the writer is opened first so that it is the one switching the journal mode
+        self.writer_connection = SQL(filename, **kwargs)
+        self._write_lock = threading.Lock()
+        self._readers: queue.LifoQueue[SQL] = queue.LifoQueue()
+        if filename != IN_MEMORY:
+            for _ in range(readers):
+                self._readers.put(SQL(filename, read_only=True, **kwargs))
+        self._connections = [self.writer_connection] + list(self._readers.queue)
+        self._stats_lock = threading.Lock()
+        self._read_usage = _Usage(self._readers.qsize())
+        self._write_usage = _Usage(1)
+        self._started = time.perf_counter()
+
+    def _checked_out(self, usage: _Usage, waited: float, contended: bool) -> None:
+        with self._stats_lock:
+            usage.in_use += 1
+            usage.checkouts += 1
+            if contended:
+                usage.waits += 1
+                usage.wait_seconds += waited
+                usage.max_wait_seconds = max(usage.max_wait_seconds, waited)
+
+    def _timed_out(self, usage: _Usage) -> None:
+        with self._stats_lock:
+            usage.timeouts += 1
+
+    def _checked_in(self, usage: _Usage, held: float) -> None:
+        with self._stats_lock:
+            usage.in_use -= 1
+            usage.busy_seconds += held
+
+    @contextmanager
+    def reader(self) -> Iterator[SQL]:
+        """
+        checks out a read only connection for the duration of the block
+        :return: SQL connection
+        """
+        if self._read_usage.size == 0:
+            with self.writer() as db:
+                yield db
+            return
+        start = time.perf_counter()
+        try:
+            db = self._readers.get_nowait()
+            contended = False
+        except queue.Empty:
+            try:
+                db = self._readers.get(timeout=self.timeout)
+            except queue.Empty:
+                self._timed_out(self._read_usage)
+                raise PoolTimeout("no read connection free after {}s".format(self.timeout)) from None
+            contended = True
+        acquired = time.perf_counter()
+        self._checked_out(self._read_usage, acquired - start, contended)
+        try:
+            yield db
+        finally:
+            self._checked_in(self._read_usage, time.perf_counter() - acquired)
+            self._readers.put(db)
+
+    @contextmanager
+    def writer(self, wait: bool = True) -> Iterator[SQL]:
+        """
+        checks out the writer connection for the duration of the block
+        :param wait: flag of whether to wait for the writer, else PoolTimeout is raised right away when it is busy
+        :return: SQL connection
+        """
+        start = time.perf_counter()
+        contended = not self._write_lock.acquire(blocking=False)
+        if contended and not wait:
+            raise PoolTimeout("writer connection busy")
+        if contended and not self._write_lock.acquire(timeout=-1 if self.timeout is None else self.timeout):
+            self._timed_out(self._write_usage)
+            raise PoolTimeout("writer connection not free after {}s".format(self.timeout))
+        acquired = time.perf_counter()
+        self._checked_out(self._write_usage, acquired - start, contended)
+        try:
+            yield self.writer_connection
+        finally:
+            self._checked_in(self._write_usage, time.perf_counter() - acquired)
+            self._write_lock.release()
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        checkout statistics of the pool, utilization is the fraction
+        of time the connections were checked out since the pool was created
+        :return: dictionary of reader and writer statistics
+        """
+        elapsed = time.perf_counter() - self._started
+        with self._stats_lock:
+            return {"reader": self._read_usage.as_dict(elapsed), "writer": self._write_usage.as_dict(elapsed)}
+
+    def connections(self) -> List[SQL]:
+        """
+        :return: every connection of the pool (e.g. to observe their statements), the writer first
+        """
+        return list(self._connections)
+
+    def close(self) -> None:
+        """ closes every connection in the pool """
+        while True:
+            try:
+                self._readers.get_nowait().con.close()
+            except queue.Empty:
+                break
+        self.writer_connection.con.close()
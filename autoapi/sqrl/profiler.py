@@ -0,0 +1,178 @@
+"""
+Oliver 2024
+
+sampled statement profiler, registered as an observer of SQL connections,
+every statement is already timed so checking the threshold costs a comparison,
+only the sampled and the slow ones take the lock
+"""
+
+import collections
+import functools
+import random
+import re
+import sqlite3 as sqlite
+import threading
+import time
+from typing import Any, Deque, Dict, List, Sequence
+
+# number of recent durations kept per template for the percentiles
+RESERVOIR = 1024
+# literals replaced by ? so statements differing only in their values share a template
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+@functools.lru_cache(maxsize=1024)
+def template(statement: str) -> str:
+    """
+    :param statement: sql statement
+    :return: statement with its literals replaced by ? and its whitespace collapsed
+    """
+    return " ".join(_LITERALS.sub("?", statement).split())
+
+
+def param_shape(params: Sequence[Any] | None) -> List[str]:
+    """
+    :param params: bound parameter values
+    :return: type names of the values (not the values, which may be private)
+    """
+    return [type(v).__name__ for v in params or ()]
+
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+class _Stats:
+    __slots__ = ("calls", "seconds", "rows", "max", "durations")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.max = 0.0
+        self.durations: Deque[float] = collections.deque(maxlen=RESERVOIR)
+
+
+class QueryProfiler:
+    def __init__(self, threshold: float = 0.1, sample_rate: float = 0.01, max_slow: int = 100):
+        """
+        aggregates per statement template stats (calls, p50/p99, rows) of a sample
+        of the statements and logs every statement slower than the threshold with
+        the types of its parameters, the query plans of the slow statements are
+        read when a report is built so the slow request does not wait for them
+        :param threshold: seconds above which a statement is logged as slow
+        :param sample_rate: fraction of the statements aggregated (0 to 1)
+        :param max_slow: number of slow statements kept (the oldest are dropped)
+        """
+        if not 0 <= sample_rate <= 1:
+            raise ValueError("sample_rate must be between 0 and 1")
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self._stats: Dict[str, _Stats] = {}
+        self._slow: Deque[Dict[str, Any]] = collections.deque(maxlen=max_slow)
+        self._plans: Dict[str, List[str]] = {}
+        self._random = random.random
+        self._lock = threading.Lock()
+
+    def __call__(self, statement: str, params: Sequence[Any] | None, seconds: float, rows: int) -> None:
+        """ SQL observer recording a statement if it is sampled or slow """
+        sampled = self._random() < self.sample_rate
+        slow = seconds >= self.threshold
+        if not (sampled or slow):
+            return
+        key = template(statement)
+        with self._lock:
+            if sampled:
+                stats = self._stats.get(key)
+                if stats is None:
+                    stats = self._stats[key] = _Stats()
+                stats.calls += 1
+                stats.seconds += seconds
+                stats.rows += max(rows, 0)
+                stats.max = max(stats.max, seconds)
+                stats.durations.append(seconds)
+            if slow:
+                self._slow.append({
+                    "statement": statement,
+                    "template": key,
+                    "params": param_shape(params),
+                    "seconds": seconds,
+                    "rows": rows,
+                    "at": time.time(),
+                })
+
+    def attach(self, connections) -> None:
+        """
+        :param connections: SQL connections to profile the statements of
+        :return: None
+        """
+        for db in connections:
+            if self not in db.observers:
+                db.observers.append(self)
+
+    def detach(self, connections) -> None:
+        """
+        :param connections: SQL connections to stop profiling
+        :return: None
+        """
+        for db in connections:
+            if self in db.observers:
+                db.observers.remove(self)
+
+    def explain(self, db, statement: str) -> List[str]:
+        """
+        :param db: SQL connection to explain on
+        :param statement: sql statement (parameters are explained as NULL)
+        :return: detail lines of its EXPLAIN QUERY PLAN, cached per template
+        """
+        key = template(statement)
+        plan = self._plans.get(key)
+        if plan is None:
+            try:
+                count = statement.count("?")
+                rows = db.con.execute("EXPLAIN QUERY PLAN " + statement, [None] * count).fetchall()
+                plan = [row[-1] for row in rows]
+            except sqlite.Error as e:
+                plan = ["not explained: {}".format(e)]
+            self._plans[key] = plan
+        return plan
+
+    def report(self, db=None, limit: int = 50) -> Dict[str, Any]:
+        """
+        :param db: (optional) SQL connection to read the plans of the slow statements with
+        :param limit: maximum number of templates, the ones with the most total time first
+        :return: dictionary of the settings, the per template stats and the slow statements
+        """
+        with self._lock:
+            stats = [(k, s.calls, s.seconds, s.rows, s.max, sorted(s.durations)) for k, s in self._stats.items()]
+            slow = [dict(entry) for entry in self._slow]
+        statements = []
+        for key, calls, seconds, rows, longest, durations in sorted(stats, key=lambda s: -s[2])[:limit]:
+            statements.append({
+                "template": key,
+                "calls": calls,
+                "estimated_calls": round(calls / self.sample_rate) if self.sample_rate else calls,
+                "seconds": seconds,
+                "mean": seconds / calls,
+                "p50": _percentile(durations, 0.5),
+                "p99": _percentile(durations, 0.99),
+                "max": longest,
+                "rows": rows,
+                "rows_per_call": rows / calls,
+            })
+        if db is not None:
+            for entry in slow:
+                entry["plan"] = self.explain(db, entry["statement"])
+        return {
+            "threshold": self.threshold,
+            "sample_rate": self.sample_rate,
+            "statements": statements,
+            "slow": slow,
+        }
+
+    def reset(self) -> None:
+        """ drops the recorded stats, slow statements and plans """
+        with self._lock:
+            self._stats.clear()
+            self._slow.clear()
+            self._plans.clear()
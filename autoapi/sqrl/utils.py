@@ -1,12 +1,23 @@
 """
 Oliver 2024
 """
+import codecs
+import itertools
+import json
 import os.path
 import re
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Iterable, Iterator
 import csv
 
 
+def quote_identifier(identifier: str) -> str:
+    """
+    :param identifier: table or column name
+    :return: the name as a quoted sql identifier
+    """
+    return '"{}"'.format(identifier.replace('"', '""'))
+
+
 def AND(*params) -> str:
     clause = " AND ".join(params)
     return clause
@@ -43,6 +54,11 @@ def is_real(x: Any):
     return re.match(r"^[0-9]+\.[0-9]+$", str(x)) is not None
 
 
+# numbers with leading zeros (e.g. zip codes) stay text
+NUMBER_INT = re.compile(r"^[-+]?(0|[1-9][0-9]*)$")
+NUMBER_REAL = re.compile(r"^(?=[-+]?\.?[0-9])[-+]?(0|[1-9][0-9]*)?(\.[0-9]*)?([eE][-+]?[0-9]+)?$")
+
+
 def detect_type_csv(data) -> str:
     if is_int(data):
         return "integer"
@@ -82,5 +98,261 @@ def read_csv(filepath: str) -> Tuple[List[str], List[str]]:
         return headers, rows
 
 
+def iter_csv(filepath: str, delimiter: str = ',') -> Tuple[List[str], Iterator[List[str]]]:
+    """
+    reads the header of a csv file and streams the rest
+    :param filepath: path of csv file
+    :param delimiter: field delimiter
+    :return: tuple of the header and a generator of rows, which closes the file once exhausted
+    """
+    csv_file = open(filepath, "r", encoding="utf-8", errors="replace", newline='')
+    reader = csv.reader(csv_file, delimiter=delimiter)
+    headers = next(reader, [])
+
+    def rows():
+        with csv_file:
+            yield from reader
+
+    return headers, rows()
+
+
+def infer_csv_types(sample: List[List[str]], width: int) -> List[str]:
+    """
+    infers the type of every column from a sample of rows, a column is an integer
+    or real column only if every non empty value of it in the sample is one
+    :param sample: rows of csv values
+    :param width: number of columns
+    :return: list of sqlite column types
+    """
+    types = []
+    for i in range(width):
+        values = [row[i] for row in sample if i < len(row) and row[i] != '']
+        if values and all(NUMBER_INT.match(v) for v in values):
+            types.append("integer")
+        elif values and all(NUMBER_REAL.match(v) for v in values):
+            types.append("real")
+        else:
+            types.append("text")
+    return types
+
+
+def null_blanks(rows: Iterable[List[str]], columns: List[int]) -> Iterator[List[str | None]]:
+    """
+    replaces empty csv values with None in the given columns
+    :param rows: rows of csv values
+    :param columns: indexes of the columns (e.g. the numeric ones)
+    :return: generator of the same rows
+    """
+    for row in rows:
+        for i in columns:
+            if i < len(row) and row[i] == '':
+                row[i] = None
+        yield row
+
+
+def chunked(iterable: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """
+    :param iterable: any iterable
+    :param size: maximum length of a chunk
+    :return: generator of lists of up to size consecutive items
+    """
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
 def safe_name(text: str) -> str:
     return text.replace('-', '_').replace(' ', '_')
+
+
+_encoder = json.JSONEncoder()
+# characters that open, close or quote a nested json value, and those that end a string
+_JSON_STRUCTURE = re.compile(r'[][{}"]')
+_JSON_STRING_END = re.compile(r'["\\]')
+# a number or literal (true, false, null, NaN, Infinity) up to its first delimiter
+_JSON_SCALAR = re.compile(r'[-+.0-9a-zA-Z]*')
+
+
+def json_objects(columns: List[str], rows: Iterable[Tuple[Any, ...]]) -> str:
+    """
+    encodes rows as comma separated json objects, the whole batch is encoded in
+    one call to the C encoder which beats encoding the values one by one in python
+    :param columns: column names
+    :param rows: row tuples
+    :return: json text of the objects without the surrounding brackets
+    """
+    return _encoder.encode([dict(zip(columns, row)) for row in rows])[1:-1]
+
+
+def iter_json_records(chunks: Iterable[bytes | str], max_record_size: int = 16 * 1024 * 1024) -> Iterator[Any]:
+    """
+    incrementally parses a stream of json values, either newline delimited
+    (NDJSON) or the items of one top level array, without holding more
+    than the record being parsed in memory
+    :param chunks: pieces of the document in any size
+    :param max_record_size: longest single record accepted
+    :return: generator of parsed values
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    buffer = ''
+    in_array = None
+    # last token of an array, "[", "," or a value (None), and whether its "]" was seen
+    last = '['
+    closed = False
+    # how far the value at pos was scanned for its end, so an incomplete record
+    # is only searched once per chunk and decoded once it is complete
+    scan, depth, in_string = None, 0, False
+    for chunk in chunks:
+        buffer += text.decode(chunk) if isinstance(chunk, (bytes, bytearray, memoryview)) else chunk
+        pos = 0
+        while True:
+            if scan is None:
+                while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+                    pos += 1
+                if pos == len(buffer):
+                    break
+                if closed:
+                    raise ValueError("unexpected data after the end of the json array")
+                if in_array is None:
+                    in_array = buffer[pos] == '['
+                    pos += in_array
+                    continue
+                if in_array and buffer[pos] in ',]':
+                    if last == ',' or buffer[pos] == ',' and last == '[':
+                        raise ValueError("empty element in json array")
+                    closed = buffer[pos] == ']'
+                    last = buffer[pos]
+                    pos += 1
+                    continue
+                if in_array and last is None:
+                    raise ValueError("expected ',' or ']' between the elements of the json array")
+                if buffer[pos] not in '{["':
+                    if _JSON_SCALAR.match(buffer, pos).end() == len(buffer):
+                        break  # a number or literal could continue in the next chunk
+                    value, pos = decoder.raw_decode(buffer, pos)
+                    yield value
+                    last = None
+                    continue
+                scan, depth, in_string = pos, 0, False
+            end = None
+            while end is None:
+                if in_string:
+                    match = _JSON_STRING_END.search(buffer, scan)
+                    if match is None:
+                        scan = len(buffer)
+                        break
+                    if match.group() == '\\':
+                        if match.end() == len(buffer):
+                            scan = match.start()  # the escaped character is in the next chunk
+                            break
+                        scan = match.end() + 1
+                        continue
+                    in_string = False
+                    scan = match.end()
+                else:
+                    match = _JSON_STRUCTURE.search(buffer, scan)
+                    if match is None:
+                        scan = len(buffer)
+                        break
+                    scan = match.end()
+                    if match.group() == '"':
+                        in_string = True
+                        continue
+                    depth += 1 if match.group() in '{[' else -1
+                if depth == 0 and not in_string:
+                    end = scan
+            if end is None:
+                break  # incomplete, wait for the next chunk
+            value, stop = decoder.raw_decode(buffer, pos)
+            if stop != end:
+                raise ValueError("malformed json record")
+            yield value
+            pos = end
+            last = None
+            scan = None
+        buffer = buffer[pos:]
+        if scan is not None:
+            scan -= pos
+        if len(buffer) > max_record_size:
+            raise ValueError("json record longer than {} characters".format(max_record_size))
+    buffer += text.decode(b'', final=True)
+    if in_array and not closed:
+        raise ValueError("truncated json array, the closing ] is missing")
+    if buffer.strip():
+        yield json.loads(buffer)
+
+
+def iter_json_file(filepath: str, chunk_size: int = 1024 * 1024) -> Iterator[Any]:
+    """
+    streams the records of a json file (an array, NDJSON or a single object)
+    :param filepath: path of json file
+    :param chunk_size: bytes read at a time
+    :return: generator of the parsed records
+    """
+    with open(filepath, "rb") as file:
+        yield from iter_json_records(iter(lambda: file.read(chunk_size), b''))
+
+
+def infer_json_columns(sample: List[Dict[str, Any]]) -> Tuple[List[str], List[str]]:
+    """
+    infers the columns of a table from a sample of json records, the union of
+    their keys in order of appearance, typed by the non null values in the sample
+    :param sample: json objects
+    :return: tuple of the column names and their sqlite types
+    """
+    values: Dict[str, List[Any]] = {}
+    for record in sample:
+        if not isinstance(record, dict):
+            raise ValueError("records must be objects of column names and values")
+        for key, value in record.items():
+            column = values.setdefault(key, [])
+            if value is not None:
+                column.append(value)
+    types = []
+    for column in values.values():
+        if column and all(isinstance(v, int) for v in column):
+            types.append("integer")
+        elif column and all(isinstance(v, (int, float)) for v in column):
+            types.append("real")
+        else:
+            types.append("text")
+    return list(values), types
+
+
+def json_rows(records: Iterable[Dict[str, Any]], columns: List[str]) -> Iterator[Tuple[Any, ...]]:
+    """
+    turns json records into value tuples in column order, missing keys are
+    None, keys not in columns are dropped, nested values are stored as json text
+    :param records: json objects
+    :param columns: column names
+    :return: generator of value tuples
+    """
+    for record in records:
+        if not isinstance(record, dict):
+            raise ValueError("records must be objects of column names and values")
+        yield tuple(
+            json.dumps(v) if isinstance(v := record.get(c), (dict, list)) else v for c in columns
+        )
+
+
+def batch_rows(rows: Iterable[Dict[str, Any]], size: int) -> Iterator[Tuple[Tuple[str, ...], List[Tuple[Any, ...]]]]:
+    """
+    groups consecutive dictionaries with the same keys into
+    batches of value tuples for executemany
+    :param rows: dictionaries of column names and values
+    :param size: maximum number of rows per batch
+    :return: generator of tuples of column names and a batch of value tuples
+    """
+    columns, batch = None, []
+    for row in rows:
+        if not isinstance(row, dict):
+            raise ValueError("records must be objects of column names and values")
+        keys = tuple(row)
+        if keys != columns or len(batch) >= size:
+            if batch:
+                yield columns, batch
+            columns, batch = keys, []
+        batch.append(tuple(row.values()))
+    if batch:
+        yield columns, batch
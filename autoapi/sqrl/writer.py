@@ -0,0 +1,115 @@
+"""
+Oliver 2024
+"""
+
+import queue
+import sqlite3 as sqlite
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, List, Tuple
+
+from .pool import ConnectionPool
+
+_STOP = object()
+
+
+class BatchWriter:
+    def __init__(self, pool: ConnectionPool, window: float = 0.002, max_batch: int = 100):
+        """
+        single writer thread that groups the writes submitted from any thread
+        into one transaction (one commit, one WAL sync) per batch,
+        every write runs in its own savepoint so a failing write is rolled
+        back on its own and every caller still gets its own result
+        :param pool: connection pool whose writer connection is used
+        :param window: seconds to keep collecting writes after the first one of a batch
+        :param max_batch: maximum number of writes per transaction
+        """
+        self.pool = pool
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.writes = 0
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="autoapi-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, statement: str, *params, has_return: bool = False) -> Future:
+        """
+        queues a write statement
+        :param statement: sql statement
+        :param params: (optional) parameter values
+        :param has_return: flag of whether statement returns data
+        :return: future resolving to what SQL.execute would return
+        """
+        future = Future()
+        self._queue.put((statement, params, has_return, future))
+        return future
+
+    def execute(self, statement: str, *params, has_return: bool = False) -> bool | List[Tuple[Any]]:
+        """
+        queues a write statement and waits until its batch committed
+        :param statement: sql statement
+        :param params: (optional) parameter values
+        :param has_return: flag of whether statement returns data
+        :return: boolean whether execution was successful (or the returned rows)
+        """
+        return self.submit(statement, *params, has_return=has_return).result()
+
+    def _collect(self, first) -> List:
+        batch = [first]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                op = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if op is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(op)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = self._collect(first)
+            try:
+                results = self._commit(batch)
+            except Exception as e:  # e.g. PoolTimeout, handed to every caller of the batch
+                for *_, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.writes += len(batch)
+            for (*_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def _commit(self, batch: List) -> List[bool | List[Tuple[Any]]]:
+        results = []
+        with self.pool.writer() as db:
+            cur = db.con.cursor()
+            try:
+                cur.execute("BEGIN TRANSACTION;")
+                for statement, params, has_return, _ in batch:
+                    cur.execute("SAVEPOINT write;")
+                    try:
+                        cur.execute(statement, list(params))
+                        results.append(cur.fetchall() if has_return else True)
+                    except sqlite.Error as e:
+                        cur.execute("ROLLBACK TO write;")
+                        results.append(False)
+                    cur.execute("RELEASE write;")
+                db.con.commit()
+            except sqlite.Error as e:
+                db.con.rollback()
+                results = [False] * len(batch)
+        return results
+
+    def close(self) -> None:
+        """ commits the writes still queued and stops the writer thread """
+        self._queue.put(_STOP)
+        self._thread.join()
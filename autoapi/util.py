@@ -1,4 +1,6 @@
-from typing import Dict, Any, List
+import time
+from typing import Dict, Any, List, Tuple, Iterable, Iterator, Callable
+from urllib.parse import unquote, parse_qsl
 import json
 
 STATUS_MAP = {
@@ -6,14 +8,31 @@ STATUS_MAP = {
     201: "HTTP/1.1 201 CREATED",
     202: "HTTP/1.1 202 ACCEPTED",
     204: "HTTP/1.1 204 NO CONTENT",
+    304: "HTTP/1.1 304 NOT MODIFIED",
     400: "HTTP/1.1 400 BAD REQUEST",
     401: "HTTP/1.1 401 UNAUTHORIZED",
     403: "HTTP/1.1 403 FORBIDDEN",
     404: "HTTP/1.1 404 NOT FOUND",
     405: "HTTP/1.1 405 METHOD NOT ALLOWED",
+    413: "HTTP/1.1 413 PAYLOAD TOO LARGE",
     500: "HTTP/1.1 500 INTERNAL SERVER ERROR",
+    503: "HTTP/1.1 503 SERVICE UNAVAILABLE",
 }
 
+MAX_HEADER_SIZE = 65536
+CHUNKED = -1
+
+
+class HTTPError(Exception):
+    def __init__(self, code: int):
+        """
+        request that cannot be served, answered with the
+        given status code before the connection is closed
+        :param code: response code
+        """
+        super().__init__(STATUS_MAP[code])
+        self.code = code
+
 
 def read_as_text(filename: str) -> str:
     """
@@ -39,10 +58,126 @@ def process_headers(request_lines: List[bytes]) -> Dict:
         res = line.split(":", maxsplit=1)
         if len(res) >= 2:
             key, val = res
-            header_dict[key.strip()] = val.strip()
+            # header names are case insensitive, store them as Content-Type, If-None-Match etc.
+            header_dict[key.strip().title()] = val.strip()
     return header_dict
 
 
+class Request:
+    def __init__(self, method: str, path: str, query: str, version: str, headers: Dict[str, str], body: bytes):
+        """
+        a parsed HTTP request
+        :param method: HTTP method (e.g. GET)
+        :param path: url decoded path without the query string
+        :param query: raw query string (without the ?)
+        :param version: HTTP version (e.g. HTTP/1.1)
+        :param headers: dictionary of headers
+        :param body: request body
+        """
+        self.method = method
+        self.path = path
+        self.query = query
+        self.version = version
+        self.headers = headers
+        self.body = body
+        # perf_counter time the request was read, and its metrics while they are recorded
+        self.received = time.perf_counter()
+        self.timing = None
+
+
+class BodyStream:
+    def __init__(self, chunks: Iterator[bytes]):
+        """
+        request body that is read from the connection while the handler
+        consumes it, for bodies too large to hold in memory at once
+        :param chunks: iterator of the pieces of the body without any framing
+        """
+        self.chunks = chunks
+        self.pending = None
+        self.failed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        if self.pending is not None:
+            chunk, self.pending = self.pending, None
+            return chunk
+        try:
+            return next(self.chunks)
+        except StopIteration:
+            raise
+        except BaseException:
+            self.failed = True
+            raise
+
+    def peek(self) -> bytes:
+        """
+        skips leading whitespace without consuming the rest of the body
+        :return: first other byte of the body, b'' if there is none
+        """
+        for chunk in self:
+            stripped = chunk.lstrip()
+            if stripped:
+                self.pending = stripped
+                return stripped[:1]
+        return b''
+
+    def read(self, max_size: int) -> bytes:
+        """
+        :param max_size: largest body accepted, larger ones raise a 413
+        :return: the rest of the body
+        """
+        parts, size = [], 0
+        for chunk in self:
+            size += len(chunk)
+            if size > max_size:
+                self.failed = True  # the rest is not read, the connection is closed
+                raise HTTPError(413)
+            parts.append(chunk)
+        return b''.join(parts)
+
+    def drain(self) -> bool:
+        """
+        reads and discards whatever the handler left unread so the
+        next request on the connection starts at the right place
+        :return: False if the body could not be read to its end
+        """
+        if self.failed:
+            return False
+        try:
+            for _ in self:
+                pass
+        except Exception:
+            return False
+        return not self.failed
+
+
+def parse_request(request: bytes) -> Request | None:
+    """
+    parses a complete raw HTTP request once into its parts
+    :param request: HTTP request in bytes
+    :return: Request or None if the request line is malformed
+    """
+    head, _, body = request.partition(b"\r\n\r\n")
+    lines = head.split(b"\r\n")
+    parts = lines[0].decode("latin-1").split()
+    if len(parts) != 3:
+        return None
+    method, target, version = parts
+    path, _, query = target.partition('?')
+    return Request(method, unquote(path), query, version, process_headers(lines[1:]), body)
+
+
+def parse_query(query: str) -> Dict[str, str]:
+    """
+    parses a url query string, the last value wins for repeated keys
+    :param query: raw query string (without the ?)
+    :return: dictionary of keys and values
+    """
+    return dict(parse_qsl(query, keep_blank_values=True))
+
+
 def create_http_response(content: Any = '', headers: Dict[str, str] | None = None, code: int = 200) -> bytes:
     """
     prepares an HTTP response to send back to client
@@ -51,12 +186,136 @@ def create_http_response(content: Any = '', headers: Dict[str, str] | None = Non
     :param code: response code
     :return: bytes
     """
-    response = STATUS_MAP[code]
+    response = STATUS_MAP[code] + "\r\n"
     if headers:
         response += '\r\n'.join("{}: {}".format(k, v) for k, v in headers.items())
-    response += f"\r\nContent-Length: {len(content)}\r\n\r\n"
-    response += content
-    return response.encode("utf-8")
+        response += "\r\n"
+    body = content if isinstance(content, bytes) else content.encode("utf-8")
+    if code != 304:  # a 304 has no body, nor the length of the body it stands in for
+        response += f"Content-Length: {len(body)}\r\n"
+    response += "\r\n"
+    return response.encode("utf-8") + body
+
+
+class ClosingIterator:
+    def __init__(self, chunks: Iterator[bytes], on_close: Callable[[], Any]):
+        """
+        iterator that runs a callback exactly once when it is exhausted or
+        closed, even if iteration never started (unlike a generator's finally)
+        :param chunks: iterator to wrap
+        :param on_close: callback releasing whatever the iterator holds
+        """
+        self.chunks = chunks
+        self.on_close = on_close
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        try:
+            return next(self.chunks)
+        except StopIteration:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        on_close, self.on_close = self.on_close, None
+        if on_close is None:
+            return
+        try:
+            close = getattr(self.chunks, "close", None)
+            if close is not None:
+                close()
+        finally:
+            on_close()
+
+    def __del__(self):
+        self.close()
+
+
+def create_chunked_response(chunks: Iterable[bytes], headers: Dict[str, str] | None = None,
+                            code: int = 200) -> Iterator[bytes]:
+    """
+    prepares a streamed HTTP response with Transfer-Encoding: chunked,
+    so the body can be sent while it is still being produced
+    :param chunks: iterable of body pieces
+    :param headers: optional headers for response
+    :param code: response code
+    :return: generator of bytes to send in order
+    """
+    response = STATUS_MAP[code] + "\r\n"
+    if headers:
+        response += ''.join("{}: {}\r\n".format(k, v) for k, v in headers.items())
+    response += "Transfer-Encoding: chunked\r\n\r\n"
+    try:
+        yield response.encode("utf-8")
+        for chunk in chunks:
+            if chunk:
+                yield b"%x\r\n%b\r\n" % (len(chunk), chunk)
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+    yield b"0\r\n\r\n"
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    weak comparison of an If-None-Match header against an entity tag
+    :param if_none_match: value of the If-None-Match header (if any)
+    :param etag: quoted entity tag of the current representation
+    :return: True if the client's copy is current
+    """
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*' or tag.removeprefix('W/') == etag:
+            return True
+    return False
+
+
+def preferred_type(accept: str | None, available: List[str]) -> str:
+    """
+    picks the media type a client prefers by the q values of its Accept
+    header, exact media types outrank type/* and */* ranges
+    :param accept: value of the Accept header (if any)
+    :param available: media types that can be served, the first is the default
+    :return: preferred media type, the default on ties or if none is acceptable
+    """
+    if not accept:
+        return available[0]
+    # media type -> (specificity of the matching range, q)
+    matches: Dict[str, Tuple[int, float]] = {}
+    for media_range in accept.split(','):
+        media, *params = media_range.split(';')
+        media = media.strip().lower()
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    pass
+        for t in available:
+            specificity = 2 if media == t else 1 if media == t.split('/')[0] + '/*' else 0 if media == '*/*' else -1
+            if specificity >= 0 and specificity >= matches.get(t, (-1, 0.0))[0]:
+                matches[t] = (specificity, q)
+    best, best_q = available[0], 0.0
+    for t in available:
+        q = matches.get(t, (0, 0.0))[1]
+        if q > best_q:
+            best, best_q = t, q
+    return best
+
+
+def media_type(content_type: str | None) -> str:
+    """
+    :param content_type: value of a Content-Type header (if any)
+    :return: its media type without parameters (e.g. charset), lowercase
+    """
+    return (content_type or '').split(';')[0].strip().lower()
 
 
 def extract_json(request: bytes) -> Dict[str, Any]:
@@ -69,3 +328,48 @@ def extract_json(request: bytes) -> Dict[str, Any]:
     """
     content = request.rsplit(b"\r\n\r\n").pop().decode()
     return json.loads(content)
+
+
+def body_length(request: Request, max_body_size: int | None) -> int:
+    """
+    size of the body that follows the headers of a request
+    :param request: parsed request headers
+    :param max_body_size: largest body accepted (None for no limit)
+    :return: number of bytes, or CHUNKED for Transfer-Encoding: chunked
+    """
+    if request.headers.get("Transfer-Encoding", "").lower() == "chunked":
+        return CHUNKED
+    length = request.headers.get("Content-Length", "0")
+    if not length.isdigit():
+        raise HTTPError(400)
+    length = int(length)
+    if max_body_size is not None and length > max_body_size:
+        raise HTTPError(413)
+    return length
+
+
+def parse_chunk_size(line: bytes) -> int:
+    """
+    parses the size line of a chunk of a chunked body
+    :param line: size line (hex size, optional extensions, CRLF)
+    :return: size of the chunk
+    """
+    size = line.split(b";", 1)[0].strip()
+    # int() would also take a sign, a 0x prefix and underscores
+    if not size or size.lstrip(b"0123456789abcdefABCDEF"):
+        raise HTTPError(400)
+    return int(size, 16)
+
+
+def wants_keep_alive(request: Request) -> bool:
+    """
+    whether the client expects the connection to stay open,
+    default for HTTP/1.1 unless it sent Connection: close,
+    opt in for HTTP/1.0 with Connection: keep-alive
+    :param request: parsed request
+    :return: True if the connection should be kept open
+    """
+    connection = request.headers.get("Connection", "").lower()
+    if request.version == "HTTP/1.0":
+        return connection == "keep-alive"
+    return connection != "close"
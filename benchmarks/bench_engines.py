@@ -0,0 +1,61 @@
+"""
+compares the threaded and asyncio server engines:
+connections/sec for short requests and the memory
+held by a large number of idle concurrent clients
+
+    python -m benchmarks.bench_engines [--idle 2000] [--requests 5000]
+"""
+
+import argparse
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .common import make_database, free_port, start_server, proc_status, request
+
+
+def connections_per_sec(port: int, total: int, concurrency: int) -> float:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(lambda _: request(port, "/genres/1"), range(total)))
+    return total / (time.perf_counter() - start)
+
+
+def idle_clients(port: int, count: int) -> list:
+    clients = []
+    for _ in range(count):
+        try:
+            clients.append(socket.create_connection(("localhost", port)))
+        except OSError:
+            break
+    time.sleep(1)
+    return clients
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--idle", type=int, default=2000)
+    args = parser.parse_args()
+
+    database = make_database()
+    print(f"{'engine':<8}{'conn/s':>10}{'idle':>8}{'threads':>9}{'rss MB':>9}{'peak MB':>9}")
+    for engine in ("thread", "async"):
+        port = free_port()
+        proc = start_server(database, port, run_kwargs=f"engine={engine!r}")
+        try:
+            rate = connections_per_sec(port, args.requests, args.concurrency)
+            clients = idle_clients(port, args.idle)
+            status = proc_status(proc.pid)
+            for c in clients:
+                c.close()
+        finally:
+            proc.kill()
+            proc.wait()
+        print(f"{engine:<8}{rate:>10.0f}{len(clients):>8}{status.get('Threads', 0):>9}"
+              f"{status.get('VmRSS', 0) / 1024:>9.1f}{status.get('VmHWM', 0) / 1024:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
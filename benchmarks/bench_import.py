@@ -0,0 +1,126 @@
+"""
+rows/sec and peak memory of importing synthetic csv and NDJSON files
+with the streaming importers (csv with and without import pragmas) and
+with the old read-everything, commit-per-row paths
+
+    python -m benchmarks.bench_import [--rows 2000000] [--legacy-rows 200000]
+"""
+
+import argparse
+import csv
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+from .common import ROOT, temp_directory
+
+MODES = ["legacy-csv", "csv", "csv-fast", "legacy-json", "json"]
+
+
+def make_csv(path: str, rows: int) -> str:
+    """
+    writes a csv file of synthetic orders
+    :param path: path of csv file
+    :param rows: number of rows
+    :return: path of csv file
+    """
+    rand = random.Random(0)
+    with open(path, "w", newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["OrderId", "Customer", "Zip Code", "Quantity", "Price", "Note"])
+        for i in range(rows):
+            writer.writerow([
+                i, f"customer {rand.randrange(50_000)}", f"{rand.randrange(100_000):05d}",
+                rand.randrange(1, 20), f"{rand.uniform(1, 500):.2f}", "" if i % 3 else "gift, wrapped",
+            ])
+    return path
+
+
+def make_ndjson(path: str, csv_path: str) -> str:
+    """
+    writes the rows of a csv file as NDJSON records
+    :param path: path of json file
+    :param csv_path: path of csv file
+    :return: path of json file
+    """
+    with open(csv_path, newline='') as source, open(path, "w") as file:
+        for row in csv.DictReader(source):
+            row["OrderId"], row["Quantity"], row["Price"] = int(row["OrderId"]), int(row["Quantity"]), float(row["Price"])
+            file.write(json.dumps(row) + "\n")
+    return path
+
+
+def run(mode: str, path: str) -> dict:
+    """ imports the file into a new database in this process """
+    from autoapi.sqrl import SQL, utils
+
+    db = SQL(os.path.join(os.path.dirname(path), f"{mode}.db"))
+    if mode == "legacy-csv":
+        start = time.perf_counter()
+        headers, rows = utils.read_csv(path)
+        columns = [utils.safe_name(h) for h in headers]
+        db.execute("CREATE TABLE orders ({});".format(
+            ','.join(f"{c} {utils.detect_type_csv(v)}" for c, v in zip(columns, rows[0]))
+        ))
+        db.executemany(f"INSERT INTO orders ({','.join(columns)}) VALUES ({','.join('?' * len(columns))});", rows)
+        seconds = time.perf_counter() - start
+        report = {"rows": len(rows), "seconds": seconds, "rows_per_second": len(rows) / seconds}
+    elif mode == "legacy-json":
+        start = time.perf_counter()
+        with open(path) as file:
+            records = [json.loads(line) for line in file]
+        db.execute("CREATE TABLE orders ({});".format(
+            ','.join(f"{utils.safe_name(k)} {utils.detect_type_json(v)}" for k, v in records[0].items())
+        ))
+        for record in records:
+            db.insert("orders", {utils.safe_name(k): v for k, v in record.items()})
+        seconds = time.perf_counter() - start
+        report = {"rows": len(records), "seconds": seconds, "rows_per_second": len(records) / seconds}
+    elif mode == "json":
+        report = db.import_json(path, "orders", indexes=["Customer"])
+    else:
+        report = db.import_csv(path, "orders", fast=mode == "csv-fast", indexes=["Customer"])
+    report["peak_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--legacy-rows", type=int, default=200_000)
+    parser.add_argument("--run", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run(args.run, args.path)))
+        return
+
+    directory = temp_directory()
+    print(f"{'path':>12}{'rows':>10}{'seconds':>10}{'rows/s':>12}{'peak MB':>10}")
+    for mode in MODES:
+        rows = args.legacy_rows if mode.startswith("legacy") else args.rows
+        csv_path = os.path.join(directory, f"orders-{rows}.csv")
+        if not os.path.exists(csv_path):
+            make_csv(csv_path, rows)
+        path = csv_path
+        if mode.endswith("json"):
+            path = csv_path[:-4] + ".ndjson"
+            if not os.path.exists(path):
+                make_ndjson(path, csv_path)
+        # every import runs in its own process so peak memory is its own
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_import", "--run", mode, "--path", path],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        )
+        report = json.loads(out.stdout)
+        print(f"{mode:>12}{report['rows']:>10}{report['seconds']:>10.2f}"
+              f"{report['rows_per_second']:>12.0f}{report['peak_mb']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+requests/sec of small point lookups with a new connection per
+request, a persistent (keep-alive) connection and pipelining
+
+    python -m benchmarks.bench_keepalive [--requests 5000] [--clients 8]
+"""
+
+import argparse
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .common import make_database, free_port, start_server, request, read_response
+
+REQUEST = b"GET /artists/1 HTTP/1.1\r\nHost: localhost\r\n\r\n"
+
+
+def new_connections(port: int, count: int):
+    for _ in range(count):
+        request(port, "/artists/1")
+
+
+def keep_alive(port: int, count: int):
+    with socket.create_connection(("localhost", port)) as s:
+        buffer = b""
+        for _ in range(count):
+            s.sendall(REQUEST)
+            _, buffer = read_response(s, buffer)
+
+
+def pipelined(port: int, count: int, depth: int = 16):
+    with socket.create_connection(("localhost", port)) as s:
+        buffer = b""
+        for sent in range(0, count, depth):
+            batch = min(depth, count - sent)
+            s.sendall(REQUEST * batch)
+            for _ in range(batch):
+                _, buffer = read_response(s, buffer)
+
+
+def measure(func, port: int, total: int, clients: int) -> float:
+    per_client = total // clients
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        list(pool.map(lambda _: func(port, per_client), range(clients)))
+    return per_client * clients / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--clients", type=int, default=8)
+    args = parser.parse_args()
+
+    database = make_database()
+    print(f"{'engine':<8}{'new conn':>12}{'keep-alive':>12}{'pipelined':>12}  (req/s)")
+    for engine in ("thread", "async"):
+        port = free_port()
+        proc = start_server(database, port, app_kwargs=f"max_requests={args.requests}",
+                            run_kwargs=f"engine={engine!r}")
+        try:
+            rates = [measure(f, port, args.requests, args.clients) for f in (new_connections, keep_alive, pipelined)]
+        finally:
+            proc.kill()
+            proc.wait()
+        print(f"{engine:<8}" + "".join(f"{r:>12.0f}" for r in rates))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+point lookups/sec by primary key with the value interpolated into the
+sql text (a new statement to prepare per key) and bound as a parameter
+(one memoized statement, prepared once)
+
+    python -m benchmarks.bench_lookups [--tracks 100000] [--lookups 50000]
+"""
+
+import argparse
+import random
+import time
+
+from autoapi import App
+from autoapi.sqrl import SQL
+
+from .common import make_database
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tracks", type=int, default=100_000)
+    parser.add_argument("--lookups", type=int, default=50_000)
+    args = parser.parse_args()
+
+    database = make_database(tracks=args.tracks)
+    keys = [random.randrange(1, args.tracks + 1) for _ in range(args.lookups)]
+    db = SQL(database)
+    app = App(database)
+
+    def interpolated(pk):
+        return db.fetch("SELECT * FROM tracks WHERE TrackId = {} LIMIT 1 OFFSET 0;".format(pk))
+
+    def bound(pk):
+        return db.select("tracks", where="TrackId = ?", params=[pk], limit=1)
+
+    def read_one(pk):
+        return app.read_one("tracks", str(pk))
+
+    print(f"{'lookup':>14}{'lookups/s':>12}")
+    for label, lookup in (("interpolated", interpolated), ("bound", bound), ("App.read_one", read_one)):
+        start = time.perf_counter()
+        for pk in keys:
+            lookup(pk)
+        print(f"{label:>14}{len(keys) / (time.perf_counter() - start):>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
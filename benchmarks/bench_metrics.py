@@ -0,0 +1,40 @@
+"""
+requests/sec of point lookups on persistent connections with request
+metrics off and on, the difference is the cost of the instrumentation
+
+    python -m benchmarks.bench_metrics [--requests 20000] [--clients 8]
+"""
+
+import argparse
+
+from .bench_keepalive import keep_alive, measure
+from .common import make_database, free_port, start_server, request
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=8)
+    args = parser.parse_args()
+
+    database = make_database()
+    print(f"{'engine':<8}{'metrics off':>13}{'metrics on':>13}{'overhead':>10}")
+    for engine in ("thread", "async"):
+        rates = []
+        for enabled in (False, True):
+            port = free_port()
+            proc = start_server(database, port, app_kwargs=f"max_requests={args.requests}, collect_metrics={enabled}",
+                                run_kwargs=f"engine={engine!r}")
+            try:
+                rates.append(measure(keep_alive, port, args.requests, args.clients))
+                if enabled:
+                    assert b"autoapi_requests_total" in request(port, "/_metrics")
+            finally:
+                proc.kill()
+                proc.wait()
+        off, on = rates
+        print(f"{engine:<8}{off:>13.0f}{on:>13.0f}{(off - on) / off:>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
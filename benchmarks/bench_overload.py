@@ -0,0 +1,98 @@
+"""
+latency under overload of the thread engine with a small handler pool and
+accept queue (load is shed with 503s) and with a pool and queue so large
+that every connection gets a thread, as with a thread per connection,
+many more clients than the server can serve send requests on new connections
+(waiting as long as a 503 asks before they retry)
+
+    python -m benchmarks.bench_overload [--clients 256] [--seconds 10] [--path "/tracks?limit=200&sort=-Milliseconds"]
+"""
+
+import argparse
+import signal
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
+
+from autoapi.admission import RETRY_AFTER
+
+from .common import make_database, free_port, start_server
+
+PROCESSES = 4
+SETTINGS = {
+    "bounded": "max_workers=8, queue_size=16, backlog=1024",
+    "unbounded": "max_workers=4096, queue_size=4096, backlog=4096",
+}
+
+
+def request(port: int, message: bytes) -> tuple:
+    """
+    :return: status code of the response (0 if the connection failed) and seconds it took
+    """
+    start = time.perf_counter()
+    try:
+        with socket.create_connection(("localhost", port), timeout=30) as s:
+            s.sendall(message)
+            response = b""
+            while True:
+                data = s.recv(65536)
+                if not data:
+                    break
+                response += data
+        code = int(response.split(b" ", 2)[1]) if response else 0
+    except OSError:
+        code = 0
+    return code, time.perf_counter() - start
+
+
+def clients(job: tuple) -> list:
+    port, path, threads, seconds = job
+    message = f"GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n".encode()
+    deadline = time.perf_counter() + seconds
+
+    def loop(_):
+        results = []
+        while time.perf_counter() < deadline:
+            results.append(request(port, message))
+            if results[-1][0] == 503:
+                time.sleep(RETRY_AFTER)  # as the response asks
+        return results
+
+    with ThreadPoolExecutor(threads) as pool:
+        return [r for results in pool.map(loop, range(threads)) for r in results]
+
+
+def percentile(ordered: list, fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=256)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--path", default="/tracks?limit=200&sort=-Milliseconds")
+    args = parser.parse_args()
+
+    database = make_database()
+    print(f"{args.clients} clients for {args.seconds:.0f}s, GET {args.path}")
+    print(f"{'server':<10}{'ok/s':>8}{'503/s':>8}{'failed':>8}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for name, settings in SETTINGS.items():
+        port = free_port()
+        proc = start_server(database, port, run_kwargs=settings)
+        try:
+            with Pool(PROCESSES) as pool:
+                job = (port, args.path, args.clients // PROCESSES, args.seconds)
+                results = [r for part in pool.map(clients, [job] * PROCESSES) for r in part]
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            proc.wait()
+        ok = sorted(seconds for code, seconds in results if code == 200)
+        rejected = sum(1 for code, _ in results if code == 503)
+        failed = sum(1 for code, _ in results if code not in (200, 503))
+        print(f"{name:<10}{len(ok) / args.seconds:>8.0f}{rejected / args.seconds:>8.0f}{failed:>8}"
+              f"{percentile(ok, 0.5) * 1000:>9.1f}{percentile(ok, 0.99) * 1000:>9.1f}{(ok[-1] if ok else 0) * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+effect of the connection performance profiles on a chinook-style workload:
+point lookups and filtered pages (reads), single row inserts with a commit
+each (writes) and one bulk insert, every profile on its own fresh database
+in its own process
+
+    python -m benchmarks.bench_profiles [--tracks 200000] [--reads 20000] [--writes 2000] [--bulk 200000]
+"""
+
+import argparse
+import json
+import random
+import subprocess
+import sys
+import time
+
+from autoapi import App, query
+
+from .common import ROOT, make_database
+
+PROFILES = ("default", "read-heavy", "write-heavy", "bulk-load", "read-only")
+
+
+def run(database: str, profile: str, args: argparse.Namespace) -> dict:
+    app = App(database, profile=None if profile == "default" else profile)
+    keys = [str(random.randrange(1, args.tracks + 1)) for _ in range(args.reads)]
+    specs = [query.parse(f"GenreId=eq:{i % 25 + 1}&sort=-Milliseconds", app.columns["tracks"]) for i in range(100)]
+
+    start = time.perf_counter()
+    for pk in keys:
+        app.read_one("tracks", pk)
+    for spec in specs:
+        app.read_page("tracks", 100, spec=spec)
+    reads = (len(keys) + len(specs)) / (time.perf_counter() - start)
+
+    if profile == "read-only":  # immutable readers would not see the writes
+        return {"reads/s": reads}
+
+    start = time.perf_counter()
+    for i in range(args.writes):
+        app.db.insert("artists", {"Name": f"artist {i}"})
+    writes = args.writes / (time.perf_counter() - start)
+
+    rows = ({"Name": f"bulk {i}", "GenreId": i % 25 + 1, "Milliseconds": i} for i in range(args.bulk))
+    start = time.perf_counter()
+    app.db.insert_many("tracks", rows, batch_size=10000)
+    bulk = args.bulk / (time.perf_counter() - start)
+    return {"reads/s": reads, "writes/s": writes, "bulk rows/s": bulk}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tracks", type=int, default=200_000)
+    parser.add_argument("--reads", type=int, default=20_000)
+    parser.add_argument("--writes", type=int, default=2_000)
+    parser.add_argument("--bulk", type=int, default=200_000)
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run(args.path, args.run, args)))
+        return
+
+    print(f"{'profile':>12}{'reads/s':>12}{'writes/s':>12}{'bulk rows/s':>14}")
+    for profile in PROFILES:
+        database = make_database(tracks=args.tracks)
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_profiles", "--run", profile, "--path", database,
+             "--tracks", str(args.tracks), "--reads", str(args.reads),
+             "--writes", str(args.writes), "--bulk", str(args.bulk)],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        )
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"{profile:>12}{result['reads/s']:>12.0f}{result.get('writes/s', 0):>12.0f}{result.get('bulk rows/s', 0):>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+routing cost per request against the number of tables,
+the old per-request regex scan over every table vs the router
+
+    python -m benchmarks.bench_routing
+"""
+
+import re
+import timeit
+
+from autoapi.router import Router, SINGLE, ALL
+
+
+def regex_patterns(tables):
+    patterns = []
+    for t in tables:
+        patterns.extend([(rf"{re.escape(t)}/(\w+)", SINGLE), (rf"\b({re.escape(t)})\b(?!\w+)", ALL)])
+    return patterns
+
+
+def regex_route(patterns, request_line):
+    for pattern, ptype in patterns:
+        if re.search(pattern, request_line) is not None:
+            return ptype
+    return None
+
+
+def router_for(tables):
+    router = Router()
+    for t in tables:
+        router.add(t, ALL, "GET", len)
+        router.add(t, SINGLE, "GET", len)
+    return router
+
+
+def main():
+    print(f"{'tables':>8}{'regex us':>12}{'router us':>12}")
+    for count in (10, 100, 1000):
+        tables = [f"table_{i}" for i in range(count)]
+        # worst case for the scan: the requested table is registered last
+        target = tables[-1]
+        patterns = regex_patterns(tables)
+        router = router_for(tables)
+        number = max(10, 20_000 // count)
+        regex = timeit.timeit(lambda: regex_route(patterns, f"GET /{target}/42 HTTP/1.1"), number=number)
+        routed = timeit.timeit(lambda: router.resolve("GET", f"/{target}/42"), number=number)
+        print(f"{count:>8}{regex / number * 1e6:>12.2f}{routed / number * 1e6:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
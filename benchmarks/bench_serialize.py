@@ -0,0 +1,75 @@
+"""
+rows/sec of reading and serializing a whole table (App.stream_all)
+on a narrow and a wide table, with the old dict per row encoding
+and the row encoders of both json backends
+
+    python -m benchmarks.bench_serialize [--rows 100000]
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+
+from autoapi import App, serialize
+from .common import temp_directory
+
+
+def make_database(rows: int) -> str:
+    """
+    creates a database with a narrow (3 columns) and a wide (30 columns) table
+    :param rows: number of rows per table
+    :return: path of database file
+    """
+    path = os.path.join(temp_directory(), "serialize.db")
+    con = sqlite3.connect(path)
+    wide = [f"c{i} {('INTEGER', 'TEXT', 'REAL')[i % 3]}" for i in range(29)]
+    con.executescript(f"""
+        CREATE TABLE narrow (id INTEGER PRIMARY KEY, name TEXT, price REAL);
+        CREATE TABLE wide (id INTEGER PRIMARY KEY, {', '.join(wide)});
+    """)
+    con.executemany("INSERT INTO narrow (name, price) VALUES (?, ?);", ((f"item {i}", i * 0.25) for i in range(rows)))
+    con.executemany(
+        f"INSERT INTO wide ({', '.join(f'c{i}' for i in range(29))}) VALUES ({', '.join('?' * 29)});",
+        ((tuple((i, f"text value {i}", i * 0.5)[j % 3] for j in range(29))) for i in range(rows))
+    )
+    con.commit()
+    con.close()
+    return path
+
+
+def legacy_batches(columns, batches):
+    """ the encoding used before the row encoders, one json.dumps per row dict """
+    separator = b'['
+    for rows in batches:
+        yield separator + ", ".join(json.dumps(dict(zip(columns, row))) for row in rows).encode("utf-8")
+        separator = b', '
+    yield b']' if separator == b', ' else b'[]'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+
+    app = App(make_database(args.rows))
+    encoders = [("dict per row", None), ("json", serialize.STDLIB)]
+    if serialize.orjson is not None:
+        encoders.append(("orjson", serialize.ORJSON))
+    print(f"{'table':>8}{'encoder':>14}{'rows/s':>12}{'MB':>8}")
+    for table in ("narrow", "wide"):
+        for label, backend in encoders:
+            if backend is not None:
+                serialize.BACKEND = backend
+            encode = legacy_batches if backend is None else app.encode_batches
+            best = float("inf")
+            for _ in range(3):
+                start = time.perf_counter()
+                size = sum(len(piece) for piece in app.stream_all(table, encode))
+                best = min(best, time.perf_counter() - start)
+            print(f"{table:>8}{label:>14}{args.rows / best:>12.0f}{size / 1e6:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
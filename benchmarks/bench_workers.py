@@ -0,0 +1,66 @@
+"""
+read throughput of pre-forked worker processes (App.run(workers=N)),
+the clients run in their own processes so they are not the bottleneck,
+it scales with the number of cores of the machine, not beyond
+
+    python -m benchmarks.bench_workers [--requests 20000] [--clients 16] [--path "/tracks?limit=100"] [--engine thread]
+"""
+
+import argparse
+import os
+import signal
+import socket
+import time
+from multiprocessing import Pool
+
+from .common import make_database, free_port, start_server, read_response
+
+
+def client(job: tuple) -> int:
+    port, path, count = job
+    message = f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode()
+    with socket.create_connection(("localhost", port)) as s:
+        buffer = b""
+        for _ in range(count):
+            s.sendall(message)
+            _, buffer = read_response(s, buffer)
+    return count
+
+
+def measure(port: int, path: str, total: int, clients: int) -> float:
+    with Pool(clients) as pool:
+        pool.map(client, [(port, path, 10)] * clients)  # warm up every worker
+        start = time.perf_counter()
+        done = sum(pool.map(client, [(port, path, total // clients)] * clients))
+        return done / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--path", default="/tracks?limit=100")
+    parser.add_argument("--engine", default="thread")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    counts = sorted({1, 2, 4, 8, cores} & set(range(1, cores + 1))) if cores > 1 else [1, 2]
+    database = make_database()
+    print(f"{cores} cores, {args.clients} client processes, GET {args.path}")
+    print(f"{'workers':>8}{'req/s':>10}{'speedup':>10}")
+    base = None
+    for workers in counts:
+        port = free_port()
+        proc = start_server(database, port, app_kwargs=f"max_requests={args.requests}",
+                            run_kwargs=f"engine={args.engine!r}, workers={workers}")
+        try:
+            rate = measure(port, args.path, args.requests, args.clients)
+        finally:
+            proc.send_signal(signal.SIGTERM)  # the supervisor stops its workers
+            proc.wait()
+        base = base or rate
+        print(f"{workers:>8}{rate:>10.0f}{rate / base:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
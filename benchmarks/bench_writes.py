@@ -0,0 +1,59 @@
+"""
+writes/sec of concurrent POST requests with a transaction per write
+and with write batching (group commit) at different batch windows
+
+    python -m benchmarks.bench_writes [--writes 4000] [--clients 32]
+"""
+
+import argparse
+import json
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .common import make_database, free_port, start_server, read_response
+
+
+def post_many(port: int, count: int) -> int:
+    body = json.dumps({"Name": "benchmark artist"}).encode()
+    req = (b"POST /artists HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+           b"Content-Length: %d\r\n\r\n%b" % (len(body), body))
+    created = 0
+    with socket.create_connection(("localhost", port)) as s:
+        buffer = b""
+        for _ in range(count):
+            s.sendall(req)
+            response, buffer = read_response(s, buffer)
+            created += response.startswith(b"HTTP/1.1 201")
+    return created
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writes", type=int, default=4000)
+    parser.add_argument("--clients", type=int, default=32)
+    args = parser.parse_args()
+
+    per_client = args.writes // args.clients
+    print(f"{'window ms':>10}{'writes/s':>12}{'created':>10}")
+    for window in (None, 0.0, 0.001, 0.005, 0.02):
+        database = make_database()
+        port = free_port()
+        app_kwargs = f"max_requests={per_client + 1}"
+        if window is not None:
+            app_kwargs += f", write_batch_window={window}, write_batch_size=256"
+        proc = start_server(database, port, app_kwargs=app_kwargs)
+        try:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(args.clients) as pool:
+                created = sum(pool.map(lambda _: post_many(port, per_client), range(args.clients)))
+            elapsed = time.perf_counter() - start
+        finally:
+            proc.kill()
+            proc.wait()
+        label = "off" if window is None else f"{window * 1000:g}"
+        print(f"{label:>10}{created / elapsed:>12.0f}{created:>10}")
+
+
+if __name__ == "__main__":
+    main()
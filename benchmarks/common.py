@@ -0,0 +1,145 @@
+"""
+shared helpers for the benchmark scripts,
+run them from the repository root, e.g.
+
+    python -m benchmarks.bench_engines
+"""
+
+import atexit
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def temp_directory() -> str:
+    """
+    :return: path of a new temporary directory, removed when the benchmark exits
+    """
+    directory = tempfile.TemporaryDirectory(prefix="autoapi-bench-")
+    atexit.register(directory.cleanup)
+    return directory.name
+
+
+def make_database(path: str | None = None, tracks: int = 10_000) -> str:
+    """
+    creates a small chinook-style database to benchmark against
+    :param path: (optional) path of database file, a temporary one if None
+    :param tracks: number of rows in the tracks table
+    :return: path of database file
+    """
+    if path is None:
+        path = os.path.join(temp_directory(), "chinook.db")
+    con = sqlite3.connect(path)
+    con.executescript("""
+        CREATE TABLE genres (GenreId INTEGER PRIMARY KEY AUTOINCREMENT, Name NVARCHAR(120));
+        CREATE TABLE artists (ArtistId INTEGER PRIMARY KEY AUTOINCREMENT, Name NVARCHAR(120));
+        CREATE TABLE tracks (
+            TrackId INTEGER PRIMARY KEY AUTOINCREMENT, Name NVARCHAR(200), GenreId INTEGER,
+            Composer NVARCHAR(220), Milliseconds INTEGER, Bytes INTEGER, UnitPrice NUMERIC(10,2)
+        );
+    """)
+    con.executemany("INSERT INTO genres (Name) VALUES (?);", [(f"genre {i}",) for i in range(25)])
+    con.executemany("INSERT INTO artists (Name) VALUES (?);", [(f"artist {i}",) for i in range(275)])
+    con.executemany(
+        "INSERT INTO tracks (Name, GenreId, Composer, Milliseconds, Bytes, UnitPrice) VALUES (?, ?, ?, ?, ?, ?);",
+        ((f"track {i}", i % 25 + 1, f"composer {i % 97}", 200_000 + i, 6_000_000 + i, 0.99) for i in range(tracks))
+    )
+    con.commit()
+    con.close()
+    return path
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def start_server(database: str, port: int, app_kwargs: str = "", run_kwargs: str = "") -> subprocess.Popen:
+    """
+    starts an App in a child process and waits until it accepts connections
+    :param database: path of database file
+    :param port: port to run server on
+    :param app_kwargs: python source of extra App keyword arguments
+    :param run_kwargs: python source of extra App.run keyword arguments
+    :return: server process
+    """
+    code = (
+        "from autoapi import App; "
+        f"App({database!r}{', ' + app_kwargs if app_kwargs else ''})"
+        f".run(port={port}{', ' + run_kwargs if run_kwargs else ''})"
+    )
+    proc = subprocess.Popen([sys.executable, "-c", code], cwd=ROOT, stdout=subprocess.DEVNULL)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("localhost", port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("server did not start")
+
+
+def proc_status(pid: int) -> dict:
+    """
+    reads memory and thread figures of a process from /proc (linux only)
+    :param pid: process id
+    :return: dict of VmRSS / VmHWM in kB and thread count
+    """
+    out = {}
+    try:
+        with open(f"/proc/{pid}/status") as file:
+            for line in file:
+                key, _, val = line.partition(":")
+                if key in ("VmRSS", "VmHWM", "Threads"):
+                    out[key] = int(val.split()[0])
+    except OSError:
+        pass
+    return out
+
+
+def request(port: int, path: str) -> bytes:
+    """
+    sends one GET request on a new connection and reads until close
+    """
+    with socket.create_connection(("localhost", port)) as s:
+        s.sendall(f"GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n".encode())
+        chunks = []
+        while True:
+            data = s.recv(65536)
+            if not data:
+                break
+            chunks.append(data)
+        return b"".join(chunks)
+
+
+def read_response(sock: socket.socket, buffer: bytes = b"") -> tuple:
+    """
+    reads one Content-Length framed response from a persistent connection
+    :param sock: connected socket
+    :param buffer: bytes already read past the previous response
+    :return: tuple of the response and the bytes read past it
+    """
+    while b"\r\n\r\n" not in buffer:
+        data = sock.recv(65536)
+        if not data:
+            raise ConnectionError("connection closed")
+        buffer += data
+    end = buffer.index(b"\r\n\r\n") + 4
+    length = 0
+    for line in buffer[:end].split(b"\r\n"):
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":")[1])
+    while len(buffer) < end + length:
+        data = sock.recv(65536)
+        if not data:
+            raise ConnectionError("connection closed")
+        buffer += data
+    return buffer[:end + length], buffer[end + length:]
@@ -0,0 +1,49 @@
+"""
+Oliver 2024
+"""
+
+import json
+import os
+import tempfile
+import unittest
+
+from autoapi.sqrl import SQL
+
+
+class TestImport(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db = SQL(os.path.join(self.directory.name, "test.db"))
+        self.db.execute("CREATE TABLE recs (a integer, b text);")
+        self.db.execute("INSERT INTO recs VALUES (1, 'kept');")
+
+    def tearDown(self):
+        self.db.con.close()
+        self.directory.cleanup()
+
+    def write(self, filename: str, content: str) -> str:
+        path = os.path.join(self.directory.name, filename)
+        with open(path, "w") as file:
+            file.write(content)
+        return path
+
+    def test_json_into_existing_table(self):
+        path = self.write("recs.json", json.dumps([{"a": 2, "b": "new"}]))
+        self.assertFalse(self.db.create_table_from_json(path))
+        self.assertTrue(self.db.table_exists("recs"))
+        self.assertEqual(self.db.fetch("SELECT a, b FROM recs;"), [(1, "kept")])
+
+    def test_csv_into_existing_table(self):
+        path = self.write("recs.csv", "a,b\n2,new\n")
+        self.assertFalse(self.db.create_table_from_csv(path))
+        self.assertEqual(self.db.fetch("SELECT a, b FROM recs;"), [(1, "kept")])
+
+    def test_failed_load_drops_its_table(self):
+        path = self.write("fresh.json", '[{"a": 1}, {"a": 2}')
+        self.assertFalse(self.db.create_table_from_json(path, batch_size=1))
+        self.assertFalse(self.db.table_exists("fresh"))
+        self.assertFalse(self.db.con.in_transaction)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+"""
+Oliver 2024
+"""
+
+import unittest
+
+from autoapi.sqrl.utils import iter_json_records
+
+
+def parse(document: str, chunk_size: int) -> list:
+    """
+    :param document: json text
+    :param chunk_size: characters per chunk the document is split into
+    :return: the parsed records
+    """
+    chunks = [document[i:i + chunk_size].encode() for i in range(0, len(document), chunk_size)]
+    return list(iter_json_records(chunks))
+
+
+class TestJsonRecords(unittest.TestCase):
+    def test_array(self):
+        for size in (1, 3, 1024):
+            self.assertEqual(parse('[{"a": 1}, {"a": 2}, 3]', size), [{"a": 1}, {"a": 2}, 3])
+            self.assertEqual(parse(' [ ] ', size), [])
+
+    def test_ndjson(self):
+        for size in (1, 3, 1024):
+            self.assertEqual(parse('{"a": 1}\n{"a": 2}\n3', size), [{"a": 1}, {"a": 2}, 3])
+
+    def test_truncated_array(self):
+        for document in ('[{"a": 1}, {"a": 2}', '[{"a": 1}, {"a": 2},', '[{"a": 1}, {"a":', '['):
+            for size in (1, 3, 1024):
+                with self.assertRaises(ValueError, msg=document):
+                    parse(document, size)
+
+    def test_empty_elements(self):
+        for document in ('[{"a": 1},, {"a": 2}]', '[{"a": 1},]', '[, {"a": 1}]', '[1 2]', '[1] 2'):
+            for size in (1, 3, 1024):
+                with self.assertRaises(ValueError, msg=document):
+                    parse(document, size)
+
+    def test_every_split(self):
+        documents = {
+            '[1e-07, -0.5E+3, 12, true, null]': [1e-07, -500.0, 12, True, None],
+            '[{"a": "x\\"]}\\\\"}, "s\\u00e9", [1, [2]], {}]': [{"a": 'x"]}\\'}, "s\u00e9", [1, [2]], {}],
+            '{"a": 1}{"b": []}\n"q"\n7\n-1.5e3': [{"a": 1}, {"b": []}, "q", 7, -1500.0],
+        }
+        for document, records in documents.items():
+            for size in range(1, len(document) + 1):
+                self.assertEqual(parse(document, size), records, msg=(document, size))
+
+    def test_malformed_records(self):
+        for document in ('[1, tru]', '[{"a": 1]]', '{"a" 1}\n', '[1, 2x]'):
+            for size in (1, 2, 1024):
+                with self.assertRaises(ValueError, msg=document):
+                    parse(document, size)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+"""
+Oliver 2024
+"""
+
+import os
+import tempfile
+import unittest
+
+from autoapi import App, query, util
+
+
+class TestParse(unittest.TestCase):
+    columns = ["GenreId", "Name", 'we"ird']
+
+    def test_filters(self):
+        spec = query.parse("Name=Rock&GenreId=gt:3&GenreId=in:1,2", self.columns)
+        self.assertEqual(spec.where, '"Name" = ? AND "GenreId" > ? AND "GenreId" IN (?, ?)')
+        self.assertEqual(spec.params, ["Rock", "3", "1", "2"])
+        self.assertEqual(spec.filtered, ["Name", "GenreId", "GenreId"])
+
+    def test_fields_and_sort(self):
+        spec = query.parse("fields=Name,GenreId,Name&sort=-Name,+GenreId&limit=5", self.columns)
+        self.assertEqual(spec.fields, ['"Name"', '"GenreId"'])
+        self.assertEqual(spec.order_by, [('"Name"', False), ('"GenreId"', True)])
+        self.assertIsNone(spec.where)
+
+    def test_quoted_column(self):
+        spec = query.parse("we%22ird=null:true", self.columns)
+        self.assertEqual(spec.where, '"we""ird" IS NULL')
+        self.assertEqual(spec.params, [])
+
+    def test_injection_through_column_names(self):
+        for q in ('Name%22%3B%20DROP%20TABLE%20genres%3B%20--=1', 'fields=Name,1%3B%20DROP%20TABLE%20genres',
+                  'sort=Name%20DESC%3B%20DROP%20TABLE%20genres', 'sort=-(SELECT%201)'):
+            with self.assertRaises(query.QueryError, msg=q):
+                query.parse(q, self.columns)
+
+    def test_injection_through_operators(self):
+        # the operand is always bound, an unknown operator makes the whole value an operand
+        spec = query.parse("GenreId=gt:1%20OR%201%3D1&Name=or:1%3D1", self.columns)
+        self.assertEqual(spec.where, '"GenreId" > ? AND "Name" = ?')
+        self.assertEqual(spec.params, ["1 OR 1=1", "or:1=1"])
+
+    def test_invalid_filters(self):
+        for q in ("Name=null:maybe", "GenreId=in:" + ",".join(["1"] * (query.MAX_IN_VALUES + 1)), "fields="):
+            with self.assertRaises(query.QueryError, msg=q[:40]):
+                query.parse(q, self.columns)
+
+
+class TestListRequests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        database = os.path.join(self.directory.name, "test.db")
+        self.app = App(database)
+        self.app.db.execute("CREATE TABLE genres (GenreId integer primary key, Name text);")
+        self.app.db.execute("INSERT INTO genres (Name) VALUES ('Rock'), ('Jazz');")
+        self.app.load_schema(self.app.db.catalog())
+
+    def tearDown(self):
+        self.app.close()
+        self.directory.cleanup()
+
+    def read_all(self, query_string: str) -> tuple:
+        request = util.Request("GET", "/genres", query_string, "HTTP/1.1", {}, b'')
+        code, content, _ = self.app.handle_read_all("genres", request)
+        return code, content if isinstance(content, (str, bytes)) else b''.join(content)
+
+    def test_unknown_columns(self):
+        for q in ("Nope=1", "fields=Nope", "sort=Nope", "Name%22%20OR%201%3D1%20--=1"):
+            code, content = self.read_all(q)
+            self.assertEqual(code, 400, msg=q)
+            self.assertIn("unknown", content)
+
+    def test_filter(self):
+        self.assertEqual(self.read_all("Name=Jazz&fields=GenreId"), (200, b'[{"GenreId":2}]'))
+        self.assertEqual(self.read_all("Name=Jazz%27%20OR%20%271%27%3D%271"), (200, b'[]'))
+
+
+if __name__ == "__main__":
+    unittest.main()
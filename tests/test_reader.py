@@ -0,0 +1,68 @@
+"""
+Oliver 2024
+"""
+
+import socket
+import unittest
+
+from autoapi import util
+from autoapi.reader import SocketReader
+
+HEAD = b"POST /genres HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n"
+
+
+class TestChunkedReader(unittest.TestCase):
+    def setUp(self):
+        self.client, server = socket.socketpair()
+        self.reader = SocketReader(server, buffer_size=64)
+
+    def tearDown(self):
+        self.client.close()
+        self.reader.sock.close()
+
+    def test_chunked(self):
+        self.client.sendall(HEAD + b"5\r\nhello\r\n6;ext=1\r\n world\r\n0\r\n\r\n")
+        self.assertEqual(self.reader.read_request(1024).body, b"hello world")
+
+    def test_trailers_and_pipelining(self):
+        self.client.sendall(HEAD + b"3\r\nabc\r\n0\r\nX-Trailer: 1\r\n\r\nGET /genres HTTP/1.1\r\n\r\n")
+        self.assertEqual(self.reader.read_request(1024).body, b"abc")
+        request = self.reader.read_request(1024)
+        self.assertEqual((request.method, request.path), ("GET", "/genres"))
+
+    def test_chunk_larger_than_buffer(self):
+        body = bytes(range(256)) * 4
+        self.client.sendall(HEAD + b"%x\r\n" % len(body) + body + b"\r\n0\r\n\r\n")
+        self.assertEqual(self.reader.read_request(4096).body, body)
+
+    def test_streamed(self):
+        self.client.sendall(HEAD + b"5\r\nhello\r\n6\r\n world\r\n0\r\n\r\n")
+        request = self.reader.read_request(1024, stream=lambda r: True)
+        self.assertIsInstance(request.body, util.BodyStream)
+        self.assertEqual(b''.join(request.body), b"hello world")
+
+    def test_too_large(self):
+        self.client.sendall(HEAD + b"400\r\n")
+        with self.assertRaises(util.HTTPError) as raised:
+            self.reader.read_request(1000)
+        self.assertEqual(raised.exception.code, 413)
+
+    def test_malformed(self):
+        for framing in (b"-5\r\nhello\r\n0\r\n\r\n", b"0x5\r\nhello\r\n0\r\n\r\n", b"zz\r\n", b"\r\n",
+                        b"5\r\nhello!!0\r\n\r\n"):
+            client, server = socket.socketpair()
+            with client, server:
+                client.sendall(HEAD + framing)
+                with self.assertRaises(util.HTTPError, msg=framing) as raised:
+                    SocketReader(server).read_request(1024)
+                self.assertEqual(raised.exception.code, 400)
+
+    def test_closed_mid_body(self):
+        self.client.sendall(HEAD + b"5\r\nhel")
+        self.client.shutdown(socket.SHUT_WR)
+        with self.assertRaises(ConnectionError):
+            self.reader.read_request(1024)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+"""
+Oliver 2024
+"""
+
+import unittest
+
+from autoapi.router import Router, SINGLE, ALL, split_path
+
+
+def handler(*args):
+    return 200, '', {}
+
+
+class TestRouter(unittest.TestCase):
+    def setUp(self):
+        self.router = Router()
+        self.router.add("genres", ALL, "GET", handler)
+        self.router.add("genres", SINGLE, "GET", handler)
+        self.router.add("genres", SINGLE, "PUT", handler)
+
+    def test_split_path(self):
+        self.assertEqual(split_path("/artists/1/"), ("artists", "1"))
+        self.assertEqual(split_path("/"), ())
+
+    def test_resolve(self):
+        self.assertEqual(self.router.resolve("GET", "/genres"), (200, handler, ()))
+        self.assertEqual(self.router.resolve("GET", "/genres/"), (200, handler, ()))
+        self.assertEqual(self.router.resolve("PUT", "/genres/7"), (200, handler, ("7",)))
+
+    def test_not_found(self):
+        for path in ("/", "", "/tracks", "/tracks/1", "/genres/1/2", "/Genres"):
+            self.assertEqual(self.router.resolve("GET", path), (404, None, ()), msg=path)
+
+    def test_method_not_allowed(self):
+        self.assertEqual(self.router.resolve("POST", "/genres"), (405, None, ()))
+        self.assertEqual(self.router.resolve("DELETE", "/genres/1"), (405, None, ()))
+        self.assertEqual(self.router.resolve("PUT", "/genres"), (405, None, ()))
+
+
+if __name__ == "__main__":
+    unittest.main()
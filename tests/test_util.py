@@ -0,0 +1,40 @@
+"""
+Oliver 2024
+"""
+
+import unittest
+
+from autoapi import util
+
+JSON, CSV, NDJSON = "application/json", "text/csv", "application/x-ndjson"
+AVAILABLE = [JSON, CSV, NDJSON]
+
+
+class TestPreferredType(unittest.TestCase):
+    def test_default(self):
+        for accept in (None, "", "*/*", "image/png", "text/html, application/*"):
+            self.assertEqual(util.preferred_type(accept, AVAILABLE), JSON, msg=accept)
+
+    def test_exact(self):
+        self.assertEqual(util.preferred_type("text/csv", AVAILABLE), CSV)
+        self.assertEqual(util.preferred_type("Application/X-NDJSON", AVAILABLE), NDJSON)
+
+    def test_q_values(self):
+        self.assertEqual(util.preferred_type("application/json;q=0.5, text/csv", AVAILABLE), CSV)
+        self.assertEqual(util.preferred_type("text/csv;q=0.9, application/x-ndjson;q=0.95", AVAILABLE), NDJSON)
+        self.assertEqual(util.preferred_type("text/csv;q=bad", AVAILABLE), CSV)
+
+    def test_specific_range_wins(self):
+        self.assertEqual(util.preferred_type("text/*, text/csv;q=0, application/x-ndjson;q=0.1", AVAILABLE), NDJSON)
+        self.assertEqual(util.preferred_type("*/*;q=0.1, text/*", AVAILABLE), CSV)
+
+
+class TestMediaType(unittest.TestCase):
+    def test_media_type(self):
+        self.assertEqual(util.media_type("application/json; charset=utf-8"), JSON)
+        self.assertEqual(util.media_type(" Application/JSON "), JSON)
+        self.assertEqual(util.media_type(None), "")
+
+
+if __name__ == "__main__":
+    unittest.main()